@@ -0,0 +1,395 @@
+"""
+拼图和图片转PDF两条流水线的性能基准测试
+
+按随机种子生成可复现的合成图片集（JPEG/PNG、RGB/灰度/RGBA/调色板混合，尺寸各异），
+分别测量各阶段的耗时，报告 图片/秒、MP/秒 和峰值内存，结果保存为JSON便于对比。
+
+用法:
+    python benchmark.py [-n 图片数] [--sizes small|mixed|large] [--seed 种子] [-j 线程/进程数]
+                        [--stages probe,decode,...] [--corpus-dir 目录] [-o 结果.json] [--compare 上次结果.json]
+
+阶段:
+    probe      只读取文件头（imageprobe.probe_image）
+    decode     完整解码像素
+    resize     拼图单元格（collage.load_cell）和A4页面（resize_image_for_a4_portrait）的缩放
+    composite  生成拼图（collage.create_puzzle）
+    encode     按导出预设编码拼图（export.export_image）
+    write      生成PDF（convert_images_to_pdf，ReportLab和流式写入两种方式）
+
+每个阶段在单独的子进程中运行，峰值内存互不影响；合成图片集缓存在本地缓存目录，参数相同时直接复用。
+"""
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import platform
+import tempfile
+from multiprocessing import get_context
+from concurrent.futures import ProcessPoolExecutor
+from PIL import Image, ImageFilter
+import PIL
+
+try:
+    import resource
+except ImportError:
+    # Windows没有resource模块，不统计峰值内存
+    resource = None
+
+import collage
+import export
+import pic2pdf_core
+from cachedir import user_cache_dir
+from imageprobe import probe_image, clear_probe_cache
+
+# 生成器版本，生成方式改变时递增，使旧的图片集失效
+CORPUS_VERSION = 1
+
+# 尺寸档位 -> 长边像素范围
+SIZE_PROFILES = {
+    'small': (320, 1600),
+    'mixed': (640, 4000),
+    'large': (2000, 6000),
+}
+
+# 图片类型 -> (扩展名, 格式, 模式, 权重)
+IMAGE_KINDS = {
+    'jpeg_rgb': ('.jpg', 'JPEG', 'RGB', 40),
+    'jpeg_gray': ('.jpg', 'JPEG', 'L', 10),
+    'png_rgb': ('.png', 'PNG', 'RGB', 15),
+    'png_rgba': ('.png', 'PNG', 'RGBA', 15),
+    'png_palette': ('.png', 'PNG', 'P', 10),
+    'gif_palette': ('.gif', 'GIF', 'P', 10),
+}
+
+STAGES = ('probe', 'decode', 'resize', 'composite', 'encode', 'write')
+
+# 拼图单元格尺寸
+CELL_SIZE = (300, 300)
+
+# 每张拼图最多使用的图片数
+PUZZLE_IMAGES = 16
+
+CORPUS_MANIFEST = 'corpus.json'
+
+
+def pick_kind(rng):
+    """按权重随机选择图片类型"""
+    kinds = list(IMAGE_KINDS)
+    return rng.choices(kinds, weights=[IMAGE_KINDS[kind][3] for kind in kinds])[0]
+
+
+def synthesize_image(rng, size, mode):
+    """
+    生成一张内容有起伏的图片：渐变叠加噪声后放大，压缩率接近真实照片而不是纯色
+    """
+    base = (max(8, size[0] // 16), max(8, size[1] // 16))
+    bands = []
+    for _ in range(3):
+        gradient = Image.linear_gradient('L').rotate(rng.uniform(0, 360)).resize(base)
+        noise = Image.effect_noise(base, rng.uniform(20, 80))
+        bands.append(Image.blend(gradient, noise, rng.uniform(0.2, 0.6)))
+    img = Image.merge('RGB', bands).resize(size, Image.Resampling.BICUBIC)
+    img = img.filter(ImageFilter.GaussianBlur(rng.uniform(0, 2)))
+
+    if mode == 'L':
+        return img.convert('L')
+    if mode == 'RGBA':
+        # 透明度为一个径向渐变，边缘透明
+        alpha = Image.radial_gradient('L').resize(size).point(lambda v: 255 - v)
+        img.putalpha(alpha)
+        return img
+    if mode == 'P':
+        return img.quantize(rng.choice((16, 64, 256)))
+    return img
+
+
+def build_corpus(folder, count, sizes='mixed', seed=0):
+    """
+    在folder中生成合成图片集，参数与已有图片集相同时直接复用
+    :return: 图片集信息（字典），其中 files 为 [(文件名, 类型, 宽, 高), ...]
+    """
+    params = {'version': CORPUS_VERSION, 'count': count, 'sizes': sizes, 'seed': seed}
+    manifest_path = os.path.join(folder, CORPUS_MANIFEST)
+    os.makedirs(folder, exist_ok=True)
+
+    old = None
+    if os.path.exists(manifest_path):
+        try:
+            with open(manifest_path, encoding='utf-8') as f:
+                old = json.load(f)
+        except (OSError, ValueError):
+            old = None
+    if old and old.get('params') == params and all(
+            os.path.exists(os.path.join(folder, name)) for name, *_ in old['files']):
+        return old
+
+    # 参数改变时删除上次生成的图片
+    if old:
+        for name, *_ in old.get('files', []):
+            path = os.path.join(folder, name)
+            if os.path.exists(path):
+                os.remove(path)
+
+    rng = random.Random(seed)
+    low, high = SIZE_PROFILES[sizes]
+    files = []
+    for i in range(count):
+        kind = pick_kind(rng)
+        ext, fmt, mode, _ = IMAGE_KINDS[kind]
+        long_side = rng.randint(low, high)
+        short_side = max(1, int(long_side * rng.uniform(0.5, 1.0)))
+        size = (long_side, short_side) if rng.random() < 0.5 else (short_side, long_side)
+
+        name = f"img_{i + 1:05d}{ext}"
+        img = synthesize_image(rng, size, mode)
+        options = {'quality': 90} if fmt == 'JPEG' else {}
+        img.save(os.path.join(folder, name), format=fmt, **options)
+        files.append((name, kind, size[0], size[1]))
+
+    corpus = {'params': params, 'files': files}
+    with open(manifest_path, 'w', encoding='utf-8') as f:
+        json.dump(corpus, f)
+    return corpus
+
+
+def corpus_summary(folder, corpus):
+    """图片集的统计信息，写入结果JSON"""
+    kinds = {}
+    for _, kind, _, _ in corpus['files']:
+        kinds[kind] = kinds.get(kind, 0) + 1
+    return {
+        **corpus['params'],
+        'folder': folder,
+        'megapixels': round(sum(w * h for _, _, w, h in corpus['files']) / 1e6, 3),
+        'file_bytes': sum(os.path.getsize(os.path.join(folder, name)) for name, *_ in corpus['files']),
+        'kinds': kinds,
+    }
+
+
+def peak_rss_mb():
+    """当前进程及已结束子进程中的最大峰值内存（MB），无法统计时返回None"""
+    if resource is None:
+        return None
+    peak = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+               resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    # macOS的单位是字节，Linux是KB
+    divisor = 1024 * 1024 if sys.platform == 'darwin' else 1024
+    return round(peak / divisor, 1)
+
+
+def image_megapixels(paths):
+    return sum(w * h for w, h in (probe_image(path)[:2] for path in paths)) / 1e6
+
+
+def bench_probe(paths, workers, work_dir, preset):
+    clear_probe_cache()
+    start = time.perf_counter()
+    for path in paths:
+        probe_image(path)
+    yield 'imageprobe.probe_image', time.perf_counter() - start, len(paths), None
+
+
+def bench_decode(paths, workers, work_dir, preset):
+    start = time.perf_counter()
+    for path in paths:
+        with Image.open(path) as img:
+            img.load()
+    yield 'Image.load', time.perf_counter() - start, len(paths), None
+
+
+def bench_resize(paths, workers, work_dir, preset):
+    start = time.perf_counter()
+    for path in paths:
+        collage.load_cell(path, CELL_SIZE, 'scale', True)
+    yield 'collage.load_cell', time.perf_counter() - start, len(paths), None
+
+    start = time.perf_counter()
+    for path in paths:
+        with Image.open(path) as img:
+            pic2pdf_core.resize_image_for_a4_portrait(pic2pdf_core.flatten_to_rgb(img))
+    yield 'pic2pdf_core.resize_image_for_a4_portrait', time.perf_counter() - start, len(paths), None
+
+
+def iter_puzzle_groups(paths):
+    for start in range(0, len(paths), PUZZLE_IMAGES):
+        yield paths[start:start + PUZZLE_IMAGES]
+
+
+def bench_composite(paths, workers, work_dir, preset):
+    for resize_mode in collage.RESIZE_MODES:
+        start = time.perf_counter()
+        for group in iter_puzzle_groups(paths):
+            rows, cols = collage.recommend_grid(len(group))
+            collage.create_puzzle(group, rows, cols, 10, resize_mode, workers=workers)
+        yield f'collage.create_puzzle[{resize_mode}]', time.perf_counter() - start, len(paths), None
+
+
+def bench_encode(paths, workers, work_dir, preset):
+    # 编码对象是第一组图片生成的拼图，生成拼图本身不计时
+    group = paths[:PUZZLE_IMAGES]
+    rows, cols = collage.recommend_grid(len(group))
+    puzzle = collage.create_puzzle(group, rows, cols, 10, workers=workers)
+    megapixels = puzzle.width * puzzle.height / 1e6
+
+    for fmt in export.EXPORT_FORMATS:
+        ext = next(ext for ext, name in export.EXTENSION_FORMATS.items() if name == fmt)
+        result = export.export_image(puzzle, os.path.join(work_dir, f'puzzle{ext}'), preset, workers=workers)
+        yield f'export.{fmt}[{preset}]', result.seconds, 1, megapixels
+
+
+def bench_write(paths, workers, work_dir, preset):
+    for streaming in (False, True):
+        name = 'stream' if streaming else 'reportlab'
+        output_path = os.path.join(work_dir, f'{name}.pdf')
+        start = time.perf_counter()
+        pic2pdf_core.convert_images_to_pdf(paths, output_path, workers=workers, streaming=streaming)
+        yield f'pic2pdf_core.convert_images_to_pdf[{name}]', time.perf_counter() - start, len(paths), None
+
+
+BENCHMARKS = {
+    'probe': bench_probe,
+    'decode': bench_decode,
+    'resize': bench_resize,
+    'composite': bench_composite,
+    'encode': bench_encode,
+    'write': bench_write,
+}
+
+
+def run_stage(stage, paths, workers, preset):
+    """
+    在当前进程中运行一个阶段
+    :return: 结果列表，每项为一个字典
+    """
+    megapixels_in = image_megapixels(paths)
+    rss_before = peak_rss_mb()
+    work_dir = tempfile.mkdtemp(prefix=f'bench-{stage}-')
+    results = []
+    try:
+        for name, seconds, images, megapixels in BENCHMARKS[stage](paths, workers, work_dir, preset):
+            if megapixels is None:
+                megapixels = megapixels_in
+            seconds = max(seconds, 1e-9)
+            results.append({
+                'stage': stage,
+                'name': name,
+                'seconds': round(seconds, 4),
+                'images': images,
+                'megapixels': round(megapixels, 3),
+                'images_per_sec': round(images / seconds, 2),
+                'mp_per_sec': round(megapixels / seconds, 2),
+                'rss_before_mb': rss_before,
+                'peak_rss_mb': peak_rss_mb(),
+            })
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return results
+
+
+def run_isolated(func, *args):
+    """
+    在新的子进程中调用func，峰值内存不受前面步骤的影响
+    Linux下子进程会继承父进程当时的峰值内存，所以生成图片集也要在子进程中进行
+    """
+    with ProcessPoolExecutor(max_workers=1, mp_context=get_context('spawn')) as pool:
+        return pool.submit(func, *args).result()
+
+
+def compare_results(current, previous):
+    """
+    与上次结果逐项对比
+    :return: [(阶段, 名称, 本次MP/s, 上次MP/s, 比值), ...]
+    """
+    old = {(item['stage'], item['name']): item for item in previous.get('results', [])}
+    rows = []
+    for item in current['results']:
+        prev = old.get((item['stage'], item['name']))
+        if prev is None or not prev['mp_per_sec']:
+            continue
+        rows.append((item['stage'], item['name'], item['mp_per_sec'], prev['mp_per_sec'],
+                     item['mp_per_sec'] / prev['mp_per_sec']))
+    return rows
+
+
+def format_result(item):
+    rss = '-' if item['peak_rss_mb'] is None else f"{item['peak_rss_mb']:.0f} MB"
+    return (f"{item['stage']:<10} {item['name']:<48} {item['seconds']:>9.3f} s "
+            f"{item['images_per_sec']:>9.1f} 张/s {item['mp_per_sec']:>9.1f} MP/s  峰值内存 {rss}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="拼图和图片转PDF流水线的性能基准测试")
+    parser.add_argument("-n", "--count", type=int, default=100, help="合成图片数量（默认100）")
+    parser.add_argument("--sizes", choices=list(SIZE_PROFILES), default='mixed', help="图片尺寸档位（默认mixed）")
+    parser.add_argument("--seed", type=int, default=0, help="随机种子（默认0）")
+    parser.add_argument("--corpus-dir", help="合成图片集的目录（默认位于本地缓存目录）")
+    parser.add_argument("--stages", default=','.join(STAGES),
+                        help=f"要运行的阶段，逗号分隔（默认全部: {','.join(STAGES)}）")
+    parser.add_argument("--preset", choices=list(export.PRESETS), default=export.DEFAULT_PRESET,
+                        help=f"encode阶段使用的导出预设（默认{export.DEFAULT_PRESET}）")
+    parser.add_argument("-j", "--workers", type=int, default=1,
+                        help="并行处理的线程数/进程数，0表示使用全部CPU核心（默认1）")
+    parser.add_argument("--no-isolate", action="store_true",
+                        help="所有阶段在同一进程中运行（峰值内存会累计）")
+    parser.add_argument("-o", "--output", help="结果JSON文件（默认 benchmark-时间.json）")
+    parser.add_argument("--compare", help="与之前的结果JSON对比")
+    args = parser.parse_args(argv)
+
+    stages = [stage.strip() for stage in args.stages.split(',') if stage.strip()]
+    unknown = [stage for stage in stages if stage not in BENCHMARKS]
+    if unknown:
+        parser.error(f"未知的阶段: {', '.join(unknown)}，可选: {', '.join(STAGES)}")
+
+    folder = args.corpus_dir or os.path.join(user_cache_dir('benchmark'),
+                                             f'{args.sizes}-{args.count}-{args.seed}')
+    start = time.perf_counter()
+    if args.no_isolate:
+        corpus = build_corpus(folder, args.count, args.sizes, args.seed)
+    else:
+        corpus = run_isolated(build_corpus, folder, args.count, args.sizes, args.seed)
+    print(f"图片集: {folder}（{len(corpus['files'])} 张，准备用时 {time.perf_counter() - start:.1f} 秒）")
+    paths = [os.path.join(folder, name) for name, *_ in corpus['files']]
+
+    report = {
+        'meta': {
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'pillow': PIL.__version__,
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'workers': args.workers,
+            'preset': args.preset,
+            'isolated': not args.no_isolate,
+        },
+        'corpus': corpus_summary(folder, corpus),
+        'results': [],
+    }
+
+    for stage in stages:
+        if args.no_isolate:
+            results = run_stage(stage, paths, args.workers, args.preset)
+        else:
+            results = run_isolated(run_stage, stage, paths, args.workers, args.preset)
+        for item in results:
+            print(format_result(item))
+            report['results'].append(item)
+
+    output = args.output or time.strftime('benchmark-%Y%m%d-%H%M%S.json')
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"结果已保存到 {output}")
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            previous = json.load(f)
+        print(f"与 {args.compare} 对比（MP/s，比值大于1表示变快）:")
+        for stage, name, now, before, ratio in compare_results(report, previous):
+            print(f"{stage:<10} {name:<48} {before:>9.1f} -> {now:>9.1f}  x{ratio:.2f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,44 @@
+"""
+两个工具共用的本地缓存目录
+"""
+import os
+
+# 设置该环境变量可以改变缓存位置
+CACHE_DIR_ENV = "PIC_TOOLS_CACHE_DIR"
+
+
+def user_cache_dir(name):
+    """
+    返回缓存子目录路径（不存在时自动创建）
+    Windows下位于 %LOCALAPPDATA%\\pic-tools，其他系统位于 ~/.cache/pic-tools
+    """
+    root = os.environ.get(CACHE_DIR_ENV)
+    if not root:
+        if os.name == "nt":
+            base = os.environ.get("LOCALAPPDATA") or os.path.expanduser("~")
+        else:
+            base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+        root = os.path.join(base, "pic-tools")
+
+    path = os.path.join(root, name)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def evict_oldest(entries, max_bytes):
+    """
+    缓存总大小超过上限时，按修改时间（缓存命中时会更新）从旧到新删除文件，直到降到上限的90%
+    :param entries: [(修改时间, 文件大小, 路径), ...]
+    """
+    total = sum(size for _, size, _ in entries)
+    if total <= max_bytes:
+        return
+    target = max_bytes * 9 // 10
+    for _, size, path in sorted(entries):
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        total -= size
+        if total <= target:
+            break
@@ -0,0 +1,790 @@
+"""
+拼图生成的核心逻辑，不依赖tkinter，可作为库或命令行使用
+
+用法:
+    python collage.py compose -r 行数 -c 列数 [-b 白边] [--mode scale|crop] [--stretch] [-j 线程数] -o 输出文件 图片...
+    python collage.py batch 任务清单.json
+
+两个子命令都可以加 --trace 文件，输出各阶段的耗时汇总并写出Chrome trace。
+
+任务清单为JSON数组（或每行一个JSON对象的 .jsonl 文件），每个任务的字段:
+    images             图片路径列表，相对路径以清单所在目录为基准
+    output             输出文件
+    rows, cols         行列数，省略时按图片数量推荐
+    border             白边宽度，默认0
+    mode               调整模式 "scale" 或 "crop"，默认 "scale"
+    keep_aspect_ratio  缩放模式下是否保持纵横比，默认 true
+    sort               是否按文件名自然排序，默认 false
+    preset             导出预设 "fast"、"balanced" 或 "small"，默认 "balanced"
+    tiled              是否逐条带生成并直接写入文件（只支持PNG和TIFF），省略时拼图超过
+                       TILED_MIN_PIXELS 且格式支持就自动启用
+
+逐条带生成时完整的拼图不会出现在内存中，峰值内存约为一行单元格加一个条带，
+可以生成数十亿像素的拼图；TIFF输出为分块的金字塔TIFF，超过4 GB时为BigTIFF。
+"""
+import os
+import sys
+import json
+import math
+import time
+import argparse
+import itertools
+import functools
+import threading
+from collections import OrderedDict, deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image
+from imageprobe import probe_image
+from thumbnails import load_thumbnail, THUMBNAIL_SIZES
+from export import (PRESETS, DEFAULT_PRESET, BAND_FORMATS, ExportResult, export_image, describe_export,
+                    format_for_path, open_band_writer)
+from tracing import NULL_TRACER, Tracer, image_path, trace_decode
+from scanner import SUPPORTED_FORMATS, natural_sort_key
+from rawimage import can_map, resize_mapped
+
+
+RESIZE_MODES = ("scale", "crop")
+
+# 解码时缩小到不小于单元格尺寸的倍数，之后再用LANCZOS精确缩放
+DRAFT_GAP = 2
+
+# 单元格缓存的默认内存上限（字节）
+DEFAULT_TILE_CACHE_BYTES = 512 * 1024 * 1024
+
+# 拼图像素数不小于该值且输出格式支持时，自动逐条带生成并写入（约600 MB的RGB画布）
+TILED_MIN_PIXELS = 200 * 1000 * 1000
+
+# 预览的最大尺寸
+PREVIEW_SIZE = (700, 500)
+# 预览时可以代替原图的缩略图尺寸
+PROXY_SIZE = max(THUMBNAIL_SIZES)
+
+# cell_width/cell_height: 单元格尺寸
+# border: 白边宽度
+# image_paths: 按单元格顺序排列、参与拼图的图片
+PuzzleLayout = namedtuple('PuzzleLayout', ['cell_width', 'cell_height', 'border', 'rows', 'cols', 'image_paths'])
+
+
+def report_error(img_path, error):
+    """默认的单张图片错误处理：输出到控制台"""
+    print(f"处理图片 {img_path} 时出错: {error}")
+
+
+def get_image_files(file_paths):
+    """获取并排序图片文件"""
+    files = [f for f in file_paths if f.lower().endswith(SUPPORTED_FORMATS)]
+    files.sort(key=natural_sort_key)
+    return files
+
+
+def recommend_grid(count):
+    """推荐最接近正方形的行列数"""
+    rows = int(math.ceil(math.sqrt(count)))
+    cols = int(math.ceil(count / rows))
+    return rows, cols
+
+
+def fit_size(size, target_size):
+    """
+    按 Image.thumbnail 的规则计算保持纵横比缩小后的尺寸
+    图片本身不超过目标尺寸时原样返回
+    """
+    width, height = size
+    x, y = target_size
+    if x >= width and y >= height:
+        return size
+
+    def round_aspect(number, key):
+        return max(min(math.floor(number), math.ceil(number), key=key), 1)
+
+    aspect = width / height
+    if x / y >= aspect:
+        x = round_aspect(y * aspect, key=lambda n: abs(aspect - n / y))
+    else:
+        y = round_aspect(x / aspect, key=lambda n: 0 if n == 0 else abs(aspect - x / n))
+    return x, y
+
+
+def draft_region(img, region, out_size):
+    """
+    请求解码器直接输出缩小的图片（JPEG DCT缩放），
+    缩小后 region 区域仍不小于输出尺寸的 DRAFT_GAP 倍
+    图片已解码或格式不支持时不做任何事
+    :param region: 原图中要使用的区域 (left, top, right, bottom)
+    :return: 该区域在解码后图片中的坐标
+    """
+    width, height = img.size
+    left, top, right, bottom = region
+    request = (math.ceil(width * out_size[0] * DRAFT_GAP / (right - left)),
+               math.ceil(height * out_size[1] * DRAFT_GAP / (bottom - top)))
+    result = img.draft(img.mode, request)
+    if not result:
+        return region
+
+    scale = width / result[1][2]
+    return tuple(v / scale for v in region)
+
+
+def resize_image(img, target_size, resize_mode="scale", keep_aspect_ratio=True, tracer=NULL_TRACER):
+    """
+    调整单张图片尺寸
+    传入尚未解码的图片（刚 Image.open 的）时，JPEG直接以缩小的尺寸解码，
+    未压缩的大BMP/TIFF按条带映射读取（见 rawimage），
+    其他格式先用 Image.reduce 粗缩小，裁剪区域通过 resize 的 box 参数指定，不复制原图
+    :param img: PIL Image对象，未解码时会在此处按缩小的尺寸解码
+    :param target_size: 目标尺寸 (width, height)
+    :param resize_mode: 调整模式 ("scale", "crop")
+    :param keep_aspect_ratio: 是否保持纵横比
+    :param tracer: tracing.Tracer，分别记录解码和缩放
+    :return: 调整后的图片（新的Image对象）
+    """
+    width, height = img.size
+    region = (0, 0, width, height)
+
+    if resize_mode == "crop":
+        # 裁剪模式：居中裁剪并缩放到目标尺寸，忽略keep_aspect_ratio设置
+        out_size = target_size
+        img_ratio = width / height
+        target_ratio = target_size[0] / target_size[1]
+
+        if img_ratio > target_ratio:
+            # 图片更宽，裁剪左右
+            new_width = int(height * target_ratio)
+            left = (width - new_width) // 2
+            region = (left, 0, left + new_width, height)
+        else:
+            # 图片更高，裁剪上下
+            new_height = int(width / target_ratio)
+            top = (height - new_height) // 2
+            region = (0, top, width, top + new_height)
+    elif keep_aspect_ratio:
+        # 缩放模式（未知模式同样处理）：保持纵横比缩小，不放大
+        out_size = fit_size(img.size, target_size)
+        if out_size == img.size:
+            trace_decode(tracer, img)
+            return img.copy()
+    else:
+        # 拉伸填充整个目标区域
+        out_size = target_size
+
+    if can_map(img):
+        # 原图不完整读入内存，逐个条带读取并缩放
+        with tracer.stage('resize', image_path(img), pixels=out_size[0] * out_size[1], mapped=1):
+            return resize_mapped(img, out_size, region, Image.Resampling.LANCZOS)
+
+    box = draft_region(img, region, out_size)
+    trace_decode(tracer, img)
+    with tracer.stage('resize', image_path(img), pixels=out_size[0] * out_size[1]):
+        return img.resize(out_size, Image.Resampling.LANCZOS, box=box, reducing_gap=DRAFT_GAP)
+
+
+def prepare_cell(img, target_size, resize_mode="scale", keep_aspect_ratio=True, tracer=NULL_TRACER):
+    """
+    按调整模式处理单元格中的图片
+    :return: (调整后的图片, 图片在单元格内的偏移)，单元格其余部分为白色
+    """
+    if resize_mode != "crop":
+        # 未知模式按缩放处理
+        resize_mode = "scale"
+
+    resized_img = resize_image(img, target_size, resize_mode, keep_aspect_ratio, tracer)
+
+    if resize_mode == "scale" and keep_aspect_ratio:
+        # 保持纵横比：居中放置
+        offset = ((target_size[0] - resized_img.size[0]) // 2,
+                  (target_size[1] - resized_img.size[1]) // 2)
+    else:
+        # 拉伸填充或裁剪：图片正好填满单元格
+        offset = (0, 0)
+    return resized_img, offset
+
+
+def resize_images(image_paths, target_size, resize_mode="scale", keep_aspect_ratio=True,
+                  on_error=report_error):
+    """将所有图片调整为指定尺寸"""
+    resized_images = []
+    for img_path in image_paths:
+        new_img = Image.new('RGB', target_size, (255, 255, 255))
+        try:
+            with Image.open(img_path) as img:
+                resized_img, offset = prepare_cell(img, target_size, resize_mode, keep_aspect_ratio)
+                new_img.paste(resized_img, offset)
+        except Exception as e:
+            # 出错时添加空白图片
+            if on_error:
+                on_error(img_path, e)
+        resized_images.append(new_img)
+    return resized_images
+
+
+def resolve_workers(workers):
+    """将workers参数转换为实际线程数，0或None表示使用全部CPU核心"""
+    if not workers or workers < 0:
+        return os.cpu_count() or 1
+    return workers
+
+
+def load_cell(img_path, target_size, resize_mode="scale", keep_aspect_ratio=True, tracer=NULL_TRACER):
+    """打开一张图片并处理为单元格内容，返回 (调整后的图片, 偏移)"""
+    with Image.open(img_path) as img:
+        return prepare_cell(img, target_size, resize_mode, keep_aspect_ratio, tracer)
+
+
+def load_proxy_cell(img_path, target_size, resize_mode="scale", keep_aspect_ratio=True, scale=1,
+                    tracer=NULL_TRACER):
+    """
+    预览用的单元格：缩略图缓存中的图片分辨率足够时直接用它作为源图，
+    否则解码原图（JPEG按缩小的尺寸解码）
+    :param target_size: 缩小后的单元格尺寸
+    :param scale: 预览相对完整拼图的缩放比例，保持纵横比缩放时图片按该比例缩小，与完整拼图一致
+    """
+    info = probe_image(img_path)
+    if resize_mode != "crop" and keep_aspect_ratio:
+        # 完整拼图中图片不会被放大，预览中按相同比例缩小
+        scaled = (max(1, round(info.width * scale)), max(1, round(info.height * scale)))
+        out_size = fit_size(scaled, target_size)
+        ratio = out_size[0] / info.width
+    else:
+        out_size = None
+        ratio = max(target_size[0] / info.width, target_size[1] / info.height)
+
+    proxy = None
+    # 缩略图的长边为 PROXY_SIZE（原图更小时与原图相同）
+    if max(info.width, info.height) * ratio <= PROXY_SIZE:
+        try:
+            proxy = load_thumbnail(img_path, PROXY_SIZE)
+        except Exception:
+            proxy = None
+
+    with proxy or Image.open(img_path) as img:
+        if out_size is None:
+            return prepare_cell(img, target_size, resize_mode, keep_aspect_ratio, tracer)
+        resized_img = resize_image(img, out_size, "scale", False, tracer)
+    offset = ((target_size[0] - out_size[0]) // 2, (target_size[1] - out_size[1]) // 2)
+    return resized_img, offset
+
+
+class TileCache:
+    """
+    调整后单元格的内存缓存，键为 (路径, 修改时间, 文件大小, 单元格尺寸, 调整模式, 是否保持纵横比)，
+    原图被修改后自动失效，旧的单元格随LRU淘汰
+    总内存超过上限时按最近使用时间淘汰（LRU），可在多个线程中同时使用
+    """
+
+    def __init__(self, max_bytes=DEFAULT_TILE_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.tiles = OrderedDict()  # 键 -> ((调整后的图片, 偏移), 字节数)
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def load(self, img_path, target_size, resize_mode="scale", keep_aspect_ratio=True, tracer=NULL_TRACER):
+        """与 load_cell 相同，优先从缓存中取"""
+        stat = os.stat(img_path)
+        key = (os.path.abspath(img_path), stat.st_mtime_ns, stat.st_size, tuple(target_size), resize_mode,
+               keep_aspect_ratio)
+        with self.lock:
+            entry = self.tiles.get(key)
+            if entry is not None:
+                self.tiles.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+
+        cell = load_cell(img_path, target_size, resize_mode, keep_aspect_ratio, tracer)
+        resized_img = cell[0]
+        size = resized_img.width * resized_img.height * len(resized_img.getbands())
+        if size > self.max_bytes:
+            # 超过整个缓存上限的单元格不缓存
+            return cell
+
+        with self.lock:
+            if key not in self.tiles:
+                self.tiles[key] = (cell, size)
+                self.total_bytes += size
+            while self.total_bytes > self.max_bytes:
+                _, (_, evicted) = self.tiles.popitem(last=False)
+                self.total_bytes -= evicted
+        return cell
+
+    def clear(self):
+        with self.lock:
+            self.tiles.clear()
+            self.total_bytes = 0
+
+
+def iter_cells(image_paths, target_size, resize_mode="scale", keep_aspect_ratio=True, workers=1, load=load_cell,
+               tracer=NULL_TRACER):
+    """
+    按原顺序逐个产出单元格处理结果
+    workers大于1时使用线程池并行解码和缩放（Pillow在解码和缩放时释放GIL），
+    同时在途的任务数有上限，内存占用不随图片数量增长
+    :param load: 处理单张图片的函数，签名与 load_cell 相同
+    :param tracer: tracing.Tracer，传给load
+    :return: 生成器，产出 (路径, (图片, 偏移)或None, 异常或None)
+    """
+    workers = resolve_workers(workers)
+    if workers == 1 or len(image_paths) < 2:
+        for img_path in image_paths:
+            try:
+                yield img_path, load(img_path, target_size, resize_mode, keep_aspect_ratio, tracer=tracer), None
+            except Exception as e:
+                yield img_path, None, e
+        return
+
+    workers = min(workers, len(image_paths))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        remaining = iter(image_paths)
+        pending = deque()
+        for img_path in itertools.islice(remaining, workers * 2):
+            pending.append((img_path, pool.submit(load, img_path, target_size, resize_mode, keep_aspect_ratio,
+                                                  tracer=tracer)))
+
+        try:
+            while pending:
+                img_path, future = pending.popleft()
+                # 取走一个结果就补充一个任务，保持线程池满载
+                next_path = next(remaining, None)
+                if next_path is not None:
+                    pending.append((next_path, pool.submit(load, next_path, target_size, resize_mode,
+                                                           keep_aspect_ratio, tracer=tracer)))
+                try:
+                    yield img_path, future.result(), None
+                except Exception as e:
+                    yield img_path, None, e
+        finally:
+            # 调用方提前结束时，丢弃还没开始执行的任务
+            for _, future in pending:
+                future.cancel()
+
+
+def compute_layout(image_paths, rows, cols, white_border=0, on_error=report_error, tracer=NULL_TRACER):
+    """
+    计算拼图布局：单元格尺寸为所有图片中最大的宽和高
+    只读取文件头，不解码像素（结果按文件缓存），无法读取的图片会被跳过
+    """
+    # 获取最大图片尺寸
+    max_width = 0
+    max_height = 0
+
+    valid_images = []
+    with tracer.stage('layout', images=len(image_paths)):
+        for path in image_paths:
+            try:
+                info = probe_image(path)
+                max_width = max(max_width, info.width)
+                max_height = max(max_height, info.height)
+                valid_images.append(path)
+            except Exception as e:
+                tracer.error(path, e)
+                if on_error:
+                    on_error(path, e)
+
+    return PuzzleLayout(max_width, max_height, white_border, rows, cols, valid_images[:rows * cols])
+
+
+def layout_size(layout):
+    """拼图的总尺寸"""
+    width = layout.cols * layout.cell_width + (layout.cols + 1) * layout.border
+    height = layout.rows * layout.cell_height + (layout.rows + 1) * layout.border
+    return width, height
+
+
+def cell_origin(layout, index):
+    """第 index 个单元格左上角的坐标"""
+    i, j = divmod(index, layout.cols)
+    x = j * layout.cell_width + (j + 1) * layout.border
+    y = i * layout.cell_height + (i + 1) * layout.border
+    return x, y
+
+
+def preview_scale(layout, max_size):
+    """使拼图总尺寸不超过 max_size 的缩放比例"""
+    width, height = layout_size(layout)
+    if not width or not height:
+        return 1
+    return min(max_size[0] / width, max_size[1] / height, 1)
+
+
+def scale_layout(layout, scale):
+    """按比例缩小布局，尺寸向下取整，缩小后的总尺寸不会超过原定的上限"""
+    return layout._replace(
+        cell_width=max(1, int(layout.cell_width * scale)),
+        cell_height=max(1, int(layout.cell_height * scale)),
+        border=int(layout.border * scale),
+    )
+
+
+def render_layout(layout, resize_mode="scale", keep_aspect_ratio=True, on_error=report_error, workers=1,
+                  load=load_cell, tracer=NULL_TRACER):
+    """按布局生成拼图，图片数量不足时剩余单元格保持白色"""
+    # 一次性创建最终的拼图
+    final_image = Image.new('RGB', layout_size(layout), (255, 255, 255))
+    target_size = (layout.cell_width, layout.cell_height)
+
+    # 解码和调整可以并行，按单元格顺序贴入画布
+    cells = iter_cells(layout.image_paths, target_size, resize_mode, keep_aspect_ratio, workers, load, tracer)
+    for idx, (img_path, cell, error) in enumerate(cells):
+        if error is not None:
+            # 出错时保留空白单元格
+            tracer.error(img_path, error)
+            if on_error:
+                on_error(img_path, error)
+            continue
+        x, y = cell_origin(layout, idx)
+        resized_img, offset = cell
+        with tracer.stage('composite', img_path, pixels=resized_img.width * resized_img.height):
+            final_image.paste(resized_img, (x + offset[0], y + offset[1]))
+
+    return final_image
+
+
+def iter_puzzle_bands(layout, band_height, resize_mode="scale", keep_aspect_ratio=True, on_error=report_error,
+                      workers=1, load=load_cell, tracer=NULL_TRACER):
+    """
+    按布局从上到下逐条生成拼图的条带，结果与 render_layout 的对应区域相同
+    单元格按原顺序解码和调整，只保留与当前条带相交的单元格行，条带下移后就丢弃上方的行
+    :param band_height: 条带行数，最后一个条带可能更矮
+    :return: 生成器，产出宽度为拼图宽度的RGB条带
+    """
+    width, height = layout_size(layout)
+    target_size = (layout.cell_width, layout.cell_height)
+    cells = enumerate(iter_cells(layout.image_paths, target_size, resize_mode, keep_aspect_ratio, workers, load,
+                                 tracer))
+    cell_rows = -(-len(layout.image_paths) // layout.cols)
+    loaded = {}  # 单元格行号 -> [(调整后的图片, 在拼图中的坐标), ...]
+    next_row = 0
+
+    for top in range(0, height, band_height):
+        bottom = min(height, top + band_height)
+        # 读入与条带相交的单元格行
+        while next_row < cell_rows and cell_origin(layout, next_row * layout.cols)[1] < bottom:
+            row = loaded[next_row] = []
+            for idx, (img_path, cell, error) in itertools.islice(cells, layout.cols):
+                if error is not None:
+                    # 出错时保留空白单元格
+                    tracer.error(img_path, error)
+                    if on_error:
+                        on_error(img_path, error)
+                    continue
+                x, y = cell_origin(layout, idx)
+                resized_img, offset = cell
+                row.append((resized_img, (x + offset[0], y + offset[1])))
+            next_row += 1
+        # 丢弃已经完全在条带上方的单元格行
+        for row_index in [i for i in loaded if cell_origin(layout, i * layout.cols)[1] + layout.cell_height <= top]:
+            del loaded[row_index]
+
+        band = Image.new('RGB', (width, bottom - top), (255, 255, 255))
+        with tracer.stage('composite', pixels=band.width * band.height):
+            for row in loaded.values():
+                for resized_img, (x, y) in row:
+                    if y < bottom and y + resized_img.height > top:
+                        band.paste(resized_img, (x, y - top))
+        yield band
+
+
+def save_layout_banded(layout, output, resize_mode="scale", keep_aspect_ratio=True, preset=DEFAULT_PRESET,
+                       on_error=report_error, workers=1, load=load_cell, tracer=NULL_TRACER):
+    """
+    按布局逐条带生成拼图并直接写入文件（PNG或TIFF），出错时删除未完成的文件
+    :return: export.ExportResult
+    """
+    size = layout_size(layout)
+    start = time.perf_counter()
+    writer, band_height = open_band_writer(output, size, 'RGB', preset, workers=workers)
+    try:
+        for band in iter_puzzle_bands(layout, band_height, resize_mode, keep_aspect_ratio, on_error, workers,
+                                      load, tracer):
+            with tracer.stage('encode', output, pixels=band.width * band.height):
+                writer.write_band(band)
+    except BaseException:
+        writer.abort()
+        raise
+    with tracer.stage('encode', output) as span:
+        # 写入剩余的数据（TIFF的最后一行块和金字塔、IFD）
+        writer.close()
+        file_bytes = os.path.getsize(output)
+        span.add(bytes_written=file_bytes)
+    return ExportResult(output, format_for_path(output), preset, size[0], size[1], file_bytes,
+                        time.perf_counter() - start)
+
+
+def save_puzzle_banded(image_paths, rows, cols, output, white_border=0, resize_mode="scale", keep_aspect_ratio=True,
+                       preset=DEFAULT_PRESET, on_error=report_error, workers=1, cache=None, tracer=NULL_TRACER):
+    """
+    创建拼图并逐条带写入文件，完整的拼图不会出现在内存中，参数与 create_puzzle 相同
+    :param output: 输出文件，只支持PNG和TIFF（见 export.BAND_FORMATS）
+    :param preset: 导出预设
+    :return: export.ExportResult
+    """
+    layout = compute_layout(image_paths, rows, cols, white_border, on_error, tracer)
+    load = cache.load if cache is not None else load_cell
+    return save_layout_banded(layout, output, resize_mode, keep_aspect_ratio, preset, on_error, workers, load,
+                              tracer)
+
+
+def create_puzzle(image_paths, rows, cols, white_border=0, resize_mode="scale", keep_aspect_ratio=True,
+                  on_error=report_error, workers=1, cache=None, tracer=NULL_TRACER):
+    """
+    创建拼图
+    :param image_paths: 按单元格顺序排列的图片路径，无法读取的图片会被跳过
+    :param rows: 行数
+    :param cols: 列数
+    :param white_border: 白边宽度
+    :param resize_mode: 调整模式 ("scale", "crop")
+    :param keep_aspect_ratio: 缩放模式下是否保持纵横比
+    :param on_error: 单张图片出错时调用 on_error(图片路径, 异常)
+    :param workers: 并行处理单元格的线程数，0表示使用全部CPU核心，结果与串行处理完全相同
+    :param cache: TileCache，多次生成拼图时共用，相同的单元格只解码一次
+    :param tracer: tracing.Tracer，记录每张图片的解码、缩放和贴入
+    :return: 拼图 (PIL Image)
+    """
+    layout = compute_layout(image_paths, rows, cols, white_border, on_error, tracer)
+    load = cache.load if cache is not None else load_cell
+    return render_layout(layout, resize_mode, keep_aspect_ratio, on_error, workers, load, tracer)
+
+
+def create_puzzles(specs, on_error=report_error, workers=1, cache=None, tracer=NULL_TRACER):
+    """
+    用同一组图片批量生成多张拼图（不同的行列数、白边、顺序等），所有拼图共用一个单元格缓存
+    :param specs: 每项为字典，字段与 create_puzzle 的参数同名
+                  (image_paths, rows, cols, white_border, resize_mode, keep_aspect_ratio)
+    :param cache: TileCache，默认新建一个
+    :return: 生成器，按顺序逐张产出拼图，同一时间只保留一张完整的拼图
+    """
+    cache = cache if cache is not None else TileCache()
+    for spec in specs:
+        yield create_puzzle(on_error=on_error, workers=workers, cache=cache, tracer=tracer, **spec)
+
+
+def create_preview(image_paths, rows, cols, white_border=0, resize_mode="scale", keep_aspect_ratio=True,
+                   max_size=PREVIEW_SIZE, on_error=report_error, workers=1, tracer=NULL_TRACER):
+    """
+    直接以屏幕分辨率生成拼图预览，不创建完整尺寸的画布
+    单元格优先使用缩略图缓存作为源图，布局与 create_puzzle 相同，只是按比例缩小到 max_size 以内
+    """
+    layout = compute_layout(image_paths, rows, cols, white_border, on_error, tracer)
+    scale = preview_scale(layout, max_size)
+    load = functools.partial(load_proxy_cell, scale=scale)
+    return render_layout(scale_layout(layout, scale), resize_mode, keep_aspect_ratio, on_error, workers, load,
+                         tracer)
+
+
+def source_version(img_path):
+    """图片文件的版本 (路径, 修改时间, 文件大小)，文件无法访问时后两项为None"""
+    try:
+        stat = os.stat(img_path)
+    except OSError:
+        return img_path, None, None
+    return img_path, stat.st_mtime_ns, stat.st_size
+
+
+class IncrementalCollage:
+    """
+    可增量更新的拼图
+    保留拼好的画布，调整后的单元格存放在 TileCache 中，
+    再次生成时只重新贴入内容发生变化的单元格（图片不同，或原图的修改时间、大小变了），
+    交换两张图片只需重贴两个单元格。单元格尺寸、白边、行列数或调整模式变化时整张重建。
+    完整尺寸的画布和缓存占用大量内存，不再需要时调用 release 释放。
+    """
+
+    def __init__(self, workers=1, on_error=report_error, cache=None, tracer=NULL_TRACER):
+        self.workers = workers
+        self.on_error = on_error
+        self.tracer = tracer
+        self.lock = threading.Lock()
+        self.tiles = cache if cache is not None else TileCache()
+        self.render_key = None  # 布局（不含图片顺序）和调整模式，变化时整张重建
+        self.layout = None
+        self.image = None
+        self.painted = []  # 每个单元格当前贴入的 (路径, 修改时间, 文件大小)，空白为None
+
+    def render(self, image_paths, rows, cols, white_border=0, resize_mode="scale", keep_aspect_ratio=True):
+        """
+        生成拼图，参数与 create_puzzle 相同
+        返回的是内部画布本身（不复制，避免完整尺寸的拼图占用两份内存），下次调用 render 或 release
+        时会被原地修改或丢弃；调用方只能在此之前使用，需要保留时请自行复制
+        """
+        with self.lock:
+            layout = compute_layout(image_paths, rows, cols, white_border, self.on_error, self.tracer)
+            render_key = (layout._replace(image_paths=()), resize_mode, keep_aspect_ratio)
+            if render_key != self.render_key:
+                # 画布尺寸、单元格位置或调整模式变化，整张重建
+                self.image = Image.new('RGB', layout_size(layout), (255, 255, 255))
+                self.painted = [None] * (rows * cols)
+                self.render_key = render_key
+            self.layout = layout
+
+            wanted = list(layout.image_paths) + [None] * (rows * cols - len(layout.image_paths))
+            versions = [source_version(path) if path is not None else None for path in wanted]
+            changed = [idx for idx, version in enumerate(versions) if self.painted[idx] != version]
+
+            # 只处理内容变化的单元格，已缓存的单元格不需要解码
+            paths = list(dict.fromkeys(wanted[idx] for idx in changed if wanted[idx] is not None))
+            target_size = (layout.cell_width, layout.cell_height)
+            cells = {}
+            for img_path, cell, error in iter_cells(paths, target_size, resize_mode, keep_aspect_ratio,
+                                                    self.workers, self.tiles.load, self.tracer):
+                if error is not None:
+                    self.tracer.error(img_path, error)
+                    if self.on_error:
+                        self.on_error(img_path, error)
+                cells[img_path] = cell
+
+            for idx in changed:
+                with self.tracer.stage('composite', wanted[idx]):
+                    self.paint_cell(idx, cells.get(wanted[idx]))
+                self.painted[idx] = versions[idx]
+            return self.image
+
+    def paint_cell(self, index, cell):
+        """清空单元格并贴入图片，cell为None时保持空白"""
+        x, y = cell_origin(self.layout, index)
+        self.image.paste((255, 255, 255), (x, y, x + self.layout.cell_width, y + self.layout.cell_height))
+        if cell is not None:
+            resized_img, offset = cell
+            self.image.paste(resized_img, (x + offset[0], y + offset[1]))
+
+    def release(self):
+        """释放画布和单元格缓存，下次生成时整张重建"""
+        with self.lock:
+            self.image = None
+            self.layout = None
+            self.render_key = None
+            self.painted = []
+            self.tiles.clear()
+
+
+def load_manifest(manifest_path):
+    """读取任务清单，返回任务字典列表，图片和输出的相对路径以清单所在目录为基准"""
+    with open(manifest_path, encoding='utf-8') as f:
+        if manifest_path.lower().endswith('.jsonl'):
+            jobs = [json.loads(line) for line in f if line.strip()]
+        else:
+            jobs = json.load(f)
+
+    base_dir = os.path.dirname(os.path.abspath(manifest_path))
+    for job in jobs:
+        job['images'] = [os.path.join(base_dir, p) for p in job['images']]
+        job['output'] = os.path.join(base_dir, job['output'])
+    return jobs
+
+
+def run_job(job, on_error=report_error, workers=1, cache=None, tracer=NULL_TRACER):
+    """
+    执行一个拼图任务并保存，返回 export.ExportResult
+    :param cache: TileCache，批量执行时共用
+    :param tracer: tracing.Tracer，记录生成和导出的各阶段
+    """
+    images = job['images']
+    if job.get('sort'):
+        images = get_image_files(images)
+    if not images:
+        raise ValueError("没有图片")
+
+    rows, cols = job.get('rows'), job.get('cols')
+    if not rows or not cols:
+        rows, cols = recommend_grid(len(images))
+
+    resize_mode = job.get('mode', 'scale')
+    if resize_mode not in RESIZE_MODES:
+        raise ValueError(f"不支持的调整模式: {resize_mode}")
+
+    failed = set()
+
+    def record_error(img_path, error):
+        failed.add(img_path)
+        if on_error:
+            on_error(img_path, error)
+
+    output = job['output']
+    preset = job.get('preset', DEFAULT_PRESET)
+    keep_aspect_ratio = job.get('keep_aspect_ratio', True)
+    layout = compute_layout(images, rows, cols, job.get('border', 0), record_error, tracer)
+    load = cache.load if cache is not None else load_cell
+
+    tiled = job.get('tiled')
+    if tiled is None:
+        width, height = layout_size(layout)
+        tiled = width * height >= TILED_MIN_PIXELS and format_for_path(output) in BAND_FORMATS
+    if tiled:
+        result = save_layout_banded(layout, output, resize_mode, keep_aspect_ratio, preset, record_error, workers,
+                                    load, tracer)
+        if len(failed) == len(set(images)):
+            os.remove(output)
+            raise ValueError("所有图片都无法读取")
+        return result
+
+    puzzle = render_layout(layout, resize_mode, keep_aspect_ratio, record_error, workers, load, tracer)
+    if len(failed) == len(set(images)):
+        # 所有图片都无法读取时不输出空白拼图
+        raise ValueError("所有图片都无法读取")
+    return export_image(puzzle, output, preset, workers=workers, tracer=tracer)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="拼图生成器（无界面）")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    compose = subparsers.add_parser("compose", help="生成一张拼图")
+    compose.add_argument("images", nargs="+", help="图片文件")
+    compose.add_argument("-o", "--output", required=True, help="输出文件")
+    compose.add_argument("-r", "--rows", type=int, help="行数（省略时按图片数量推荐）")
+    compose.add_argument("-c", "--cols", type=int, help="列数（省略时按图片数量推荐）")
+    compose.add_argument("-b", "--border", type=int, default=0, help="白边宽度（默认0）")
+    compose.add_argument("--mode", choices=RESIZE_MODES, default="scale", help="调整模式（默认scale）")
+    compose.add_argument("--stretch", action="store_true", help="缩放模式下不保持纵横比，拉伸填满单元格")
+    compose.add_argument("--sort", action="store_true", help="按文件名自然排序")
+    compose.add_argument("--preset", choices=list(PRESETS), default=DEFAULT_PRESET,
+                         help=f"导出预设（默认{DEFAULT_PRESET}）")
+    compose.add_argument("--tiled", action="store_true",
+                         help="逐条带生成并直接写入文件，不在内存中创建完整的拼图（只支持PNG和TIFF；"
+                              "超大拼图会自动启用）")
+
+    batch = subparsers.add_parser("batch", help="按任务清单批量生成拼图")
+    batch.add_argument("manifest", help="任务清单（.json 或 .jsonl）")
+    batch.add_argument("--cache-mb", type=int, default=DEFAULT_TILE_CACHE_BYTES // (1024 * 1024),
+                       help=f"各任务共用的单元格缓存上限（MB，默认{DEFAULT_TILE_CACHE_BYTES // (1024 * 1024)}）")
+
+    for sub in (compose, batch):
+        sub.add_argument("-j", "--workers", type=int, default=0,
+                         help="并行处理图片的线程数，0表示使用全部CPU核心（默认0）")
+        sub.add_argument("--trace", help="输出各阶段的耗时汇总，并把Chrome trace写到该文件")
+
+    args = parser.parse_args(argv)
+
+    cache = None
+    if args.command == "compose":
+        jobs = [{
+            'images': args.images, 'output': args.output, 'rows': args.rows, 'cols': args.cols,
+            'border': args.border, 'mode': args.mode, 'keep_aspect_ratio': not args.stretch,
+            'sort': args.sort, 'preset': args.preset, 'tiled': True if args.tiled else None,
+        }]
+    else:
+        jobs = load_manifest(args.manifest)
+        # 同一组图片的不同拼图共用调整后的单元格，每个单元格只解码一次
+        cache = TileCache(args.cache_mb * 1024 * 1024)
+
+    tracer = Tracer() if args.trace else NULL_TRACER
+    failed = 0
+    for job in jobs:
+        try:
+            result = run_job(job, workers=args.workers, cache=cache, tracer=tracer)
+            print(f"已保存 {result.path}  {describe_export(result)}")
+        except Exception as e:
+            print(f"生成 {job.get('output')} 时出错: {e}", file=sys.stderr)
+            failed += 1
+
+    if cache is not None:
+        print(f"单元格缓存: 命中 {cache.hits} 次，解码 {cache.misses} 次")
+    if args.trace:
+        print(tracer.format_summary())
+        tracer.write_chrome_trace(args.trace)
+        print(f"Chrome trace已保存到 {args.trace}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
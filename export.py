@@ -0,0 +1,151 @@
+"""
+拼图的导出：按扩展名选择格式，按预设选择编码参数，并统计编码速度
+
+预设:
+    fast      编码最快，文件较大；PNG使用低压缩级别的分条带并行写入器
+    balanced  速度和体积折中（默认）；PNG使用分条带并行写入器
+    small     文件最小，编码最慢；PNG使用Pillow的自适应滤波和最高压缩级别
+
+只有PNG支持分条带并行编码，Pillow的JPEG、WebP和TIFF编码器只能单线程处理整张图片。
+
+超大拼图用 open_band_writer 边生成边写入，完整的画布不会出现在内存中：
+PNG使用分条带写入器，TIFF使用分块（带金字塔）写入器。
+Pillow的JPEG和WebP编码器只能一次编码整张图片，不支持这种方式。
+"""
+import os
+import time
+from collections import namedtuple
+from png_writer import PNG_MODES, StripedPNGWriter, band_height_for, save_png
+from tiff_writer import TIFF_MODES, TiledTIFFWriter
+from tracing import NULL_TRACER
+
+# 扩展名 -> Pillow格式名
+EXTENSION_FORMATS = {
+    '.jpg': 'JPEG',
+    '.jpeg': 'JPEG',
+    '.png': 'PNG',
+    '.webp': 'WEBP',
+    '.tif': 'TIFF',
+    '.tiff': 'TIFF',
+}
+
+EXPORT_FORMATS = ('JPEG', 'PNG', 'WEBP', 'TIFF')
+
+# 支持边生成边写入的格式
+BAND_FORMATS = ('PNG', 'TIFF')
+
+# 分块TIFF写入器的zlib压缩级别，Pillow保存TIFF时不支持设置压缩级别
+TILED_TIFF_LEVELS = {'fast': 1, 'balanced': 6, 'small': 9}
+
+# 预设 -> 格式 -> 编码参数
+# PNG的 striped 表示使用分条带并行写入器，compress_level/png_filter 为其参数
+PRESETS = {
+    'fast': {
+        'JPEG': {'quality': 85, 'subsampling': 2, 'optimize': False, 'progressive': False},
+        'PNG': {'striped': True, 'compress_level': 1, 'png_filter': 'sub'},
+        'WEBP': {'quality': 80, 'method': 0},
+        'TIFF': {'compression': 'raw'},
+    },
+    'balanced': {
+        'JPEG': {'quality': 90, 'subsampling': 2, 'optimize': True, 'progressive': False},
+        'PNG': {'striped': True, 'compress_level': 6, 'png_filter': 'up'},
+        'WEBP': {'quality': 85, 'method': 4},
+        'TIFF': {'compression': 'tiff_adobe_deflate'},
+    },
+    'small': {
+        'JPEG': {'quality': 80, 'subsampling': 2, 'optimize': True, 'progressive': True},
+        'PNG': {'striped': False, 'compress_level': 9},
+        'WEBP': {'quality': 75, 'method': 6},
+        'TIFF': {'compression': 'tiff_adobe_deflate'},
+    },
+}
+
+DEFAULT_PRESET = 'balanced'
+
+# path: 输出文件
+# format: 实际使用的格式，扩展名无法识别时为None（使用Pillow默认参数）
+# preset: 使用的预设
+# width/height: 图片尺寸
+# file_bytes: 输出文件大小
+# seconds: 编码和写入耗时
+ExportResult = namedtuple('ExportResult', ['path', 'format', 'preset', 'width', 'height', 'file_bytes', 'seconds'])
+
+
+def format_for_path(path):
+    """由扩展名得到导出格式，无法识别时返回None"""
+    return EXTENSION_FORMATS.get(os.path.splitext(path)[1].lower())
+
+
+def export_options(fmt, preset=DEFAULT_PRESET):
+    """返回某格式在某预设下的编码参数（副本）"""
+    if preset not in PRESETS:
+        raise ValueError(f"不支持的导出预设: {preset}")
+    return dict(PRESETS[preset].get(fmt, {}))
+
+
+def export_image(img, path, preset=DEFAULT_PRESET, fmt=None, workers=0, tracer=NULL_TRACER):
+    """
+    按预设导出图片
+    :param fmt: 导出格式，默认由扩展名决定
+    :param workers: PNG分条带并行编码的线程数，0表示使用全部CPU核心
+    :param tracer: tracing.Tracer，记录编码阶段
+    :return: ExportResult
+    """
+    fmt = fmt or format_for_path(path)
+    if fmt is not None and fmt not in EXPORT_FORMATS:
+        raise ValueError(f"不支持的导出格式: {fmt}")
+    options = export_options(fmt, preset)
+
+    striped = options.pop('striped', False)
+    start = time.perf_counter()
+    with tracer.stage('encode', path, pixels=img.width * img.height) as span:
+        if fmt == 'PNG' and striped and img.mode in PNG_MODES:
+            save_png(img, path, workers=workers, **options)
+        elif fmt is None:
+            # 未知格式沿用Pillow的默认参数
+            img.save(path)
+        else:
+            # Pillow的PNG编码器自行选择滤波方式
+            options.pop('png_filter', None)
+            img.save(path, format=fmt, **options)
+        file_bytes = os.path.getsize(path)
+        span.add(bytes_written=file_bytes)
+    seconds = time.perf_counter() - start
+
+    return ExportResult(path, fmt, preset, img.width, img.height, file_bytes, seconds)
+
+
+def open_band_writer(path, size, mode='RGB', preset=DEFAULT_PRESET, fmt=None, workers=0):
+    """
+    打开按条带写入的写入器，用于无法完整放入内存的超大图片
+    PNG使用 StripedPNGWriter（不分条带的预设改用 'up' 滤波），TIFF使用带金字塔的 TiledTIFFWriter
+    :param fmt: 导出格式，默认由扩展名决定，只支持 BAND_FORMATS
+    :param workers: 并行压缩的线程数，0表示使用全部CPU核心
+    :return: (写入器, 建议的条带行数)，写入器有 write_band/close/abort 方法，可作为上下文管理器
+    """
+    fmt = fmt or format_for_path(path)
+    if fmt not in BAND_FORMATS:
+        raise ValueError(f"{fmt or os.path.splitext(path)[1]} 格式不支持边生成边写入，只支持 {'、'.join(BAND_FORMATS)}")
+    options = export_options(fmt, preset)
+
+    if fmt == 'PNG':
+        if mode not in PNG_MODES:
+            raise ValueError(f"不支持的PNG模式: {mode}")
+        writer = StripedPNGWriter(path, size, mode, options['compress_level'], options.get('png_filter', 'up'),
+                                  workers)
+        return writer, band_height_for(size[0], mode)
+
+    if mode not in TIFF_MODES:
+        raise ValueError(f"不支持的TIFF模式: {mode}")
+    writer = TiledTIFFWriter(path, size, mode, options['compression'], TILED_TIFF_LEVELS[preset],
+                             pyramid=True, workers=workers)
+    return writer, writer.band_height
+
+
+def describe_export(result):
+    """导出结果的一行说明，包括编码速度"""
+    megapixels = result.width * result.height / 1e6
+    seconds = max(result.seconds, 1e-6)
+    return (f"{result.format or '默认格式'}（{result.preset}）: {megapixels:.1f} MP，"
+            f"{result.file_bytes / 1024 / 1024:.1f} MB，用时 {result.seconds:.2f} 秒，"
+            f"{megapixels / seconds:.1f} MP/s")
@@ -0,0 +1,67 @@
+"""
+只读取文件头的图片信息探测，不解码像素
+
+结果按文件缓存（路径 + 修改时间 + 文件大小），文件未改动时再次探测只需一次stat。
+缓存最多保留 MAX_CACHE_ENTRIES 个文件，超过后按最近使用时间淘汰（LRU），
+图形界面和批量任务长时间运行时内存不会一直增长。
+"""
+import os
+import threading
+from collections import OrderedDict, namedtuple
+from PIL import Image
+
+# EXIF中的方向标签
+EXIF_ORIENTATION = 0x0112
+
+# width/height: 文件中存储的像素尺寸（未按EXIF方向旋转）
+# mode: Pillow的颜色模式
+# format: 文件格式，如 'JPEG'、'PNG'
+# orientation: EXIF方向，1-8，没有EXIF时为1
+ImageInfo = namedtuple('ImageInfo', ['width', 'height', 'mode', 'format', 'orientation'])
+
+# 探测缓存的最大文件数，每项只有几百字节
+MAX_CACHE_ENTRIES = 20000
+
+_cache = OrderedDict()  # 绝对路径 -> (修改时间, 文件大小, ImageInfo)，按最近使用排序
+_cache_lock = threading.Lock()
+
+
+def read_orientation(img):
+    """读取EXIF方向，读取失败时视为正常方向"""
+    if img.format == 'PNG' and 'exif' not in img.info:
+        # PNG的eXIf块可能位于像素数据之后，Pillow读取它需要解码整张图片
+        return 1
+    try:
+        return int(img.getexif().get(EXIF_ORIENTATION, 1))
+    except Exception:
+        return 1
+
+
+def probe_image(path):
+    """
+    读取图片的尺寸、模式和EXIF方向
+    Image.open只解析文件头，像素数据不会被读取
+    """
+    stat = os.stat(path)
+    key = os.path.abspath(path)
+    with _cache_lock:
+        cached = _cache.get(key)
+        if cached and cached[0] == stat.st_mtime_ns and cached[1] == stat.st_size:
+            _cache.move_to_end(key)
+            return cached[2]
+
+    with Image.open(path) as img:
+        info = ImageInfo(img.width, img.height, img.mode, img.format, read_orientation(img))
+
+    with _cache_lock:
+        _cache[key] = (stat.st_mtime_ns, stat.st_size, info)
+        _cache.move_to_end(key)
+        while len(_cache) > MAX_CACHE_ENTRIES:
+            _cache.popitem(last=False)
+    return info
+
+
+def clear_probe_cache():
+    """清空探测缓存"""
+    with _cache_lock:
+        _cache.clear()
@@ -0,0 +1,153 @@
+"""
+逐页写入磁盘的PDF写入器
+
+每页的图片XObject在添加时立即写入文件，内存中只保留各对象的偏移量，
+内存占用与页数无关。写入过程中输出到临时文件，完成后才替换为目标文件。
+"""
+import io
+import os
+import shutil
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfbase.pdfutils import readJPEGInfo
+
+# 对象1为Catalog，对象2为页面树，在文件末尾写入
+CATALOG_ID = 1
+PAGES_ID = 2
+
+
+def _fmt(value):
+    """格式化PDF中的数字"""
+    return ('%.4f' % value).rstrip('0').rstrip('.')
+
+
+class StreamingPDFWriter:
+    def __init__(self, path, page_size=A4):
+        self.path = path
+        self.page_size = page_size
+        self.temp_path = path + '.part'
+        self._fh = open(self.temp_path, 'wb')
+        self._offsets = {}
+        self._page_ids = []
+        self._next_id = PAGES_ID + 1
+
+        self._fh.write(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    @property
+    def page_count(self):
+        return len(self._page_ids)
+
+    def _new_id(self):
+        obj_id = self._next_id
+        self._next_id += 1
+        return obj_id
+
+    def _write_object(self, obj_id, body):
+        """写入一个普通对象"""
+        self._offsets[obj_id] = self._fh.tell()
+        self._fh.write(f'{obj_id} 0 obj\n{body}\nendobj\n'.encode('latin-1'))
+
+    def _write_stream(self, obj_id, entries, data, length):
+        """写入一个流对象，data为bytes或可读的文件对象"""
+        self._offsets[obj_id] = self._fh.tell()
+        self._fh.write(f'{obj_id} 0 obj\n<< {entries} /Length {length} >>\nstream\n'.encode('latin-1'))
+        if isinstance(data, bytes):
+            self._fh.write(data)
+        else:
+            shutil.copyfileobj(data, self._fh)
+        self._fh.write(b'\nendstream\nendobj\n')
+
+    def _write_page(self, content, image_id=None):
+        """写入页面内容流和页面对象"""
+        content_id = self._new_id()
+        self._write_stream(content_id, '', content, len(content))
+
+        resources = f'/XObject << /Im0 {image_id} 0 R >>' if image_id else ''
+        page_id = self._new_id()
+        width, height = self.page_size
+        self._write_object(
+            page_id,
+            f'<< /Type /Page /Parent {PAGES_ID} 0 R /MediaBox [0 0 {_fmt(width)} {_fmt(height)}] '
+            f'/Resources << {resources} >> /Contents {content_id} 0 R >>'
+        )
+        self._page_ids.append(page_id)
+
+    def add_jpeg_page(self, jpeg, x, y, width, height, rotate=False):
+        """
+        添加一页，页面上放置一张JPEG图片，图片数据原样嵌入（DCTDecode）
+        :param jpeg: JPEG数据（bytes）或JPEG文件路径
+        :param x, y: 图片左下角在页面上的位置（单位point）
+        :param width, height: 图片在页面上的尺寸（单位point，旋转后）
+        :param rotate: 是否将图片逆时针旋转90度
+        """
+        if isinstance(jpeg, bytes):
+            fh = io.BytesIO(jpeg)
+            length = len(jpeg)
+        else:
+            fh = open(jpeg, 'rb')
+            length = os.path.getsize(jpeg)
+
+        try:
+            info = readJPEGInfo(fh)
+            px_width, px_height, components = info[0], info[1], info[2]
+            fh.seek(0)
+
+            if components == 1:
+                color = '/ColorSpace /DeviceGray'
+            elif components == 3:
+                color = '/ColorSpace /DeviceRGB'
+            else:
+                # Adobe的CMYK JPEG是反相存储的
+                color = '/ColorSpace /DeviceCMYK /Decode [1 0 1 0 1 0 1 0]'
+
+            image_id = self._new_id()
+            self._write_stream(
+                image_id,
+                f'/Type /XObject /Subtype /Image /Width {px_width} /Height {px_height} '
+                f'{color} /BitsPerComponent 8 /Filter /DCTDecode',
+                fh, length
+            )
+        finally:
+            fh.close()
+
+        if rotate:
+            # 平移到右下角后逆时针旋转坐标系，效果等同于 img.rotate(90, expand=True)
+            matrix = f'0 {_fmt(height)} {_fmt(-width)} 0 {_fmt(x + width)} {_fmt(y)}'
+        else:
+            matrix = f'{_fmt(width)} 0 0 {_fmt(height)} {_fmt(x)} {_fmt(y)}'
+        self._write_page(f'q {matrix} cm /Im0 Do Q'.encode('latin-1'), image_id)
+
+    def add_blank_page(self):
+        """添加一个空白页"""
+        self._write_page(b'')
+
+    def close(self):
+        """写入页面树、交叉引用表，并将临时文件替换为目标文件"""
+        kids = ' '.join(f'{page_id} 0 R' for page_id in self._page_ids)
+        self._write_object(PAGES_ID, f'<< /Type /Pages /Kids [{kids}] /Count {len(self._page_ids)} >>')
+        self._write_object(CATALOG_ID, f'<< /Type /Catalog /Pages {PAGES_ID} 0 R >>')
+
+        xref_offset = self._fh.tell()
+        size = self._next_id
+        lines = [f'xref\n0 {size}\n', '0000000000 65535 f \n']
+        for obj_id in range(1, size):
+            lines.append(f'{self._offsets[obj_id]:010d} 00000 n \n')
+        lines.append(f'trailer\n<< /Size {size} /Root {CATALOG_ID} 0 R >>\nstartxref\n{xref_offset}\n%%EOF\n')
+        self._fh.write(''.join(lines).encode('latin-1'))
+
+        self._fh.close()
+        os.replace(self.temp_path, self.path)
+
+    def abort(self):
+        """放弃写入，删除临时文件"""
+        self._fh.close()
+        if os.path.exists(self.temp_path):
+            os.remove(self.temp_path)
@@ -1,13 +1,16 @@
 import os
-import re
+import queue
+import threading
+import multiprocessing
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
-from PIL import Image, ImageTk
-import math
-from reportlab.pdfgen import canvas
-from reportlab.lib.pagesizes import A4
-from reportlab.lib.utils import ImageReader
-import io
+from thumbgrid import ThumbnailGrid
+from tracing import tracer_from_env, save_env_trace
+from pic2pdf_core import (natural_sort_key, get_image_files, resize_image_for_a4_portrait,
+                          convert_images_to_pdf, ConversionCancelled)
+
+# 后台转换时轮询消息队列的间隔（毫秒）
+POLL_INTERVAL = 100
 
 class ImageToPDFConverter:
     def __init__(self, root):
@@ -18,9 +21,16 @@ class ImageToPDFConverter:
         self.image_folder = tk.StringVar()
         self.output_file = tk.StringVar()
         self.image_paths = []
-        self.preview_images = []
+        self.preview_grid = None
+        
+        # 后台转换状态
+        self.worker = None
+        self.cancel_event = threading.Event()
+        self.messages = queue.Queue()
+        self.exit_requested = False
         
         self.create_widgets()
+        self.root.protocol("WM_DELETE_WINDOW", self.exit_app)
         
     def create_widgets(self):
         # 主框架
@@ -74,18 +84,29 @@ class ImageToPDFConverter:
         self.convert_button = ttk.Button(button_frame, text="转换为PDF", command=self.convert_to_pdf, state="disabled")
         self.convert_button.pack(side=tk.LEFT, padx=(0, 10))
         
-        ttk.Button(button_frame, text="退出", command=self.root.quit).pack(side=tk.LEFT)
+        self.cancel_button = ttk.Button(button_frame, text="取消", command=self.cancel_conversion, state="disabled")
+        self.cancel_button.pack(side=tk.LEFT, padx=(0, 10))
+        
+        ttk.Button(button_frame, text="退出", command=self.exit_app).pack(side=tk.LEFT)
+        
+        # 进度区域
+        progress_frame = ttk.Frame(main_frame)
+        progress_frame.grid(row=5, column=0, columnspan=3, sticky=(tk.W, tk.E))
+        progress_frame.columnconfigure(0, weight=1)
+        
+        self.progress_bar = ttk.Progressbar(progress_frame, mode="determinate")
+        self.progress_bar.grid(row=0, column=0, sticky=(tk.W, tk.E))
+        
+        self.status_label = ttk.Label(progress_frame, text="")
+        self.status_label.grid(row=1, column=0, sticky=tk.W, pady=(5, 0))
     
     def natural_sort_key(self, text):
         """自然排序键函数"""
-        return [int(c) if c.isdigit() else c.lower() for c in re.split(r'(\d+)', text)]
+        return natural_sort_key(text)
     
     def get_image_files(self, folder_path):
         """获取文件夹中的所有图片文件并按名称排序"""
-        supported_formats = ('.png', '.jpg', '.jpeg', '.bmp', '.gif', '.tiff')
-        files = [f for f in os.listdir(folder_path) if f.lower().endswith(supported_formats)]
-        files.sort(key=self.natural_sort_key)
-        return [os.path.join(folder_path, f) for f in files]
+        return get_image_files(folder_path)
     
     def browse_folder(self):
         """选择图片文件夹"""
@@ -115,54 +136,21 @@ class ImageToPDFConverter:
         for widget in self.preview_frame.winfo_children():
             widget.destroy()
         
-        self.preview_images = []
+        self.preview_grid = None
         
         # 显示图片预览
         if self.image_paths:
-            # 创建一个滚动区域来显示预览图
-            canvas = tk.Canvas(self.preview_frame)
-            scrollbar = ttk.Scrollbar(self.preview_frame, orient="vertical", command=canvas.yview)
-            scrollable_frame = ttk.Frame(canvas)
-            
-            scrollable_frame.bind(
-                "<Configure>",
-                lambda e: canvas.configure(scrollregion=canvas.bbox("all"))
-            )
-            
-            canvas.create_window((0, 0), window=scrollable_frame, anchor="nw")
-            canvas.configure(yscrollcommand=scrollbar.set)
-            
-            # 显示图片
-            for i, path in enumerate(self.image_paths):
-                try:
-                    with Image.open(path) as img:
-                        # 创建缩略图
-                        img_copy = img.copy()
-                        img_copy.thumbnail((150, 150), Image.Resampling.LANCZOS)
-                        photo = ImageTk.PhotoImage(img_copy)
-                        self.preview_images.append(photo)  # 保持引用
-                        
-                        # 创建预览标签
-                        frame = ttk.Frame(scrollable_frame)
-                        frame.grid(row=i//5, column=i%5, padx=5, pady=5)
-                        
-                        label = ttk.Label(frame, image=photo)
-                        label.pack()
-                        
-                        name_label = ttk.Label(frame, text=os.path.basename(path), 
-                                              wraplength=150, justify="center")
-                        name_label.pack()
-                except Exception as e:
-                    print(f"加载预览图 {path} 时出错: {e}")
-            
-            canvas.pack(side="left", fill="both", expand=True)
-            scrollbar.pack(side="right", fill="y")
+            # 虚拟化的缩略图网格，只解码可见区域附近的图片，后台生成缩略图
+            self.preview_grid = ThumbnailGrid(self.preview_frame, thumb_size=150, columns=5)
+            self.preview_grid.pack(fill="both", expand=True)
+            self.preview_grid.set_paths(self.image_paths)
             
             # 更新图片数量显示
             self.image_count_label.config(text=f"找到 {len(self.image_paths)} 张图片")
             
-            # 启用转换按钮
-            self.convert_button.config(state="normal")
+            # 启用转换按钮；转换进行中时保持禁用，完成后由 poll_conversion 启用
+            if self.worker is None:
+                self.convert_button.config(state="normal")
             
             # 如果没有设置输出文件，自动生成一个
             if not self.output_file.get():
@@ -175,57 +163,19 @@ class ImageToPDFConverter:
             self.image_count_label.config(text="未找到图片文件")
             self.convert_button.config(state="disabled")
     
-    def resize_image_for_a4_portrait(self, img):
+    def resize_image_for_a4_portrait(self, img, profile=None):
         """
         将图片调整为适合纵向A4纸的尺寸
         返回调整后的图片和是否需要旋转的标志
         """
-        # A4尺寸 (宽, 高) in points (1 point = 1/72 inch)
-        a4_width, a4_height = A4  # (595.276, 841.890)
-        
-        # 获取原始图片尺寸
-        img_width, img_height = img.size
-        
-        # 计算两种方案的缩放比例：
-        # 方案1：直接放置在纵向A4上
-        direct_width_ratio = a4_width / img_width
-        direct_height_ratio = a4_height / img_height
-        direct_scale_ratio = min(direct_width_ratio, direct_height_ratio)
-        
-        # 方案2：旋转90度后放置在纵向A4上
-        rotated_width_ratio = a4_width / img_height
-        rotated_height_ratio = a4_height / img_width
-        rotated_scale_ratio = min(rotated_width_ratio, rotated_height_ratio)
-        
-        # 选择能获得更大图片的方案
-        if rotated_scale_ratio > direct_scale_ratio:
-            # 旋转图片
-            should_rotate = True
-            scale_ratio = rotated_scale_ratio
-            # 旋转图片90度
-            img = img.rotate(90, expand=True)
-            # 更新尺寸
-            img_width, img_height = img_height, img_width
-        else:
-            # 不旋转图片
-            should_rotate = False
-            scale_ratio = direct_scale_ratio
-        
-        # 如果图片比A4小，则不放大
-        if scale_ratio > 1:
-            scale_ratio = 1
-            
-        # 计算新尺寸
-        new_width = int(img_width * scale_ratio)
-        new_height = int(img_height * scale_ratio)
-        
-        # 调整图片尺寸
-        resized_img = img.resize((new_width, new_height), Image.Resampling.LANCZOS)
-        
-        return resized_img, should_rotate
+        return resize_image_for_a4_portrait(img, profile)
     
     def convert_to_pdf(self):
         """将图片转换为PDF，所有页面都是纵向A4"""
+        # 同一时间只进行一个转换，取消和进度都针对当前的后台线程
+        if self.worker is not None:
+            return
+        
         # 验证输入
         if not self.image_folder.get():
             messagebox.showerror("错误", "请选择图片文件夹")
@@ -246,62 +196,118 @@ class ImageToPDFConverter:
             else:
                 return
         
+        # 在后台线程中转换，界面保持响应
+        self.cancel_event.clear()
+        self.messages = queue.Queue()
+        self.progress_bar.config(maximum=len(self.image_paths), value=0)
+        self.status_label.config(text="正在转换...")
+        self.convert_button.config(state="disabled")
+        self.cancel_button.config(state="normal")
+        
+        self.worker = threading.Thread(
+            target=self.run_conversion,
+            args=(list(self.image_paths), self.output_file.get(), self.messages),
+            daemon=True
+        )
+        self.worker.start()
+        self.root.after(POLL_INTERVAL, self.poll_conversion)
+    
+    def run_conversion(self, image_paths, output_path, messages):
+        """后台线程：执行转换，通过队列把进度和结果发回界面线程"""
+        # 设置了 PIC_TOOLS_TRACE 时记录本次转换的各阶段
+        tracer = tracer_from_env()
         try:
             # 创建PDF文件，所有页面都是纵向A4
-            output_path = self.output_file.get()
-            c = canvas.Canvas(output_path, pagesize=A4)
-            a4_width, a4_height = A4
-            
-            # 处理每张图片
-            for i, img_path in enumerate(self.image_paths):
-                try:
-                    # 打开图片
-                    with Image.open(img_path) as img:
-                        # 转换为RGB模式（如果需要）
-                        if img.mode in ('RGBA', 'LA', 'P'):
-                            # 创建白色背景
-                            rgb_img = Image.new('RGB', img.size, (255, 255, 255))
-                            if img.mode == 'P':
-                                img = img.convert('RGBA')
-                            rgb_img.paste(img, mask=img.split()[-1] if img.mode in ('RGBA', 'LA') else None)
-                            img = rgb_img
-                        
-                        # 调整图片尺寸以适应纵向A4，并决定是否旋转
-                        resized_img, was_rotated = self.resize_image_for_a4_portrait(img)
-                        
-                        # 确保页面是纵向A4（可能前面的页面改变了页面尺寸）
-                        c.setPageSize(A4)
-                        
-                        # 计算居中位置
-                        img_width, img_height = resized_img.size
-                        x = (a4_width - img_width) / 2
-                        y = (a4_height - img_height) / 2
-                        
-                        # 将PIL图片转换为BytesIO
-                        img_buffer = io.BytesIO()
-                        resized_img.save(img_buffer, format='JPEG', quality=95)
-                        img_buffer.seek(0)
-                        
-                        # 在PDF中绘制图片
-                        c.drawImage(ImageReader(img_buffer), x, y, width=img_width, height=img_height)
-                        
-                        # 添加新页面（除了最后一张图片）
-                        if i < len(self.image_paths) - 1:
-                            c.showPage()
-                
-                except Exception as e:
-                    print(f"处理图片 {img_path} 时出错: {e}")
-                    # 即使某张图片出错，也继续处理其他图片
-                    if i < len(self.image_paths) - 1:
-                        c.showPage()
-            
-            # 保存PDF
-            c.save()
-            
-            messagebox.showinfo("成功", f"PDF文件已保存到: {output_path}\n所有页面均为纵向A4格式")
-            
+            errors = convert_images_to_pdf(
+                image_paths, output_path, workers=0, streaming=True,
+                progress=lambda done, total, path: messages.put(("progress", done, total, path)),
+                on_error=lambda path, error: messages.put(("error", path, error)),
+                cancel_event=self.cancel_event,
+                tracer=tracer
+            )
+            messages.put(("done", output_path, errors))
+        except ConversionCancelled:
+            messages.put(("cancelled",))
         except Exception as e:
-            messagebox.showerror("错误", f"转换PDF时出错: {str(e)}")
+            messages.put(("failed", e))
+        finally:
+            save_env_trace(tracer)
+    
+    def poll_conversion(self):
+        """界面线程：处理后台线程发来的消息"""
+        finished = False
+        while True:
+            try:
+                message = self.messages.get_nowait()
+            except queue.Empty:
+                break
+            
+            kind = message[0]
+            if kind == "progress":
+                done, total, path = message[1:]
+                self.progress_bar.config(value=done)
+                self.status_label.config(text=f"已处理 {done}/{total}: {os.path.basename(path)}")
+            elif kind == "error":
+                path, error = message[1:]
+                self.status_label.config(text=f"处理图片 {os.path.basename(path)} 时出错: {error}")
+            elif kind == "done":
+                finished = True
+                output_path, errors = message[1:]
+                self.status_label.config(text=f"转换完成，{len(errors)} 张图片出错")
+                if not self.exit_requested:
+                    self.show_result(output_path, errors)
+            elif kind == "cancelled":
+                finished = True
+                self.progress_bar.config(value=0)
+                self.status_label.config(text="转换已取消")
+            elif kind == "failed":
+                finished = True
+                self.status_label.config(text="转换失败")
+                if not self.exit_requested:
+                    messagebox.showerror("错误", f"转换PDF时出错: {str(message[1])}")
+        
+        if not finished:
+            self.root.after(POLL_INTERVAL, self.poll_conversion)
+            return
+        
+        self.worker = None
+        self.cancel_button.config(state="disabled")
+        if self.image_paths:
+            self.convert_button.config(state="normal")
+        if self.exit_requested:
+            self.root.quit()
+    
+    def show_result(self, output_path, errors):
+        """转换完成后显示结果，列出出错的图片"""
+        message = f"PDF文件已保存到: {output_path}\n所有页面均为纵向A4格式"
+        if not errors:
+            messagebox.showinfo("成功", message)
+            return
+        
+        # 错误较多时只列出前几条
+        max_listed = 10
+        lines = [f"{os.path.basename(path)}: {error}" for path, error in errors[:max_listed]]
+        if len(errors) > max_listed:
+            lines.append(f"……另有 {len(errors) - max_listed} 张")
+        messagebox.showwarning(
+            "完成（部分图片出错）",
+            message + f"\n\n以下 {len(errors)} 张图片处理失败，对应页面为空白:\n" + "\n".join(lines)
+        )
+    
+    def cancel_conversion(self):
+        """请求取消正在进行的转换"""
+        if self.worker:
+            self.cancel_event.set()
+            self.cancel_button.config(state="disabled")
+            self.status_label.config(text="正在取消...")
+    
+    def exit_app(self):
+        """退出程序，转换进行中时先取消并等待后台线程清理临时文件"""
+        if self.worker:
+            self.exit_requested = True
+            self.cancel_conversion()
+        else:
+            self.root.quit()
 
 def main():
     root = tk.Tk()
@@ -309,6 +315,7 @@ def main():
     root.mainloop()
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support()
     # 检查是否安装了必要的库
     try:
         import reportlab
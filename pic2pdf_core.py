@@ -0,0 +1,589 @@
+"""
+图片转PDF的核心逻辑，不依赖tkinter，可作为库或命令行使用
+
+用法:
+    python pic2pdf_core.py 文件夹1 [文件夹2 ...] [-r] [-o 输出目录] [-j 进程数] [--stream] [--trace 文件]
+"""
+import os
+import io
+import sys
+import argparse
+import itertools
+import multiprocessing
+from collections import deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from PIL import Image
+from reportlab.pdfgen import canvas
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.utils import ImageReader
+from pdf_writer import StreamingPDFWriter
+from tracing import NULL_TRACER, Tracer, image_path, file_bytes, trace_decode
+from rawimage import can_map, resize_mapped
+from scanner import natural_sort_key, list_images, scan_folder
+
+
+class ConversionCancelled(Exception):
+    """转换被用户取消"""
+
+
+# 页面渲染参数
+# dpi: 目标分辨率，72时A4页面为595x842像素
+# resample: 最终缩放使用的滤镜名称，见 RESAMPLE_FILTERS
+# quality: 重新编码JPEG的质量
+# draft: 是否在解码阶段先粗缩小（JPEG DCT缩放 / Image.reduce），再用滤镜精调
+RenderProfile = namedtuple('RenderProfile', ['dpi', 'resample', 'quality', 'draft'],
+                           defaults=(72, 'lanczos', 95, True))
+DEFAULT_PROFILE = RenderProfile()
+
+RESAMPLE_FILTERS = {
+    'nearest': Image.Resampling.NEAREST,
+    'box': Image.Resampling.BOX,
+    'bilinear': Image.Resampling.BILINEAR,
+    'hamming': Image.Resampling.HAMMING,
+    'bicubic': Image.Resampling.BICUBIC,
+    'lanczos': Image.Resampling.LANCZOS,
+}
+
+# 粗缩小后的图片至少保留目标尺寸的倍数，保证最终滤镜的画质
+DRAFT_GAP = 2
+
+# 图片在纵向A4上的放置方案
+# rotate: 是否旋转90度
+# width/height: 旋转后在页面上的放置尺寸（单位point）
+# pixel_width/pixel_height: 旋转后嵌入的像素尺寸（目标分辨率下，不超过原图）
+A4Layout = namedtuple('A4Layout', ['rotate', 'width', 'height', 'pixel_width', 'pixel_height'])
+
+# 处理完成、等待写入PDF的页面
+# data: 重新编码后的JPEG数据，直通时为None
+# width/height: 在页面上的绘制尺寸（单位point，已考虑旋转）
+# rotate: 是否需要在PDF中将图片逆时针旋转90度
+# source: 直通时直接嵌入的原始JPEG文件路径
+PreparedPage = namedtuple('PreparedPage', ['data', 'width', 'height', 'rotate', 'source'])
+
+
+def get_image_files(folder_path, recursive=False):
+    """
+    获取文件夹中的所有图片文件并按名称自然排序
+    :param recursive: 是否包含子文件夹，按相对路径逐级排序；递归扫描使用 scanner 的持久化索引
+    """
+    if recursive:
+        return [entry.path for entry in scan_folder(folder_path, recursive=True)]
+    return list_images(folder_path)
+
+
+def default_output_path(folder):
+    """默认输出文件：文件夹内与文件夹同名的PDF"""
+    folder = os.path.normpath(folder)
+    return os.path.join(folder, f"{os.path.basename(folder)}.pdf")
+
+
+def output_names(folders):
+    """
+    为输出到同一目录的多个文件夹生成互不重复的PDF文件名（不含扩展名）
+    默认用文件夹名；重名时逐级加上上级目录名作前缀（如 a_scans、b_scans），
+    仍然重复（例如同一文件夹指定了两次）时再加序号
+    :return: 与 folders 一一对应的名称列表
+    """
+    parts = [[p for p in os.path.abspath(folder).split(os.sep) if p] or ['root'] for folder in folders]
+    depths = [1] * len(folders)
+    while True:
+        names = ["_".join(p[-d:]) for p, d in zip(parts, depths)]
+        # 按不区分大小写比较，Windows和macOS上 Scans.pdf 与 scans.pdf 是同一个文件
+        groups = {}
+        for i, name in enumerate(names):
+            groups.setdefault(name.lower(), []).append(i)
+        # 只有不同的文件夹重名时才加前缀，同一文件夹指定多次时留给序号区分
+        clashes = [i for group in groups.values() if len({tuple(parts[j]) for j in group}) > 1
+                   for i in group if depths[i] < len(parts[i])]
+        if not clashes:
+            break
+        for i in clashes:
+            depths[i] += 1
+
+    taken = set()
+    for i, name in enumerate(names):
+        unique, counter = name, 1
+        while unique.lower() in taken:
+            counter += 1
+            unique = f"{name}_{counter}"
+        taken.add(unique.lower())
+        names[i] = unique
+    return names
+
+
+# 需要合成到白色背景上的模式
+FLATTEN_MODES = ('RGBA', 'LA', 'P')
+
+
+def flatten_to_rgb(img):
+    """将带透明通道或调色板的图片合成到白色背景上"""
+    if img.mode in FLATTEN_MODES:
+        # 创建白色背景
+        rgb_img = Image.new('RGB', img.size, (255, 255, 255))
+        if img.mode == 'P':
+            img = img.convert('RGBA')
+        rgb_img.paste(img, mask=img.split()[-1] if img.mode in ('RGBA', 'LA') else None)
+        img = rgb_img
+    return img
+
+
+def get_resample_filter(name):
+    """将滤镜名称转换为Pillow的重采样滤镜"""
+    try:
+        return RESAMPLE_FILTERS[name.lower()]
+    except KeyError:
+        raise ValueError(f"不支持的重采样滤镜: {name}，可选: {', '.join(RESAMPLE_FILTERS)}")
+
+
+def compute_a4_layout(size, dpi=72):
+    """
+    计算图片放置到纵向A4上的方案，只依赖图片尺寸，不处理像素
+    页面上的放置尺寸（point）与分辨率无关：1像素按1 point计，比A4大时缩小，不放大；
+    嵌入的像素尺寸为放置尺寸按目标分辨率换算，不超过原图尺寸
+    :param size: 原始图片尺寸 (宽, 高)
+    :param dpi: 目标分辨率，72时1像素对应1 point
+    :return: A4Layout，尺寸均为旋转后的
+    """
+    # A4尺寸 (宽, 高) in points (1 point = 1/72 inch)
+    a4_width, a4_height = A4  # (595.276, 841.890)
+
+    # 获取原始图片尺寸
+    img_width, img_height = size
+
+    # 计算两种方案的缩放比例：
+    # 方案1：直接放置在纵向A4上
+    direct_width_ratio = a4_width / img_width
+    direct_height_ratio = a4_height / img_height
+    direct_scale_ratio = min(direct_width_ratio, direct_height_ratio)
+
+    # 方案2：旋转90度后放置在纵向A4上
+    rotated_width_ratio = a4_width / img_height
+    rotated_height_ratio = a4_height / img_width
+    rotated_scale_ratio = min(rotated_width_ratio, rotated_height_ratio)
+
+    # 选择能获得更大图片的方案
+    if rotated_scale_ratio > direct_scale_ratio:
+        # 旋转图片，更新尺寸
+        should_rotate = True
+        scale_ratio = rotated_scale_ratio
+        img_width, img_height = img_height, img_width
+    else:
+        # 不旋转图片
+        should_rotate = False
+        scale_ratio = direct_scale_ratio
+
+    # 如果图片比A4小，则不放大
+    if scale_ratio > 1:
+        scale_ratio = 1
+
+    # 计算新尺寸（point）
+    new_width = int(img_width * scale_ratio)
+    new_height = int(img_height * scale_ratio)
+
+    # 嵌入的像素尺寸：放置尺寸按目标分辨率换算，原图像素不够时不放大
+    pixel_ratio = min(scale_ratio * dpi / 72, 1)
+    pixel_width = max(1, int(img_width * pixel_ratio))
+    pixel_height = max(1, int(img_height * pixel_ratio))
+
+    return A4Layout(should_rotate, new_width, new_height, pixel_width, pixel_height)
+
+
+def resize_image_for_a4_portrait(img, profile=None, tracer=NULL_TRACER):
+    """
+    将图片调整为适合纵向A4纸的尺寸
+    返回调整后的图片和是否需要旋转的标志
+    :param img: PIL Image对象，尚未加载像素时可利用JPEG DCT缩放加速解码，
+                未压缩的大BMP/TIFF按条带映射读取（见 rawimage），结果可能带透明通道
+    :param profile: RenderProfile，默认 DEFAULT_PROFILE
+    :param tracer: tracing.Tracer，分别记录解码和缩放
+    """
+    profile = profile or DEFAULT_PROFILE
+    resample = get_resample_filter(profile.resample)
+    layout = compute_a4_layout(img.size, profile.dpi)
+    should_rotate = layout.rotate
+
+    # 旋转前的目标尺寸，先缩小再旋转，旋转的像素更少
+    if should_rotate:
+        target_size = (layout.pixel_height, layout.pixel_width)
+    else:
+        target_size = (layout.pixel_width, layout.pixel_height)
+
+    if can_map(img):
+        # 原图不完整读入内存，逐个条带读取并缩放
+        with tracer.stage('resize', image_path(img), pixels=target_size[0] * target_size[1], mapped=1):
+            resized_img = resize_mapped(img, target_size, resample=resample)
+    else:
+        reducing_gap = None
+        if profile.draft:
+            # 解码时直接缩小到不小于目标尺寸DRAFT_GAP倍（JPEG DCT缩放），
+            # 其他格式由Image.reduce粗缩小，最终滤镜只作用于缩小后的图片
+            img.draft(img.mode, (target_size[0] * DRAFT_GAP, target_size[1] * DRAFT_GAP))
+            reducing_gap = DRAFT_GAP
+
+        trace_decode(tracer, img)
+        with tracer.stage('resize', image_path(img), pixels=target_size[0] * target_size[1]):
+            # 调整图片尺寸
+            resized_img = img.resize(target_size, resample, reducing_gap=reducing_gap)
+
+    if should_rotate:
+        # 逆时针旋转90度，等同于 rotate(90, expand=True)
+        resized_img = resized_img.transpose(Image.Transpose.ROTATE_90)
+
+    return resized_img, should_rotate
+
+
+def can_pass_through(img, img_path, layout):
+    """
+    判断JPEG原始数据能否直接嵌入PDF（DCT直通）
+    仅限RGB/灰度的.jpg/.jpeg文件，且嵌入的像素尺寸就是原图尺寸（不需要缩小）
+    """
+    if img.format != 'JPEG' or img.mode not in ('RGB', 'L'):
+        return False
+    if not img_path.lower().endswith(('.jpg', '.jpeg')):
+        return False
+    if layout.rotate:
+        pixel_size = (layout.pixel_height, layout.pixel_width)
+    else:
+        pixel_size = (layout.pixel_width, layout.pixel_height)
+    return pixel_size == img.size
+
+
+def prepare_page(img_path, jpeg_passthrough=True, profile=None, tracer=NULL_TRACER):
+    """
+    解码、调整并重新编码单张图片，可在子进程中执行
+    :param img_path: 图片路径
+    :param jpeg_passthrough: 是否允许不经解码直接嵌入原始JPEG数据
+    :param profile: RenderProfile，默认 DEFAULT_PROFILE
+    :param tracer: tracing.Tracer，记录解码、缩放和编码
+    :return: PreparedPage
+    """
+    profile = profile or DEFAULT_PROFILE
+
+    # 打开图片（此时只读取了文件头）
+    with Image.open(img_path) as img:
+        layout = compute_a4_layout(img.size, profile.dpi)
+
+        if jpeg_passthrough and can_pass_through(img, img_path, layout):
+            # 原始JPEG直接嵌入，旋转交给PDF坐标变换
+            with tracer.stage('passthrough', img_path) as span:
+                # 文件在写入PDF时原样复制，这里只记录大小
+                span.add(bytes_read=file_bytes(img))
+            return PreparedPage(None, layout.width, layout.height, layout.rotate, img_path)
+
+        # 转换为RGB模式（如果需要），合成前需要完整解码；
+        # 映射读取的图片不完整解码，缩小后再合成
+        mapped = can_map(img)
+        if img.mode in FLATTEN_MODES and not mapped:
+            trace_decode(tracer, img)
+            with tracer.stage('flatten', img_path, pixels=img.width * img.height):
+                img = flatten_to_rgb(img)
+
+        # 调整图片尺寸以适应纵向A4，并决定是否旋转
+        resized_img, was_rotated = resize_image_for_a4_portrait(img, profile, tracer)
+        if mapped:
+            resized_img = flatten_to_rgb(resized_img)
+
+        # 将PIL图片编码为JPEG
+        with tracer.stage('encode', img_path, pixels=resized_img.width * resized_img.height) as span:
+            img_buffer = io.BytesIO()
+            resized_img.save(img_buffer, format='JPEG', quality=profile.quality)
+            data = img_buffer.getvalue()
+            span.add(bytes_written=len(data))
+        # 放置尺寸与分辨率无关，分辨率越高嵌入的像素越多
+        return PreparedPage(data, layout.width, layout.height, False, None)
+
+
+def prepare_page_traced(img_path, jpeg_passthrough=True, profile=None):
+    """
+    在子进程中执行 prepare_page 并记录各阶段
+    :return: (PreparedPage, 记录列表)，记录由主进程的 Tracer.merge 合并
+    """
+    tracer = Tracer()
+    page = prepare_page(img_path, jpeg_passthrough, profile, tracer)
+    return page, tracer.events
+
+
+def resolve_workers(workers):
+    """将workers参数转换为实际进程数，0或None表示使用全部CPU核心"""
+    if not workers or workers < 0:
+        return os.cpu_count() or 1
+    return workers
+
+
+def iter_prepared_pages(image_paths, workers=1, jpeg_passthrough=True, profile=None, tracer=NULL_TRACER):
+    """
+    按原顺序逐页产出处理结果
+    workers大于1时使用进程池并行处理，同时在途的任务数有上限，内存占用不随图片数量增长
+    :param tracer: tracing.Tracer，子进程中的记录随结果返回并合并到其中
+    :return: 生成器，产出 (路径, PreparedPage或None, 异常或None)
+    """
+    workers = resolve_workers(workers)
+    if workers == 1 or len(image_paths) < 2:
+        for img_path in image_paths:
+            try:
+                yield img_path, prepare_page(img_path, jpeg_passthrough, profile, tracer), None
+            except Exception as e:
+                yield img_path, None, e
+        return
+
+    # Tracer不能传入子进程，子进程各自记录后随结果返回
+    task = prepare_page_traced if tracer.enabled else prepare_page
+    workers = min(workers, len(image_paths))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        remaining = iter(image_paths)
+        pending = deque()
+        for img_path in itertools.islice(remaining, workers * 2):
+            pending.append((img_path, pool.submit(task, img_path, jpeg_passthrough, profile)))
+
+        try:
+            while pending:
+                img_path, future = pending.popleft()
+                # 取走一个结果就补充一个任务，保持进程池满载
+                next_path = next(remaining, None)
+                if next_path is not None:
+                    pending.append((next_path, pool.submit(task, next_path, jpeg_passthrough, profile)))
+                try:
+                    page = future.result()
+                except Exception as e:
+                    yield img_path, None, e
+                    continue
+                if tracer.enabled:
+                    page, events = page
+                    tracer.merge(events)
+                yield img_path, page, None
+        finally:
+            # 调用方提前结束（如取消）时，丢弃还没开始执行的任务
+            for _, future in pending:
+                future.cancel()
+
+
+def draw_page(c, page):
+    """将处理好的页面居中绘制到当前页"""
+    a4_width, a4_height = A4
+
+    # 确保页面是纵向A4（可能前面的页面改变了页面尺寸）
+    c.setPageSize(A4)
+
+    # 计算居中位置
+    x = (a4_width - page.width) / 2
+    y = (a4_height - page.height) / 2
+
+    # 直通的JPEG以文件名传给ReportLab，原样嵌入且无需解码
+    image = page.source if page.data is None else ImageReader(io.BytesIO(page.data))
+
+    if page.rotate:
+        # 平移到右下角后逆时针旋转坐标系，效果等同于 img.rotate(90, expand=True)
+        c.saveState()
+        c.translate(x + page.width, y)
+        c.rotate(90)
+        c.drawImage(image, 0, 0, width=page.height, height=page.width)
+        c.restoreState()
+    else:
+        c.drawImage(image, x, y, width=page.width, height=page.height)
+
+
+def write_page(writer, page):
+    """将处理好的页面居中写入流式PDF"""
+    a4_width, a4_height = A4
+
+    # 计算居中位置
+    x = (a4_width - page.width) / 2
+    y = (a4_height - page.height) / 2
+
+    jpeg = page.source if page.data is None else page.data
+    writer.add_jpeg_page(jpeg, x, y, page.width, page.height, page.rotate)
+
+
+def page_bytes(page):
+    """页面中嵌入的图片数据大小"""
+    return len(page.data) if page.data is not None else os.path.getsize(page.source)
+
+
+def report_error(img_path, error):
+    """默认的单张图片错误处理：输出到控制台"""
+    print(f"处理图片 {img_path} 时出错: {error}")
+
+
+def check_cancelled(cancel_event):
+    """若已请求取消则抛出 ConversionCancelled"""
+    if cancel_event is not None and cancel_event.is_set():
+        raise ConversionCancelled()
+
+
+def convert_images_to_pdf(image_paths, output_path, workers=1, jpeg_passthrough=True, profile=None,
+                          streaming=False, progress=None, on_error=report_error, cancel_event=None,
+                          tracer=NULL_TRACER):
+    """
+    将图片转换为PDF，所有页面都是纵向A4
+    :param image_paths: 按页面顺序排列的图片路径
+    :param output_path: 输出PDF路径
+    :param workers: 并行处理图片的进程数，1为串行，0表示使用全部CPU核心
+    :param jpeg_passthrough: 无需缩小的JPEG是否直接嵌入原始数据
+    :param profile: RenderProfile，默认 DEFAULT_PROFILE
+    :param streaming: 是否逐页写入磁盘，内存占用不随页数增长
+    :param progress: 每处理完一页调用一次 progress(已完成页数, 总页数, 图片路径)
+    :param on_error: 单张图片出错时调用 on_error(图片路径, 异常)，之后继续处理其他图片
+    :param cancel_event: threading.Event等带is_set()的对象，置位后抛出 ConversionCancelled，
+                         且不会留下写了一半的输出文件
+    :param tracer: tracing.Tracer，记录每张图片的解码、缩放、编码和写入，以及PDF的保存
+    :return: 处理失败的图片列表 [(路径, 异常), ...]
+    """
+    if streaming:
+        return _convert_streaming(image_paths, output_path, workers, jpeg_passthrough, profile,
+                                  progress, on_error, cancel_event, tracer)
+
+    errors = []
+    c = canvas.Canvas(output_path, pagesize=A4)
+
+    # 处理每张图片
+    pages = iter_prepared_pages(image_paths, workers, jpeg_passthrough, profile, tracer)
+    try:
+        for i, (img_path, page, error) in enumerate(pages):
+            check_cancelled(cancel_event)
+
+            if error is None:
+                # 在PDF中绘制图片
+                with tracer.stage('draw', img_path, bytes_written=page_bytes(page)):
+                    draw_page(c, page)
+            else:
+                errors.append((img_path, error))
+                tracer.error(img_path, error)
+                if on_error:
+                    on_error(img_path, error)
+
+            # 添加新页面（除了最后一张图片），即使某张图片出错，也继续处理其他图片
+            if i < len(image_paths) - 1:
+                c.showPage()
+
+            if progress:
+                progress(i + 1, len(image_paths), img_path)
+    finally:
+        # 提前退出时停止尚未开始的后台任务
+        pages.close()
+
+    # 保存PDF，ReportLab到这里才写文件，取消时不会留下输出
+    with tracer.stage('save', output_path) as span:
+        c.save()
+        span.add(bytes_written=os.path.getsize(output_path))
+    return errors
+
+
+def _convert_streaming(image_paths, output_path, workers, jpeg_passthrough, profile,
+                       progress, on_error, cancel_event, tracer):
+    """convert_images_to_pdf的流式实现，每页处理完立即写入磁盘"""
+    errors = []
+    pages = iter_prepared_pages(image_paths, workers, jpeg_passthrough, profile, tracer)
+    try:
+        # 出错或取消时写入器会删除临时文件
+        with StreamingPDFWriter(output_path, A4) as writer:
+            for i, (img_path, page, error) in enumerate(pages):
+                check_cancelled(cancel_event)
+
+                if error is None:
+                    with tracer.stage('write', img_path, bytes_written=page_bytes(page)):
+                        write_page(writer, page)
+                else:
+                    errors.append((img_path, error))
+                    tracer.error(img_path, error)
+                    if on_error:
+                        on_error(img_path, error)
+                    # 出错的图片保留一个空白页，页码与图片一一对应
+                    writer.add_blank_page()
+
+                if progress:
+                    progress(i + 1, len(image_paths), img_path)
+    finally:
+        pages.close()
+    return errors
+
+
+def convert_folder(folder, output_path=None, recursive=False, **options):
+    """
+    将一个文件夹中的图片转换为PDF
+    :param recursive: 是否包含子文件夹中的图片（按相对路径逐级自然排序）
+    :param options: 传给 convert_images_to_pdf 的参数
+    :return: (输出路径, 页数, 失败列表)
+    """
+    image_paths = get_image_files(folder, recursive)
+    if not image_paths:
+        raise ValueError(f"文件夹 {folder} 中没有找到支持的图片文件")
+
+    if output_path is None:
+        output_path = default_output_path(folder)
+
+    errors = convert_images_to_pdf(image_paths, output_path, **options)
+    return output_path, len(image_paths), errors
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="将图片文件夹转换为纵向A4的PDF（无界面）")
+    parser.add_argument("folders", nargs="+", help="图片文件夹，可指定多个")
+    parser.add_argument("-r", "--recursive", action="store_true", help="包含子文件夹中的图片")
+    parser.add_argument("-o", "--output-dir",
+                        help="PDF输出目录（默认保存在各文件夹内，与文件夹同名；文件夹重名时加上级目录名作前缀）")
+    parser.add_argument("-j", "--workers", type=int, default=1,
+                        help="并行处理图片的进程数，0表示使用全部CPU核心（默认1）")
+    parser.add_argument("--reencode", action="store_true",
+                        help="所有图片都重新编码，不直接嵌入原始JPEG数据")
+    parser.add_argument("--dpi", type=int, default=DEFAULT_PROFILE.dpi,
+                        help=f"页面图片的目标分辨率（默认{DEFAULT_PROFILE.dpi}）")
+    parser.add_argument("--resample", choices=list(RESAMPLE_FILTERS), default=DEFAULT_PROFILE.resample,
+                        help=f"缩放滤镜（默认{DEFAULT_PROFILE.resample}）")
+    parser.add_argument("--quality", type=int, default=DEFAULT_PROFILE.quality,
+                        help=f"重新编码的JPEG质量（默认{DEFAULT_PROFILE.quality}）")
+    parser.add_argument("--no-draft", action="store_true",
+                        help="完整解码后再缩放，不在解码阶段粗缩小")
+    parser.add_argument("--stream", action="store_true",
+                        help="逐页写入磁盘，处理超大文件夹时内存占用保持不变")
+    parser.add_argument("-v", "--verbose", action="store_true", help="输出每一页的处理进度")
+    parser.add_argument("--trace", help="输出各阶段的耗时汇总，并把Chrome trace写到该文件")
+    args = parser.parse_args(argv)
+
+    profile = RenderProfile(args.dpi, args.resample, args.quality, not args.no_draft)
+
+    progress = None
+    if args.verbose:
+        def progress(done, total, img_path):
+            print(f"[{done}/{total}] {img_path}")
+
+    if args.output_dir:
+        os.makedirs(args.output_dir, exist_ok=True)
+
+    # 输出到同一目录时，同名文件夹（如 a/scans 和 b/scans）的PDF不能互相覆盖
+    names = output_names(args.folders) if args.output_dir else [None] * len(args.folders)
+
+    tracer = Tracer() if args.trace else NULL_TRACER
+    failed = 0
+    for folder, name in zip(args.folders, names):
+        if not os.path.isdir(folder):
+            print(f"跳过 {folder}: 不是文件夹", file=sys.stderr)
+            failed += 1
+            continue
+
+        output_path = None
+        if args.output_dir:
+            output_path = os.path.join(args.output_dir, f"{name}.pdf")
+
+        try:
+            output_path, count, errors = convert_folder(
+                folder, output_path, args.recursive, workers=args.workers, jpeg_passthrough=not args.reencode,
+                profile=profile, streaming=args.stream, progress=progress, tracer=tracer)
+        except Exception as e:
+            print(f"转换 {folder} 时出错: {e}", file=sys.stderr)
+            failed += 1
+            continue
+
+        print(f"{output_path}: {count} 页，{len(errors)} 张图片出错")
+        if errors:
+            failed += 1
+
+    if args.trace:
+        print(tracer.format_summary())
+        tracer.write_chrome_trace(args.trace)
+        print(f"Chrome trace已保存到 {args.trace}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    sys.exit(main())
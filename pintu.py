@@ -1,54 +1,33 @@
 import os
+import queue
+import threading
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
 from PIL import Image, ImageTk
-import re
-import math
+from thumbnails import load_thumbnail
+from thumbgrid import ThumbnailGrid
+import collage
+import export
+import tracing
 
-class DraggableLabel(tk.Label):
-    def __init__(self, parent, image_path, image_obj, grid_row, grid_col, app, **kwargs):
-        super().__init__(parent, **kwargs)
-        self.image_path = image_path
-        self.image_obj = image_obj
-        self.grid_row = grid_row  # 网格行号
-        self.grid_col = grid_col  # 网格列号
-        self.app = app  # 应用程序引用
-        self.original_parent = parent  # 原始父容器
-        
-        self.bind("<Button-1>", self.on_click)
-        self.bind("<B1-Motion>", self.on_drag)
-        self.bind("<ButtonRelease-1>", self.on_release)
-        
-        self._drag_start_x = 0
-        self._drag_start_y = 0
-        self.is_dragging = False
-        
-    def on_click(self, event):
-        self._drag_start_x = event.x
-        self._drag_start_y = event.y
-        self.is_dragging = True
-        self.lift()  # 将标签置于顶层
-        
-    def on_drag(self, event):
-        if not self.is_dragging:
-            return
-            
-        # 计算新位置
-        x = self.winfo_x() + event.x - self._drag_start_x
-        y = self.winfo_y() + event.y - self._drag_start_y
-        
-        # 更新位置
-        self.place(x=x, y=y)
-        
-    def on_release(self, event):
-        if not self.is_dragging:
-            return
-            
-        self.is_dragging = False
-        
-        # 检查是否拖拽到了另一个网格单元上
-        if self.app.grid_window and self.app.grid_window.winfo_exists():
-            self.app.handle_drop(self, event.x_root, event.y_root)
+# 预览窗口中拼图的最大尺寸
+PREVIEW_SIZE = collage.PREVIEW_SIZE
+# 输出文件类型
+OUTPUT_FILETYPES = [
+    ("JPEG files", "*.jpg"),
+    ("PNG files", "*.png"),
+    ("WebP files", "*.webp"),
+    ("TIFF files", "*.tif *.tiff"),
+    ("All files", "*.*"),
+]
+# 轮询后台生成结果的间隔（毫秒）
+POLL_INTERVAL = 100
+# 完整尺寸拼图的单元格缓存上限，超过后按LRU淘汰，再次保存时被淘汰的单元格重新解码
+TILE_CACHE_BYTES = 256 * 1024 * 1024
+# 网格布局窗口中单元格的边长和间距
+GRID_CELL_SIZE = 100
+GRID_GAP = 4
+GRID_PITCH = GRID_CELL_SIZE + GRID_GAP
 
 class PuzzleApp:
     def __init__(self, root):
@@ -57,246 +36,84 @@ class PuzzleApp:
         self.root.geometry("1000x700")
         
         self.output_file = tk.StringVar()
+        self.export_preset = tk.StringVar(value=export.DEFAULT_PRESET)
         self.rows = tk.IntVar(value=2)
         self.cols = tk.IntVar(value=2)
         self.border = tk.IntVar(value=0)
         self.keep_aspect_ratio = tk.BooleanVar(value=True)
         self.resize_mode = tk.StringVar(value="scale")  # scale, crop
         self.image_paths = []
-        self.preview_images = []
+        self.preview_grid = None  # 缩略图区域
         self.puzzle_image = None
         self.puzzle_photo = None
-        self.draggable_labels = []  # 存储所有可拖拽标签
-        self.grid_cells = []  # 存储所有网格单元
+        self.grid_canvas = None  # 网格布局画布
+        self.grid_shape = (0, 0)  # 网格布局窗口的行列数
+        self.grid_items = []  # 每个单元格中图片或文字的画布项目
+        self.drag_item = None  # 正在拖拽的画布项目
+        self.drag_last = (0, 0)  # 拖拽时上一次的鼠标位置（画布坐标）
+        self.grid_photos = {}  # 网格缩略图的PhotoImage池：路径 -> PhotoImage，出错为None
         self.grid_window = None
         self.ordered_image_paths = []  # 存储重新排序后的图片路径
         
+        # 完整尺寸拼图的后台生成状态，只在保存时生成；
+        # 画布和单元格在多次保存之间保留，网格布局中交换图片后再保存只重贴变化的单元格，
+        # 图片列表或行列数等布局参数变化、关闭程序时释放
+        self.puzzle_job = None  # 最近一次预览的参数，保存时按同样的参数生成完整尺寸的拼图
+        self.render_results = queue.Queue()
+        # 设置了 PIC_TOOLS_TRACE 时记录预览、生成和保存的各阶段
+        self.tracer = tracing.tracer_from_env()
+        self.puzzle_renderer = collage.IncrementalCollage(workers=0, cache=collage.TileCache(TILE_CACHE_BYTES),
+                                                          tracer=self.tracer)
+        self.render_generation = 0  # 每次预览加一，用于丢弃过期的结果
+        self.rendering = False
+        self.release_requested = False  # 生成过程中请求的释放，生成结束后执行
+        self.save_window = None  # 保存后要关闭的预览窗口
+        
         # 绑定行列数变化事件
         self.rows.trace('w', self.on_grid_change)
         self.cols.trace('w', self.on_grid_change)
         
         self.create_widgets()
+        self.root.protocol("WM_DELETE_WINDOW", self.exit_app)
         
     def natural_sort_key(self, text):
         """自然排序键函数"""
-        return [int(c) if c.isdigit() else c.lower() for c in re.split(r'(\d+)', text)]
+        return collage.natural_sort_key(text)
     
     def get_image_files(self, file_paths):
         """获取并排序图片文件"""
-        supported_formats = ('.png', '.jpg', '.jpeg', '.bmp', '.gif', '.tiff')
-        files = [f for f in file_paths if f.lower().endswith(supported_formats)]
-        files.sort(key=self.natural_sort_key)
-        return files
+        return collage.get_image_files(file_paths)
     
     def resize_image(self, img, target_size, resize_mode="scale", keep_aspect_ratio=True):
-        """
-        调整单张图片尺寸
-        :param img: PIL Image对象
-        :param target_size: 目标尺寸 (width, height)
-        :param resize_mode: 调整模式 ("scale", "crop")
-        :param keep_aspect_ratio: 是否保持纵横比
-        :return: 调整后的图片
-        """
-        if resize_mode == "scale":
-            # 缩放模式
-            img_copy = img.copy()
-            if keep_aspect_ratio:
-                # 保持纵横比缩放
-                img_copy.thumbnail(target_size, Image.Resampling.LANCZOS)
-            else:
-                # 拉伸填充整个目标区域
-                img_copy = img_copy.resize(target_size, Image.Resampling.LANCZOS)
-            return img_copy
-        elif resize_mode == "crop":
-            # 裁剪模式：居中裁剪并缩放到目标尺寸，忽略keep_aspect_ratio设置
-            img_copy = img.copy()
-            img_ratio = img_copy.width / img_copy.height
-            target_ratio = target_size[0] / target_size[1]
-            
-            if img_ratio > target_ratio:
-                # 图片更宽，裁剪左右
-                new_height = img_copy.height
-                new_width = int(new_height * target_ratio)
-                left = (img_copy.width - new_width) // 2
-                top = 0
-                right = left + new_width
-                bottom = new_height
-            else:
-                # 图片更高，裁剪上下
-                new_width = img_copy.width
-                new_height = int(new_width / target_ratio)
-                left = 0
-                top = (img_copy.height - new_height) // 2
-                right = new_width
-                bottom = top + new_height
-                
-            img_copy = img_copy.crop((left, top, right, bottom))
-            img_copy = img_copy.resize(target_size, Image.Resampling.LANCZOS)
-            return img_copy
-        else:
-            # 默认缩放模式
-            img_copy = img.copy()
-            if keep_aspect_ratio:
-                img_copy.thumbnail(target_size, Image.Resampling.LANCZOS)
-            else:
-                img_copy = img_copy.resize(target_size, Image.Resampling.LANCZOS)
-            return img_copy
+        """调整单张图片尺寸"""
+        return collage.resize_image(img, target_size, resize_mode, keep_aspect_ratio)
+    
+    def prepare_cell(self, img, target_size, resize_mode="scale", keep_aspect_ratio=True):
+        """按调整模式处理单元格中的图片"""
+        return collage.prepare_cell(img, target_size, resize_mode, keep_aspect_ratio)
     
     def resize_images(self, image_paths, target_size, resize_mode="scale"):
         """将所有图片调整为指定尺寸"""
-        resized_images = []
-        keep_aspect_ratio = self.keep_aspect_ratio.get()
-        
-        for img_path in image_paths:
-            try:
-                with Image.open(img_path) as img:
-                    if resize_mode == "scale":
-                        # 缩放模式：创建新图片并居中放置（仅在保持纵横比时）
-                        if keep_aspect_ratio:
-                            new_img = Image.new('RGB', target_size, (255, 255, 255))
-                            resized_img = self.resize_image(img, target_size, resize_mode, keep_aspect_ratio)
-                            # 居中放置
-                            offset = ((target_size[0] - resized_img.size[0]) // 2, 
-                                     (target_size[1] - resized_img.size[1]) // 2)
-                            new_img.paste(resized_img, offset)
-                            resized_images.append(new_img)
-                        else:
-                            # 不保持纵横比时直接拉伸填充
-                            resized_img = self.resize_image(img, target_size, resize_mode, keep_aspect_ratio)
-                            resized_images.append(resized_img)
-                    elif resize_mode == "crop":
-                        # 裁剪模式：直接使用处理后的图片
-                        resized_img = self.resize_image(img, target_size, resize_mode, keep_aspect_ratio)
-                        resized_images.append(resized_img)
-                    else:
-                        # 默认处理
-                        if keep_aspect_ratio:
-                            new_img = Image.new('RGB', target_size, (255, 255, 255))
-                            resized_img = self.resize_image(img, target_size, "scale", keep_aspect_ratio)
-                            offset = ((target_size[0] - resized_img.size[0]) // 2, 
-                                     (target_size[1] - resized_img.size[1]) // 2)
-                            new_img.paste(resized_img, offset)
-                            resized_images.append(new_img)
-                        else:
-                            resized_img = self.resize_image(img, target_size, "scale", keep_aspect_ratio)
-                            resized_images.append(resized_img)
-            except Exception as e:
-                print(f"处理图片 {img_path} 时出错: {e}")
-                # 出错时添加空白图片
-                if resize_mode == "scale" and keep_aspect_ratio:
-                    resized_images.append(Image.new('RGB', target_size, (255, 255, 255)))
-                else:
-                    resized_images.append(Image.new('RGB', target_size, (255, 255, 255)))
-        return resized_images
+        return collage.resize_images(image_paths, target_size, resize_mode, self.keep_aspect_ratio.get())
     
     def create_puzzle(self, image_paths, rows, cols, white_border=0):
-        """创建拼图"""
-        # 获取最大图片尺寸
-        max_width = 0
-        max_height = 0
-        
-        # 先打开所有图片并找出最大尺寸
-        valid_images = []
-        for path in image_paths:
-            try:
-                with Image.open(path) as img:
-                    max_width = max(max_width, img.width)
-                    max_height = max(max_height, img.height)
-                    valid_images.append(path)
-            except Exception as e:
-                print(f"读取图片 {path} 时出错: {e}")
-        
-        # 如果图片数量不足，用空白图片填充
-        total_cells = rows * cols
-        needed_blank = total_cells - len(valid_images)
-        if needed_blank > 0:
-            # 添加空白图片路径占位符
-            for _ in range(needed_blank):
-                valid_images.append(None)
-        
-        # 调整所有图片到统一尺寸
-        target_size = (max_width, max_height)
-        resize_mode = self.resize_mode.get()
-        resized_images = []
-        
-        for img_path in valid_images:
-            if img_path is None:
-                # 添加空白图片
-                if resize_mode == "scale" and self.keep_aspect_ratio.get():
-                    resized_images.append(Image.new('RGB', target_size, (255, 255, 255)))
-                else:
-                    resized_images.append(Image.new('RGB', target_size, (255, 255, 255)))
-            else:
-                try:
-                    with Image.open(img_path) as img:
-                        if resize_mode == "scale":
-                            # 缩放模式
-                            if self.keep_aspect_ratio.get():
-                                # 保持纵横比：创建新图片并居中放置
-                                new_img = Image.new('RGB', target_size, (255, 255, 255))
-                                resized_img = self.resize_image(img, target_size, resize_mode, self.keep_aspect_ratio.get())
-                                # 居中放置
-                                offset = ((target_size[0] - resized_img.size[0]) // 2, 
-                                         (target_size[1] - resized_img.size[1]) // 2)
-                                new_img.paste(resized_img, offset)
-                                resized_images.append(new_img)
-                            else:
-                                # 不保持纵横比：直接拉伸填充
-                                resized_img = self.resize_image(img, target_size, resize_mode, self.keep_aspect_ratio.get())
-                                resized_images.append(resized_img)
-                        elif resize_mode == "crop":
-                            # 裁剪模式：直接使用处理后的图片
-                            resized_img = self.resize_image(img, target_size, resize_mode, self.keep_aspect_ratio.get())
-                            resized_images.append(resized_img)
-                        else:
-                            # 默认处理
-                            if self.keep_aspect_ratio.get():
-                                new_img = Image.new('RGB', target_size, (255, 255, 255))
-                                resized_img = self.resize_image(img, target_size, "scale", self.keep_aspect_ratio.get())
-                                offset = ((target_size[0] - resized_img.size[0]) // 2, 
-                                         (target_size[1] - resized_img.size[1]) // 2)
-                                new_img.paste(resized_img, offset)
-                                resized_images.append(new_img)
-                            else:
-                                resized_img = self.resize_image(img, target_size, "scale", self.keep_aspect_ratio.get())
-                                resized_images.append(resized_img)
-                except Exception as e:
-                    print(f"处理图片 {img_path} 时出错: {e}")
-                    # 出错时添加空白图片
-                    if resize_mode == "scale" and self.keep_aspect_ratio.get():
-                        resized_images.append(Image.new('RGB', target_size, (255, 255, 255)))
-                    else:
-                        resized_images.append(Image.new('RGB', target_size, (255, 255, 255)))
-        
-        # 计算最终拼图尺寸
-        final_width = cols * max_width + (cols + 1) * white_border
-        final_height = rows * max_height + (rows + 1) * white_border
-        
-        # 创建最终的拼图
-        final_image = Image.new('RGB', (final_width, final_height), (255, 255, 255))
-        
-        # 拼接图片
-        for i in range(rows):
-            for j in range(cols):
-                idx = i * cols + j
-                if idx < len(resized_images):
-                    x = j * max_width + (j + 1) * white_border
-                    y = i * max_height + (i + 1) * white_border
-                    final_image.paste(resized_images[idx], (x, y))
-        
-        return final_image
+        """按界面上的调整模式创建拼图"""
+        return collage.create_puzzle(
+            image_paths, rows, cols, white_border,
+            self.resize_mode.get(), self.keep_aspect_ratio.get(), workers=0
+        )
     
     def browse_images(self):
         """选择多个图片文件"""
         files = filedialog.askopenfilenames(
             title="选择图片文件",
             filetypes=[
-                ("图片文件", "*.png *.jpg *.jpeg *.bmp *.gif *.tiff"),
+                ("图片文件", "*.png *.jpg *.jpeg *.bmp *.gif *.tif *.tiff"),
                 ("PNG files", "*.png"),
                 ("JPEG files", "*.jpg *.jpeg"),
                 ("BMP files", "*.bmp"),
                 ("GIF files", "*.gif"),
-                ("TIFF files", "*.tiff"),
+                ("TIFF files", "*.tif *.tiff"),
                 ("All files", "*.*")
             ]
         )
@@ -338,108 +155,85 @@ class PuzzleApp:
         """选择输出文件"""
         file = filedialog.asksaveasfilename(
             defaultextension=".jpg",
-            filetypes=[("JPEG files", "*.jpg"), ("PNG files", "*.png"), ("All files", "*.*")]
+            filetypes=OUTPUT_FILETYPES
         )
         if file:
             self.output_file.set(file)
     
     def load_images(self):
-        """加载并预览图片"""
-        # 清空之前的预览
-        for widget in self.preview_frame.winfo_children():
-            widget.destroy()
-        
-        self.preview_images = []
-        
-        # 显示图片预览
-        if self.image_paths:
-            # 创建列表框显示图片文件名
-            listbox_frame = ttk.Frame(self.preview_frame)
-            listbox_frame.pack(side=tk.LEFT, fill=tk.Y, padx=(0, 10))
-            
-            ttk.Label(listbox_frame, text="已选择的图片:").pack(anchor=tk.W)
-            
-            self.image_listbox = tk.Listbox(listbox_frame, selectmode=tk.EXTENDED, height=15)
-            scrollbar = ttk.Scrollbar(listbox_frame, orient=tk.VERTICAL, command=self.image_listbox.yview)
-            self.image_listbox.configure(yscrollcommand=scrollbar.set)
-            
-            for path in self.image_paths:
-                self.image_listbox.insert(tk.END, os.path.basename(path))
-            
-            self.image_listbox.pack(side=tk.LEFT, fill=tk.Y)
-            scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
-            
-            # 创建按钮框架
-            button_frame = ttk.Frame(listbox_frame)
-            button_frame.pack(fill=tk.X, pady=(5, 0))
-            
-            ttk.Button(button_frame, text="移除选中", command=self.remove_selected_image).pack(side=tk.LEFT, padx=(0, 5))
-            ttk.Button(button_frame, text="清空所有", command=self.clear_all_images).pack(side=tk.LEFT)
-            
-            # 创建预览区域
-            preview_area = ttk.Frame(self.preview_frame)
-            preview_area.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
-            
-            # 创建一个滚动区域来显示预览图
-            canvas = tk.Canvas(preview_area)
-            scrollbar_v = ttk.Scrollbar(preview_area, orient="vertical", command=canvas.yview)
-            scrollable_frame = ttk.Frame(canvas)
-            
-            scrollable_frame.bind(
-                "<Configure>",
-                lambda e: canvas.configure(scrollregion=canvas.bbox("all"))
-            )
-            
-            canvas.create_window((0, 0), window=scrollable_frame, anchor="nw")
-            canvas.configure(yscrollcommand=scrollbar_v.set)
-            
-            # 显示图片
-            for i, path in enumerate(self.image_paths):
-                try:
-                    with Image.open(path) as img:
-                        # 创建缩略图
-                        img_copy = img.copy()
-                        img_copy.thumbnail((100, 100), Image.Resampling.LANCZOS)
-                        photo = ImageTk.PhotoImage(img_copy)
-                        self.preview_images.append(photo)  # 保持引用
-                        
-                        # 创建预览标签
-                        frame = ttk.Frame(scrollable_frame)
-                        frame.grid(row=i//4, column=i%4, padx=5, pady=5)
-                        
-                        label = ttk.Label(frame, image=photo)
-                        label.pack()
-                        
-                        name_label = ttk.Label(frame, text=os.path.basename(path), 
-                                              wraplength=100, justify="center")
-                        name_label.pack()
-                except Exception as e:
-                    print(f"加载预览图 {path} 时出错: {e}")
-            
-            canvas.pack(side="left", fill="both", expand=True)
-            scrollbar_v.pack(side="right", fill="y")
-            
-            # 更新图片数量显示
-            self.image_count_label.config(text=f"已选择 {len(self.image_paths)} 张图片")
+        """
+        加载并预览图片
+        文件名列表和缩略图区域只创建一次，之后只更新内容：
+        缩略图先显示占位框，由后台线程解码，已解码过的图片直接复用
+        """
+        # 图片列表变了，上一次的完整拼图不会再用到
+        self.release_full_render()
+        
+        if not self.image_paths:
+            # 清空之前的预览
+            for widget in self.preview_frame.winfo_children():
+                widget.destroy()
+            self.preview_grid = None
             
-            # 推荐行列数
-            self.recommend_grid()
-        else:
             # 没有图片时显示提示
             no_image_label = ttk.Label(self.preview_frame, text="未选择任何图片，请点击上方按钮添加图片")
             no_image_label.pack(expand=True)
             self.image_count_label.config(text="未选择图片")
+            return
+        
+        if self.preview_grid is None:
+            # 清空之前的提示
+            for widget in self.preview_frame.winfo_children():
+                widget.destroy()
+            self.create_preview_area()
+        
+        # 更新文件名列表
+        self.image_listbox.delete(0, tk.END)
+        for path in self.image_paths:
+            self.image_listbox.insert(tk.END, os.path.basename(path))
+        
+        # 更新缩略图，只有新加入的图片需要解码
+        self.preview_grid.set_paths(self.image_paths)
+        
+        # 更新图片数量显示
+        self.image_count_label.config(text=f"已选择 {len(self.image_paths)} 张图片")
+        
+        # 推荐行列数
+        self.recommend_grid()
+    
+    def create_preview_area(self):
+        """创建文件名列表和缩略图区域"""
+        # 创建列表框显示图片文件名
+        listbox_frame = ttk.Frame(self.preview_frame)
+        listbox_frame.pack(side=tk.LEFT, fill=tk.Y, padx=(0, 10))
+        
+        ttk.Label(listbox_frame, text="已选择的图片:").pack(anchor=tk.W)
+        
+        self.image_listbox = tk.Listbox(listbox_frame, selectmode=tk.EXTENDED, height=15)
+        scrollbar = ttk.Scrollbar(listbox_frame, orient=tk.VERTICAL, command=self.image_listbox.yview)
+        self.image_listbox.configure(yscrollcommand=scrollbar.set)
+        
+        self.image_listbox.pack(side=tk.LEFT, fill=tk.Y)
+        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        
+        # 创建按钮框架
+        button_frame = ttk.Frame(listbox_frame)
+        button_frame.pack(fill=tk.X, pady=(5, 0))
+        
+        ttk.Button(button_frame, text="移除选中", command=self.remove_selected_image).pack(side=tk.LEFT, padx=(0, 5))
+        ttk.Button(button_frame, text="清空所有", command=self.clear_all_images).pack(side=tk.LEFT)
+        
+        # 虚拟化的缩略图网格，只解码可见区域附近的图片，后台生成缩略图
+        self.preview_grid = ThumbnailGrid(self.preview_frame, thumb_size=100, columns=4)
+        self.preview_grid.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
     
     def recommend_grid(self):
         """推荐行列数"""
         if not self.image_paths:
             return
             
-        count = len(self.image_paths)
         # 寻找最接近正方形的行列数
-        sqrt_count = math.sqrt(count)
-        rows = int(math.ceil(sqrt_count))
-        cols = int(math.ceil(count / rows))
+        rows, cols = collage.recommend_grid(len(self.image_paths))
         
         self.rows.set(rows)
         self.cols.set(cols)
@@ -500,16 +294,15 @@ class PuzzleApp:
             self.ordered_image_paths = self.ordered_image_paths[:total_cells]
         
         # 计算网格尺寸
-        cell_width = 100
-        cell_height = 100
-        grid_width = cols * cell_width
-        grid_height = rows * cell_height
+        grid_width = cols * GRID_PITCH + GRID_GAP
+        grid_height = rows * GRID_PITCH + GRID_GAP
         
-        # 创建画布
+        # 整个网格画在同一个画布上
         canvas_frame = ttk.Frame(self.grid_window)
         canvas_frame.pack(fill="both", expand=True, padx=10, pady=10)
         
-        canvas = tk.Canvas(canvas_frame, width=min(grid_width, 700), height=min(grid_height, 500))
+        canvas = tk.Canvas(canvas_frame, width=min(grid_width, 700), height=min(grid_height, 500),
+                           scrollregion=(0, 0, grid_width, grid_height))
         canvas.pack(side="left", fill="both", expand=True)
         
         # 添加滚动条
@@ -520,60 +313,24 @@ class PuzzleApp:
         
         canvas.configure(yscrollcommand=v_scrollbar.set, xscrollcommand=h_scrollbar.set)
         
-        # 创建滚动框架
-        scrollable_frame = ttk.Frame(canvas)
-        canvas_window = canvas.create_window((0, 0), window=scrollable_frame, anchor="nw")
+        # 创建网格单元
+        for idx in range(total_cells):
+            x, y = self.grid_cell_origin(idx, cols)
+            canvas.create_rectangle(x, y, x + GRID_CELL_SIZE, y + GRID_CELL_SIZE, outline="black", fill="white")
         
-        def on_frame_configure(event):
-            canvas.configure(scrollregion=canvas.bbox("all"))
-            
-        def on_canvas_configure(event):
-            canvas.itemconfig(canvas_window, width=event.width)
-            
-        scrollable_frame.bind("<Configure>", on_frame_configure)
-        canvas.bind("<Configure>", on_canvas_configure)
-        
-        # 创建网格
-        self.draggable_labels = []
-        self.grid_cells = []
-        for i in range(rows):
-            row_cells = []
-            for j in range(cols):
-                idx = i * cols + j
-                
-                # 创建网格单元
-                cell_frame = tk.Frame(scrollable_frame, width=cell_width, height=cell_height,
-                                    relief="solid", bd=1, bg="white")
-                cell_frame.grid(row=i, column=j, padx=2, pady=2)
-                cell_frame.grid_propagate(False)
-                cell_frame.row = i  # 记录行号
-                cell_frame.col = j  # 记录列号
-                
-                row_cells.append(cell_frame)
-                
-                if idx < len(self.ordered_image_paths) and self.ordered_image_paths[idx]:
-                    # 显示图片
-                    try:
-                        with Image.open(self.ordered_image_paths[idx]) as img:
-                            img_copy = img.copy()
-                            img_copy.thumbnail((90, 90), Image.Resampling.LANCZOS)
-                            photo = ImageTk.PhotoImage(img_copy)
-                            
-                            label = DraggableLabel(cell_frame, self.ordered_image_paths[idx], photo, 
-                                                 i, j, self, image=photo, bd=0)
-                            label.image = photo  # 保持引用
-                            label.place(relx=0.5, rely=0.5, anchor="center")
-                            self.draggable_labels.append(label)
-                    except Exception as e:
-                        print(f"加载图片时出错: {e}")
-                        placeholder = tk.Label(cell_frame, text="错误", bg="lightgray")
-                        placeholder.place(relx=0.5, rely=0.5, anchor="center")
-                else:
-                    # 显示空位
-                    placeholder = tk.Label(cell_frame, text="空", bg="lightgray")
-                    placeholder.place(relx=0.5, rely=0.5, anchor="center")
-            
-            self.grid_cells.append(row_cells)
+        # 拖拽图片
+        canvas.tag_bind("image", "<Button-1>", self.on_grid_press)
+        canvas.tag_bind("image", "<B1-Motion>", self.on_grid_drag)
+        canvas.tag_bind("image", "<ButtonRelease-1>", self.on_grid_release)
+        
+        self.grid_canvas = canvas
+        self.grid_shape = (rows, cols)
+        self.grid_items = [None] * total_cells
+        self.drag_item = None
+        
+        # 填充网格内容，缩略图从PhotoImage池中取，只在第一次用到时解码
+        current_paths = set(self.ordered_image_paths)
+        self.grid_photos = {path: photo for path, photo in self.grid_photos.items() if path in current_paths}
         
         # 按钮区域
         button_frame = ttk.Frame(self.grid_window)
@@ -581,129 +338,132 @@ class PuzzleApp:
         
         ttk.Button(button_frame, text="关闭", 
                   command=self.grid_window.destroy).pack(side="right", padx=5)
+        
+        # 窗口建好后再填充，加载失败时的提示框才有完整的父窗口
+        self.refresh_grid_display()
+    
+    def grid_cell_origin(self, index, cols):
+        """第 index 个网格单元左上角在画布上的坐标"""
+        row, col = divmod(index, cols)
+        return GRID_GAP + col * GRID_PITCH, GRID_GAP + row * GRID_PITCH
+    
+    def grid_cell_at(self, x, y):
+        """由画布坐标直接算出所在的网格单元，不在任何单元格内时返回None"""
+        rows, cols = self.grid_shape
+        col, dx = divmod(x - GRID_GAP, GRID_PITCH)
+        row, dy = divmod(y - GRID_GAP, GRID_PITCH)
+        if not (0 <= row < rows and 0 <= col < cols and dx < GRID_CELL_SIZE and dy < GRID_CELL_SIZE):
+            return None
+        return int(row) * cols + int(col)
+    
+    def on_grid_press(self, event):
+        """开始拖拽：记录被点击的图片及起点"""
+        canvas = self.grid_canvas
+        self.drag_item = canvas.find_withtag("current")[0]
+        self.drag_last = (canvas.canvasx(event.x), canvas.canvasy(event.y))
+        canvas.tag_raise(self.drag_item)  # 将图片置于顶层
+    
+    def on_grid_drag(self, event):
+        """拖拽中：移动画布项目"""
+        if self.drag_item is None:
+            return
+        x, y = self.grid_canvas.canvasx(event.x), self.grid_canvas.canvasy(event.y)
+        self.grid_canvas.move(self.drag_item, x - self.drag_last[0], y - self.drag_last[1])
+        self.drag_last = (x, y)
+    
+    def on_grid_release(self, event):
+        """结束拖拽：检查是否拖拽到了另一个网格单元上"""
+        if self.drag_item is None:
+            return
+        item, self.drag_item = self.drag_item, None
+        source = self.grid_items.index(item)
+        target = self.grid_cell_at(self.grid_canvas.canvasx(event.x), self.grid_canvas.canvasy(event.y))
+        self.handle_drop(source, target)
     
-    def handle_drop(self, dragged_label, x, y):
-        """处理拖拽释放事件"""
+    def handle_drop(self, source, target):
+        """
+        处理拖拽释放事件
+        :param source: 被拖拽图片所在的单元格索引
+        :param target: 释放位置的单元格索引，不在网格内时为None
+        """
         if not self.grid_window or not self.grid_window.winfo_exists():
             return
         
-        # 查找目标网格单元
-        target_cell = None
-        for row in self.grid_cells:
-            for cell in row:
-                # 获取单元格在屏幕上的位置
-                cell_x = cell.winfo_rootx()
-                cell_y = cell.winfo_rooty()
-                cell_width = cell.winfo_width()
-                cell_height = cell.winfo_height()
-                
-                # 检查是否在目标单元格上
-                if (cell_x <= x <= cell_x + cell_width and 
-                    cell_y <= y <= cell_y + cell_height):
-                    target_cell = cell
-                    break
-            if target_cell:
-                break
-        
-        # 如果找到了目标单元格，且不是当前单元格，则交换
-        if target_cell and target_cell != dragged_label.original_parent:
-            # 找到目标单元格中的标签（如果有的话）
-            target_label = None
-            for label in self.draggable_labels:
-                if label.original_parent == target_cell:
-                    target_label = label
-                    break
-            
-            # 交换两个标签的父容器
-            dragged_current_parent = dragged_label.original_parent
-            if target_label:
-                # 两个单元格都有标签，交换它们
-                dragged_label.original_parent = target_cell
-                target_label.original_parent = dragged_current_parent
-                
-                # 更新标签的网格位置信息
-                dragged_label.grid_row, dragged_label.grid_col = target_cell.row, target_cell.col
-                target_label.grid_row, target_label.grid_col = dragged_current_parent.row, dragged_current_parent.col
-                
-                # 重新放置标签
-                dragged_label.place_forget()
-                dragged_label.place(relx=0.5, rely=0.5, anchor="center")
-                target_label.place_forget()
-                target_label.place(relx=0.5, rely=0.5, anchor="center")
-                
-                # 更新ordered_image_paths
-                dragged_index = dragged_current_parent.row * self.cols.get() + dragged_current_parent.col
-                target_index = target_cell.row * self.cols.get() + target_cell.col
-                self.ordered_image_paths[dragged_index], self.ordered_image_paths[target_index] = \
-                    self.ordered_image_paths[target_index], self.ordered_image_paths[dragged_index]
-                    
-                # 刷新网格界面以反映新的顺序
-                self.refresh_grid_display()
-            else:
-                # 目标单元格是空的，移动标签到目标单元格
-                dragged_label.original_parent = target_cell
-                dragged_label.grid_row, dragged_label.grid_col = target_cell.row, target_cell.col
-                dragged_label.place_forget()
-                dragged_label.place(relx=0.5, rely=0.5, anchor="center")
-                
-                # 更新ordered_image_paths
-                old_index = dragged_current_parent.row * self.cols.get() + dragged_current_parent.col
-                new_index = target_cell.row * self.cols.get() + target_cell.col
-                self.ordered_image_paths[new_index] = self.ordered_image_paths[old_index]
-                self.ordered_image_paths[old_index] = None
-                
-                # 刷新网格界面以反映新的顺序
-                self.refresh_grid_display()
-        else:
+        if target is None or target == source:
             # 没有找到目标单元格或在原单元格释放，回到原位置
-            dragged_label.place_forget()
-            dragged_label.place(relx=0.5, rely=0.5, anchor="center")
+            self.refresh_grid_display([source])
+            return
+        
+        # 交换两个单元格的图片，目标为空位时相当于移动
+        self.ordered_image_paths[source], self.ordered_image_paths[target] = \
+            self.ordered_image_paths[target], self.ordered_image_paths[source]
+        
+        # 只刷新交换的两个单元格
+        self.refresh_grid_display([source, target])
+    
+    def get_grid_photo(self, path, errors=None):
+        """
+        从PhotoImage池中取网格缩略图，没有时解码一次，出错时返回None
+        :param errors: 解码失败时把 (路径, 异常) 追加到这个列表，同一张图片只记录一次
+        """
+        if path not in self.grid_photos:
+            try:
+                self.grid_photos[path] = ImageTk.PhotoImage(load_thumbnail(path, 90))
+            except Exception as e:
+                self.grid_photos[path] = None
+                if errors is not None:
+                    errors.append((path, e))
+        return self.grid_photos[path]
+    
+    def show_grid_errors(self, errors):
+        """用一个提示框列出网格中加载失败的图片"""
+        # 错误较多时只列出前几条
+        max_listed = 10
+        lines = [f"{os.path.basename(path)}: {error}" for path, error in errors[:max_listed]]
+        if len(errors) > max_listed:
+            lines.append(f"……另有 {len(errors) - max_listed} 张")
+        messagebox.showwarning(
+            "警告",
+            f"以下 {len(errors)} 张图片无法加载，网格中显示为“错误”:\n" + "\n".join(lines),
+            parent=self.grid_window
+        )
     
-    def refresh_grid_display(self):
-        """刷新网格显示以反映当前的图片顺序"""
+    def refresh_grid_display(self, indices=None):
+        """
+        刷新网格显示以反映当前的图片顺序
+        :param indices: 需要刷新的单元格索引，默认刷新全部
+        """
         if not self.grid_window or not self.grid_window.winfo_exists():
             return
-            
-        # 清除现有的标签
-        for label in self.draggable_labels:
-            label.destroy()
-        self.draggable_labels = []
-        
-        # 重新创建标签
-        rows = self.rows.get()
-        cols = self.cols.get()
         
-        for i in range(rows):
-            for j in range(cols):
-                idx = i * cols + j
-                cell_frame = self.grid_cells[i][j]
-                
-                # 清除单元格中的现有内容
-                for widget in cell_frame.winfo_children():
-                    widget.destroy()
-                
-                if idx < len(self.ordered_image_paths) and self.ordered_image_paths[idx]:
-                    # 显示图片
-                    try:
-                        with Image.open(self.ordered_image_paths[idx]) as img:
-                            img_copy = img.copy()
-                            img_copy.thumbnail((90, 90), Image.Resampling.LANCZOS)
-                            photo = ImageTk.PhotoImage(img_copy)
-                            
-                            # 创建可拖拽的标签而不是普通标签
-                            label = DraggableLabel(cell_frame, self.ordered_image_paths[idx], photo, 
-                                                 i, j, self, image=photo, bd=0)
-                            label.image = photo  # 保持引用
-                            label.place(relx=0.5, rely=0.5, anchor="center")
-                            self.draggable_labels.append(label)
-                    except Exception as e:
-                        print(f"加载图片时出错: {e}")
-                        placeholder = tk.Label(cell_frame, text="错误", bg="lightgray")
-                        placeholder.place(relx=0.5, rely=0.5, anchor="center")
+        canvas = self.grid_canvas
+        rows, cols = self.grid_shape
+        if indices is None:
+            indices = range(rows * cols)
+        
+        errors = []
+        for idx in indices:
+            # 清除单元格中的现有内容
+            if self.grid_items[idx] is not None:
+                canvas.delete(self.grid_items[idx])
+            
+            x, y = self.grid_cell_origin(idx, cols)
+            center = (x + GRID_CELL_SIZE / 2, y + GRID_CELL_SIZE / 2)
+            path = self.ordered_image_paths[idx] if idx < len(self.ordered_image_paths) else None
+            if path:
+                photo = self.get_grid_photo(path, errors)
+                if photo is not None:
+                    # 显示可拖拽的图片
+                    item = canvas.create_image(*center, image=photo, tags="image")
                 else:
-                    # 显示空位
-                    placeholder = tk.Label(cell_frame, text="空", bg="lightgray")
-                    placeholder.place(relx=0.5, rely=0.5, anchor="center")
+                    item = canvas.create_text(*center, text="错误", fill="gray")
+            else:
+                # 显示空位
+                item = canvas.create_text(*center, text="空", fill="gray")
+            self.grid_items[idx] = item
+        
+        if errors:
+            self.show_grid_errors(errors)
     
     def preview_puzzle(self):
         """预览拼图"""
@@ -723,24 +483,103 @@ class PuzzleApp:
             # 使用重新排序的图片路径创建拼图（如果网格布局窗口打开过）
             image_paths_to_use = self.ordered_image_paths if self.ordered_image_paths and len(self.ordered_image_paths) == len(self.image_paths) else self.image_paths
             
-            # 创建拼图
-            self.puzzle_image = self.create_puzzle(
-                image_paths_to_use, 
-                rows, 
-                cols, 
-                self.border.get()
-            )
+            # 记录本次拼图的参数，完整尺寸的拼图按同样的参数生成
+            job = (list(image_paths_to_use), rows, cols, self.border.get(),
+                   self.resize_mode.get(), self.keep_aspect_ratio.get())
+            
+            # 直接以屏幕分辨率生成预览，不创建完整尺寸的画布
+            preview_image = collage.create_preview(*job, max_size=PREVIEW_SIZE, workers=0, tracer=self.tracer)
+            
+            # 完整尺寸的拼图在保存时才生成；行列数、白边或调整模式变了，旧的画布和单元格不会再用到
+            if self.puzzle_job is not None and self.puzzle_job[1:] != job[1:]:
+                self.release_full_render()
+            self.puzzle_job = job
             
             # 创建预览窗口
-            self.show_preview_window()
+            self.show_preview_window(preview_image)
             
         except Exception as e:
             messagebox.showerror("错误", f"创建拼图预览时出错: {str(e)}")
     
-    def show_preview_window(self):
-        """显示预览窗口"""
-        if self.puzzle_image is None:
+    def start_full_render(self, job, output_path, preset):
+        """在后台线程中生成完整尺寸的拼图并编码保存，界面线程只显示结果"""
+        self.puzzle_image = None
+        self.render_generation += 1
+        self.rendering = True
+        threading.Thread(
+            target=self.run_full_render, args=(self.render_generation, job, output_path, preset), daemon=True
+        ).start()
+        self.root.after(POLL_INTERVAL, self.poll_full_render)
+    
+    def run_full_render(self, generation, job, output_path, preset):
+        """
+        后台线程：生成完整尺寸的拼图并按预设写入输出文件，通过队列把进度和结果发回界面线程
+        拼图增量更新，网格布局中交换图片后只重贴变化的单元格；
+        较慢的预设（如 small 的PNG/TIFF）编码也在这里进行，不阻塞界面
+        """
+        try:
+            image = self.puzzle_renderer.render(*job)
+        except Exception as e:
+            self.render_results.put((generation, "failed", f"创建拼图时出错: {str(e)}"))
+            return
+        self.render_results.put((generation, "encoding", None))
+        try:
+            # 画布属于 puzzle_renderer，在同一线程中编码，不会被下一次生成同时修改
+            result = export.export_image(image, output_path, preset, tracer=self.tracer)
+            tracing.save_env_trace(self.tracer)
+        except Exception as e:
+            self.render_results.put((generation, "failed", f"保存拼图时出错: {str(e)}"))
+            return
+        self.render_results.put((generation, "done", result))
+    
+    def poll_full_render(self):
+        """界面线程：处理后台线程发来的消息，过期的结果（已重新预览）直接丢弃"""
+        while True:
+            try:
+                generation, kind, value = self.render_results.get_nowait()
+            except queue.Empty:
+                break
+            if generation != self.render_generation:
+                continue
+            
+            save_window = self.save_window
+            if kind == "encoding":
+                if save_window is not None and save_window.winfo_exists():
+                    save_window.save_button.config(text="正在保存...")
+                continue
+            
+            self.rendering = False
+            self.save_window = None
+            if kind == "failed":
+                messagebox.showerror("错误", value)
+            else:
+                self.show_save_result(value, save_window)
+            if save_window is not None and save_window.winfo_exists():
+                save_window.save_button.config(text="保存拼图", state="normal")
+            
+            if self.release_requested:
+                self.release_full_render()
+        
+        if self.rendering:
+            self.root.after(POLL_INTERVAL, self.poll_full_render)
+    
+    def release_full_render(self):
+        """释放完整尺寸的画布和单元格缓存；正在后台生成时等生成结束后再释放"""
+        self.puzzle_image = None
+        if self.rendering:
+            self.release_requested = True
             return
+        self.release_requested = False
+        self.puzzle_renderer.release()
+    
+    def show_preview_window(self, preview_image=None):
+        """显示预览窗口"""
+        if preview_image is None:
+            if self.puzzle_image is None:
+                return
+            # 将拼图调整为适合预览的尺寸
+            preview_image = self.puzzle_image.copy()
+            preview_image.thumbnail(PREVIEW_SIZE, Image.Resampling.LANCZOS)
         
         # 创建预览窗口
         preview_window = tk.Toplevel(self.root)
@@ -755,11 +594,6 @@ class PuzzleApp:
         
         canvas.configure(yscrollcommand=scrollbar_y.set, xscrollcommand=scrollbar_x.set)
         
-        # 将拼图调整为适合预览的尺寸
-        preview_image = self.puzzle_image.copy()
-        max_preview_size = (700, 500)
-        preview_image.thumbnail(max_preview_size, Image.Resampling.LANCZOS)
-        
         # 创建PhotoImage
         self.puzzle_photo = ImageTk.PhotoImage(preview_image)
         
@@ -775,40 +609,49 @@ class PuzzleApp:
         # 保存按钮
         save_button = ttk.Button(preview_window, text="保存拼图", command=lambda: self.save_puzzle(preview_window))
         save_button.pack(side="bottom", pady=10)
+        preview_window.save_button = save_button
     
     def save_puzzle(self, preview_window=None):
         """保存拼图"""
-        if self.puzzle_image is None:
+        if self.puzzle_job is None:
             messagebox.showerror("错误", "请先生成拼图预览")
             return
+        if self.rendering:
+            # 正在为上一次保存生成拼图
+            return
         
         # 如果没有设置输出文件，弹出文件选择对话框
         if not self.output_file.get():
             file = filedialog.asksaveasfilename(
                 defaultextension=".jpg",
-                filetypes=[("JPEG files", "*.jpg"), ("PNG files", "*.png"), ("All files", "*.*")]
+                filetypes=OUTPUT_FILETYPES
             )
             if file:
                 self.output_file.set(file)
             else:
                 return
         
-        try:
-            # 保存拼图
-            self.puzzle_image.save(self.output_file.get())
-            messagebox.showinfo("成功", f"拼图已保存到: {self.output_file.get()}")
-            
-            # 关闭预览窗口（如果存在）
-            if preview_window:
-                preview_window.destroy()
-                
-        except Exception as e:
-            messagebox.showerror("错误", f"保存拼图时出错: {str(e)}")
+        # 在后台生成完整尺寸的拼图并保存
+        self.save_window = preview_window
+        if preview_window is not None:
+            preview_window.save_button.config(text="正在生成完整拼图...", state="disabled")
+        self.start_full_render(self.puzzle_job, self.output_file.get(), self.export_preset.get())
+    
+    def show_save_result(self, result, preview_window=None):
+        """保存完成后显示结果，并关闭预览窗口（如果存在）"""
+        messagebox.showinfo("成功", f"拼图已保存到: {result.path}\n{export.describe_export(result)}")
+        if preview_window and preview_window.winfo_exists():
+            preview_window.destroy()
     
     def generate_puzzle(self):
         """生成拼图并预览"""
         self.preview_puzzle()
     
+    def exit_app(self):
+        """关闭程序，先释放完整尺寸的拼图"""
+        self.release_full_render()
+        self.root.destroy()
+    
     def create_widgets(self):
         """创建界面控件"""
         # 主框架
@@ -839,6 +682,9 @@ class PuzzleApp:
             row=0, column=0, sticky=(tk.W, tk.E), padx=(0, 5)
         )
         ttk.Button(output_frame, text="浏览...", command=self.browse_output).grid(row=0, column=1)
+        ttk.Label(output_frame, text="导出预设:").grid(row=0, column=2, padx=(10, 5))
+        ttk.Combobox(output_frame, textvariable=self.export_preset, values=list(export.PRESETS),
+                     state="readonly", width=10).grid(row=0, column=3)
         
         # 参数设置
         params_frame = ttk.LabelFrame(main_frame, text="拼图参数", padding="10")
@@ -0,0 +1,241 @@
+"""
+分条带并行压缩的PNG写入器
+
+图片按从上到下的条带逐条写入，每个条带在线程池中独立滤波并压缩为原始deflate数据，
+以同步刷新（Z_SYNC_FLUSH）结尾，按字节对齐后依次拼接就是一个完整的deflate流，
+zlib校验和（adler32）由各条带的结果合并得到。zlib在压缩时释放GIL，多个条带可以同时压缩。
+条带可以边生成边写入，内存中只保留正在压缩的几个条带。
+写入过程中输出到临时文件，完成后才替换为目标文件。
+"""
+import os
+import zlib
+import struct
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image, ImageChops
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+# 支持的模式 -> (PNG颜色类型, 每像素字节数)
+PNG_MODES = {'L': (0, 1), 'RGB': (2, 3), 'RGBA': (6, 4)}
+
+# PNG行滤波方式 -> 滤波类型字节
+PNG_FILTERS = {'none': 0, 'sub': 1, 'up': 2}
+
+# 单个条带的目标大小（未压缩字节数）
+BAND_BYTES = 4 * 1024 * 1024
+
+# 单个IDAT块的最大长度
+MAX_CHUNK = 1 << 30
+
+ADLER_BASE = 65521
+
+
+def adler32_combine(adler1, adler2, len2):
+    """合并两段数据的adler32校验和（与zlib的adler32_combine相同）"""
+    rem = len2 % ADLER_BASE
+    sum1 = adler1 & 0xffff
+    sum2 = (rem * sum1) % ADLER_BASE
+    sum1 += (adler2 & 0xffff) + ADLER_BASE - 1
+    sum2 += ((adler1 >> 16) & 0xffff) + ((adler2 >> 16) & 0xffff) + ADLER_BASE - rem
+    sum1 %= ADLER_BASE
+    sum2 %= ADLER_BASE
+    return sum1 | (sum2 << 16)
+
+
+def zlib_header(level):
+    """按压缩级别生成zlib流头（FLEVEL只是提示，不影响解压）"""
+    if level < 2:
+        flevel = 0
+    elif level < 6:
+        flevel = 1
+    elif level == 6:
+        flevel = 2
+    else:
+        flevel = 3
+    cmf = 0x78
+    flg = flevel << 6
+    flg += 31 - ((cmf << 8) + flg) % 31
+    return bytes((cmf, flg))
+
+
+def band_height_for(width, mode):
+    """按 BAND_BYTES 计算条带行数"""
+    stride = width * PNG_MODES[mode][1]
+    return max(1, BAND_BYTES // max(1, stride))
+
+
+def iter_bands(img, band_height=None):
+    """把整张图片按从上到下的条带逐条产出"""
+    band_height = band_height or band_height_for(img.width, img.mode)
+    for top in range(0, img.height, band_height):
+        yield img.crop((0, top, img.width, min(img.height, top + band_height)))
+
+
+def filter_band(band, prev_row, png_filter):
+    """
+    对条带做PNG行滤波，返回每行前面带有滤波类型字节的原始数据
+    :param prev_row: 上一条带的最后一行（高度为1的图片），第一个条带为None
+    """
+    width, height = band.size
+    if png_filter == 'sub':
+        # 左边一个像素，最左列以0补齐
+        filtered = ImageChops.subtract_modulo(band, band.crop((-1, 0, width - 1, height)))
+    elif png_filter == 'up':
+        # 上面一行，第一行以0补齐
+        above = Image.new(band.mode, band.size)
+        if prev_row is not None:
+            above.paste(prev_row, (0, 0))
+        above.paste(band.crop((0, 0, width, height - 1)), (0, 1))
+        filtered = ImageChops.subtract_modulo(band, above)
+    else:
+        filtered = band
+
+    data = filtered.tobytes()
+    stride = len(data) // height
+    out = bytearray((stride + 1) * height)
+    view = memoryview(data)
+    filter_type = PNG_FILTERS[png_filter]
+    for row in range(height):
+        start = row * (stride + 1)
+        out[start] = filter_type
+        out[start + 1:start + 1 + stride] = view[row * stride:(row + 1) * stride]
+    return bytes(out)
+
+
+def encode_band(band, prev_row, level, png_filter):
+    """
+    滤波并压缩一个条带
+    :return: (以同步刷新结尾的原始deflate数据, 未压缩数据的adler32, 未压缩数据长度)
+    """
+    raw = filter_band(band, prev_row, png_filter)
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+    data = compressor.compress(raw) + compressor.flush(zlib.Z_SYNC_FLUSH)
+    return data, zlib.adler32(raw), len(raw)
+
+
+class StripedPNGWriter:
+    def __init__(self, path, size, mode='RGB', compress_level=6, png_filter='up', workers=1):
+        """
+        :param size: 图片尺寸 (width, height)，写入的条带行数之和必须等于height
+        :param mode: 'L'、'RGB' 或 'RGBA'
+        :param compress_level: zlib压缩级别 0-9
+        :param png_filter: 行滤波方式 'none'、'sub' 或 'up'
+        :param workers: 并行压缩的线程数，0表示使用全部CPU核心
+        """
+        if mode not in PNG_MODES:
+            raise ValueError(f"不支持的PNG模式: {mode}")
+        if png_filter not in PNG_FILTERS:
+            raise ValueError(f"不支持的PNG滤波方式: {png_filter}")
+
+        self.path = path
+        self.size = size
+        self.mode = mode
+        self.compress_level = compress_level
+        self.png_filter = png_filter
+        self.temp_path = path + '.part'
+        self.rows_written = 0
+        self.bytes_written = 0
+
+        workers = workers or os.cpu_count() or 1
+        self._pool = ThreadPoolExecutor(max_workers=workers) if workers > 1 else None
+        self._max_pending = workers * 2
+        self._pending = deque()
+        self._prev_row = None
+        self._adler = 1
+        self._fh = open(self.temp_path, 'wb')
+
+        color_type = PNG_MODES[mode][0]
+        self._fh.write(PNG_SIGNATURE)
+        self._write_chunk(b'IHDR', struct.pack('>IIBBBBB', size[0], size[1], 8, color_type, 0, 0, 0))
+        self._write_chunk(b'IDAT', zlib_header(compress_level))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    def _write_chunk(self, chunk_type, data):
+        self._fh.write(struct.pack('>I', len(data)))
+        self._fh.write(chunk_type)
+        self._fh.write(data)
+        self._fh.write(struct.pack('>I', zlib.crc32(data, zlib.crc32(chunk_type))))
+        self.bytes_written += len(data) + 12
+
+    def _write_result(self, result):
+        """按顺序写入一个已压缩的条带"""
+        data, adler, length = result
+        self._adler = adler32_combine(self._adler, adler, length)
+        for start in range(0, len(data), MAX_CHUNK):
+            self._write_chunk(b'IDAT', data[start:start + MAX_CHUNK])
+
+    def write_band(self, band):
+        """写入下一个条带（宽度与图片相同，高度任意），条带必须按从上到下的顺序写入"""
+        if band.size[0] != self.size[0]:
+            raise ValueError("条带宽度与图片宽度不一致")
+        if self.rows_written + band.size[1] > self.size[1]:
+            raise ValueError("写入的行数超过了图片高度")
+        if band.mode != self.mode:
+            band = band.convert(self.mode)
+
+        args = (band, self._prev_row, self.compress_level, self.png_filter)
+        self._prev_row = band.crop((0, band.size[1] - 1, band.size[0], band.size[1]))
+        self.rows_written += band.size[1]
+
+        if self._pool is None:
+            self._write_result(encode_band(*args))
+            return
+
+        self._pending.append(self._pool.submit(encode_band, *args))
+        # 在途的条带数有上限，内存占用与图片高度无关
+        while len(self._pending) > self._max_pending:
+            self._write_result(self._pending.popleft().result())
+
+    def write_image(self, img, band_height=None):
+        """把整张图片分条带写入"""
+        for band in iter_bands(img, band_height):
+            self.write_band(band)
+
+    def close(self):
+        """写入剩余条带、deflate结束块和校验和，并将临时文件替换为目标文件"""
+        try:
+            while self._pending:
+                self._write_result(self._pending.popleft().result())
+            if self.rows_written != self.size[1]:
+                raise ValueError(f"写入了 {self.rows_written} 行，图片高度为 {self.size[1]}")
+            # 空的最终块，各条带都以同步刷新结尾，可以直接拼接
+            final_block = zlib.compressobj(self.compress_level, zlib.DEFLATED, -15).flush(zlib.Z_FINISH)
+            self._write_chunk(b'IDAT', final_block + struct.pack('>I', self._adler))
+            self._write_chunk(b'IEND', b'')
+        except Exception:
+            self.abort()
+            raise
+
+        self._shutdown()
+        self._fh.close()
+        os.replace(self.temp_path, self.path)
+
+    def abort(self):
+        """放弃写入，删除临时文件"""
+        for future in self._pending:
+            future.cancel()
+        self._pending.clear()
+        self._shutdown()
+        self._fh.close()
+        if os.path.exists(self.temp_path):
+            os.remove(self.temp_path)
+
+    def _shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=True)
+            self._pool = None
+
+
+def save_png(img, path, compress_level=6, png_filter='up', workers=1, band_height=None):
+    """用分条带并行压缩保存整张图片"""
+    with StripedPNGWriter(path, img.size, img.mode, compress_level, png_filter, workers) as writer:
+        writer.write_image(img, band_height)
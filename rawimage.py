@@ -0,0 +1,209 @@
+"""
+未压缩光栅图片（BMP、未压缩的TIFF）的内存映射读取和分条带缩放
+
+这类文件的像素按行（或按块）原样存放在文件中，Pillow的 tile 信息给出了每个条带或块的
+文件偏移、行字节数和行顺序。文件被映射到内存后按行读取一个条带，缩放后贴入输出图片，
+再读取下一个条带，峰值内存只与输出图片和一个条带的大小有关，与原图大小无关。
+
+每个条带在上下多读滤镜半径的行，由 resize 的 box 参数指定该条带对应的输出行在条带中的精确区域，
+拼接后与整张图片一次缩放的结果相同（只有浮点舍入的差别）。缩小倍数较大时条带先用 Image.reduce 粗缩小，
+与 resize 的 reducing_gap 效果相同。
+"""
+import math
+import mmap
+from PIL import Image
+
+# 单个条带读取的目标大小（未压缩字节数）
+BAND_BYTES = 8 * 1024 * 1024
+
+# 像素数据不小于该大小时才使用内存映射，小图片直接完整解码更快
+MAP_MIN_BYTES = 32 * 1024 * 1024
+
+# 支持的原始数据格式 -> 每像素位数
+RAW_BITS = {
+    '1': 1, 'L': 8, 'P': 8, 'LA': 16,
+    'RGB': 24, 'BGR': 24, 'RGBX': 32, 'BGRX': 32, 'RGBA': 32, 'BGRA': 32, 'CMYK': 32,
+}
+
+# 图片模式 -> 条带缩放前转换成的模式，调色板和二值图片需要转换后才能用滤镜缩放
+BAND_MODES = {'1': 'L', 'P': 'RGB', 'CMYK': 'RGB'}
+
+# 缩小倍数较大时先用 Image.reduce 把条带缩小到不小于目标尺寸的该倍数，与 resize 的 reducing_gap 相同
+REDUCING_GAP = 2
+
+# 重采样滤镜的半径（缩小时乘以缩小倍数）
+FILTER_SUPPORT = {
+    Image.Resampling.NEAREST: 0,
+    Image.Resampling.BOX: 0.5,
+    Image.Resampling.BILINEAR: 1,
+    Image.Resampling.HAMMING: 1,
+    Image.Resampling.BICUBIC: 2,
+    Image.Resampling.LANCZOS: 3,
+}
+
+
+def raw_tiles(img):
+    """
+    尚未解码的图片的原始数据块 [(范围, 文件偏移, 原始格式, 行字节数, 行顺序), ...]
+    图片已解码、有压缩或格式不支持时返回None
+    """
+    tiles = getattr(img, 'tile', None)
+    if not tiles or img.mode not in ('1', 'L', 'P', 'LA', 'RGB', 'RGBA', 'CMYK'):
+        return None
+
+    result = []
+    area = 0
+    for tile in tiles:
+        codec, extents, offset, args = tile[:4]
+        if codec != 'raw' or not isinstance(args, tuple) or len(args) != 3:
+            return None
+        rawmode, stride, orientation = args
+        if rawmode not in RAW_BITS or orientation not in (1, -1):
+            return None
+        left, top, right, bottom = extents
+        if not stride:
+            stride = (RAW_BITS[rawmode] * (right - left) + 7) // 8
+        result.append((extents, offset, rawmode, stride, orientation))
+        area += (right - left) * (bottom - top)
+
+    # 分平面存储（每个颜色通道一层）的TIFF各层范围重叠，不支持
+    if area != img.width * img.height:
+        return None
+    return result
+
+
+def can_map(img):
+    """图片是否是可以内存映射读取的未压缩大图"""
+    if not getattr(img, 'filename', None):
+        return False
+    tiles = raw_tiles(img)
+    if tiles is None:
+        return False
+    data_bytes = sum(stride * (extents[3] - extents[1]) for extents, _, _, stride, _ in tiles)
+    return data_bytes >= MAP_MIN_BYTES
+
+
+class MappedImage:
+    """
+    内存映射的未压缩图片，按行读取条带
+    条带的模式为 band_mode：调色板图片转换为RGB（有透明色时为RGBA），二值图片转换为L，CMYK转换为RGB
+    """
+
+    def __init__(self, img):
+        self.tiles = raw_tiles(img)
+        if self.tiles is None:
+            raise ValueError(f"{img.filename} 不是未压缩的图片，不能映射读取")
+        self.size = img.size
+        self.mode = img.mode
+        self.info = dict(img.info)
+        # 调色板 (原始格式, 数据)，读取文件头时Pillow保存的是未转换的原始调色板
+        self.palette = img.palette.getdata() if img.mode == 'P' and img.palette else None
+        band_mode = BAND_MODES.get(img.mode, img.mode)
+        if img.mode == 'P' and 'transparency' in self.info:
+            band_mode = 'RGBA'
+        self.band_mode = band_mode
+
+        self._fh = open(img.filename, 'rb')
+        try:
+            self._map = mmap.mmap(self._fh.fileno(), 0, access=mmap.ACCESS_READ)
+        except Exception:
+            self._fh.close()
+            raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def close(self):
+        self._map.close()
+        self._fh.close()
+
+    def read_rows(self, top, bottom):
+        """读取 [top, bottom) 行，返回模式为 band_mode 的图片"""
+        width = self.size[0]
+        size = (width, bottom - top)
+        band = None
+        with memoryview(self._map) as view:
+            for (left, tile_top, right, tile_bottom), offset, rawmode, stride, orientation in self.tiles:
+                first, last = max(top, tile_top), min(bottom, tile_bottom)
+                if first >= last:
+                    continue
+                # 块内的行号，BMP等自下而上存放的图片行顺序相反
+                start, end = first - tile_top, last - tile_top
+                if orientation < 0:
+                    height = tile_bottom - tile_top
+                    start, end = height - end, height - start
+                # 直接从映射的内存解码，不复制原始数据
+                data = view[offset + start * stride:offset + end * stride]
+                piece = Image.frombytes(self.mode, (right - left, last - first), data,
+                                        'raw', rawmode, stride, orientation)
+                data.release()
+                if piece.size == size:
+                    # 整个条带都在同一块中（BMP和单条带的TIFF），不需要拼接
+                    band = piece
+                    continue
+                if band is None:
+                    band = Image.new(self.mode, size)
+                band.paste(piece, (left, first - top))
+        self._release()
+
+        if self.palette is not None:
+            rawmode, data = self.palette
+            band.putpalette(data, rawmode)
+            if 'transparency' in self.info:
+                band.info['transparency'] = self.info['transparency']
+        if band.mode != self.band_mode:
+            band = band.convert(self.band_mode)
+        return band
+
+    def _release(self):
+        """读过的页面不再计入本进程的内存占用（文件内容仍在系统的页缓存中）"""
+        if hasattr(self._map, 'madvise') and hasattr(mmap, 'MADV_DONTNEED'):
+            self._map.madvise(mmap.MADV_DONTNEED)
+
+
+def resize_mapped(img, size, box=None, resample=Image.Resampling.LANCZOS, reducing_gap=REDUCING_GAP):
+    """
+    分条带缩放未压缩的图片，相当于 img.resize(size, resample, box=box, reducing_gap=reducing_gap)，
+    原图不会被完整读入内存
+    :param img: 刚 Image.open 且 can_map 为真的图片
+    :param box: 原图中要缩放的区域 (left, top, right, bottom)，默认整张图片
+    :param reducing_gap: 先用 Image.reduce 粗缩小，None表示只用滤镜缩放（结果与整张缩放只有浮点舍入的差别）
+    :return: 缩放后的图片，模式见 MappedImage.band_mode
+    """
+    width, height = size
+    left, top, right, bottom = box or (0, 0) + img.size
+    scale_x = (right - left) / width
+    scale_y = (bottom - top) / height
+
+    # 粗缩小的倍数，条带的起止行对齐到倍数，各条带的像素块与整张图片粗缩小时一致
+    factor_x = factor_y = 1
+    if reducing_gap:
+        factor_x = max(1, int(scale_x / reducing_gap))
+        factor_y = max(1, int(scale_y / reducing_gap))
+    # 滤镜在原图中覆盖的行数
+    support = FILTER_SUPPORT.get(resample, 3) * max(scale_y / factor_y, 1) * factor_y
+
+    with MappedImage(img) as mapped:
+        row_bytes = mapped.size[0] * len(Image.new(mapped.band_mode, (1, 1)).getbands())
+        # 每个条带输出的行数，使读取的原图条带约为 BAND_BYTES
+        out_rows = max(1, int(BAND_BYTES / row_bytes / max(scale_y, 1)))
+
+        result = Image.new(mapped.band_mode, size)
+        for out_top in range(0, height, out_rows):
+            out_bottom = min(height, out_top + out_rows)
+            src_top = top + out_top * scale_y
+            src_bottom = top + out_bottom * scale_y
+            # 上下多读滤镜半径的行，条带边缘的像素与整张缩放时使用相同的输入
+            first = max(0, (math.floor(src_top - support) - factor_y) // factor_y * factor_y)
+            last = min(mapped.size[1], -(-(math.ceil(src_bottom + support) + factor_y) // factor_y) * factor_y)
+            band = mapped.read_rows(first, last)
+            if factor_x > 1 or factor_y > 1:
+                band = band.reduce((factor_x, factor_y))
+            part = band.resize((width, out_bottom - out_top), resample,
+                               box=(left / factor_x, (src_top - first) / factor_y,
+                                    right / factor_x, (src_bottom - first) / factor_y))
+            result.paste(part, (0, out_top))
+    return result
@@ -0,0 +1,373 @@
+"""
+图片文件夹的递归扫描及持久化索引，不依赖tkinter
+
+用 os.scandir 遍历文件夹及其子文件夹，每次扫描都重新列出每个文件夹并取得每个文件的大小和修改时间
+（Windows下scandir已带有这些信息，不需要额外的系统调用），原地改写的文件也能发现。
+文件夹本身的修改时间只在增删、改名文件时变化，原地改写文件时不变，所以不能凭它跳过逐个stat；
+再次扫描省下的是文件头的读取和文件名的排序。
+每个文件夹的结果（文件名、大小、修改时间，以及可选的图片尺寸等文件头信息）保存为一个索引文件，
+再次扫描时大小和修改时间都没变的文件沿用索引中的文件头信息，不再读取文件。
+
+索引中的文件按自然顺序保存，子文件夹记录插入的位置；文件名集合没有变化时直接沿用索引中的顺序，
+不需要计算排序键。每个条目带有其在结果中的序号，按大小、时间等重新排序时序号作为名称顺序，
+不需要再比较文件名。
+
+索引只用于递归扫描和命令行；图形界面打开单个文件夹时用 list_images 直接列出并排序，
+不stat文件，也不在缓存目录中留下文件。
+索引文件的总大小超过上限时按最近使用时间淘汰（LRU），与缩略图缓存相同。
+
+用法:
+    python scanner.py 文件夹 [-r] [--probe] [--sort name|size|mtime|pixels]
+"""
+import os
+import re
+import sys
+import json
+import time
+import bisect
+import hashlib
+import argparse
+import threading
+from collections import namedtuple
+from cachedir import user_cache_dir, evict_oldest
+from imageprobe import ImageInfo, probe_image
+
+SUPPORTED_FORMATS = ('.png', '.jpg', '.jpeg', '.bmp', '.gif', '.tif', '.tiff')
+
+# 索引文件格式的版本，格式改变时加一，旧索引自动失效
+INDEX_VERSION = 1
+
+# 索引文件的默认总大小上限（字节），每个文件约占几十字节
+DEFAULT_MAX_BYTES = 50 * 1024 * 1024
+
+# path: 文件路径（以扫描的文件夹为前缀）
+# relpath: 相对扫描文件夹的路径
+# size: 文件大小
+# mtime_ns: 修改时间（纳秒）
+# info: imageprobe.ImageInfo，未探测或无法读取时为None
+# sort_key: 在按相对路径逐级自然排序的扫描结果中的序号
+ScanEntry = namedtuple('ScanEntry', ['path', 'relpath', 'size', 'mtime_ns', 'info', 'sort_key'])
+
+# dirs: 列出的文件夹数
+# dirs_sorted: 文件名有变化、需要重新排序的文件夹数
+# files_stat: stat的文件数
+# files_probed: 读取文件头的文件数
+ScanStats = namedtuple('ScanStats', ['dirs', 'dirs_sorted', 'files_stat', 'files_probed'])
+
+
+def natural_sort_key(text):
+    """自然排序键函数"""
+    return [int(c) if c.isdigit() else c.lower() for c in re.split(r'(\d+)', text)]
+
+
+def _pixels(entry):
+    return entry.info.width * entry.info.height if entry.info else -1
+
+
+# 排序方式 -> 键函数，名称相同时按名称排序
+SORT_KEYS = {
+    'name': lambda entry: entry.sort_key,
+    'size': lambda entry: (entry.size, entry.sort_key),
+    'mtime': lambda entry: (entry.mtime_ns, entry.sort_key),
+    'pixels': lambda entry: (_pixels(entry), entry.sort_key),
+}
+
+
+def sort_entries(entries, by='name', reverse=False):
+    """按 SORT_KEYS 中的方式排序，排序键已在条目中，不需要读取文件或重新计算"""
+    if by not in SORT_KEYS:
+        raise ValueError(f"不支持的排序方式: {by}")
+    return sorted(entries, key=SORT_KEYS[by], reverse=reverse)
+
+
+class FolderIndex:
+    """
+    一个文件夹（不含子文件夹内容）的索引
+    files: {文件名: [大小, 修改时间, 文件头信息]}，按文件名自然排序；
+           文件头信息为 ImageInfo、None（未探测）或 False（无法读取）
+    dirs: [[子文件夹名, 排在它前面的文件数], ...]，按名称自然排序
+    """
+
+    __slots__ = ('folder', 'files', 'dirs')
+
+    def __init__(self, folder, files, dirs):
+        self.folder = folder
+        self.files = files
+        self.dirs = dirs
+
+    def to_json(self):
+        files = {name: [size, mtime_ns, list(info) if info else info]
+                 for name, (size, mtime_ns, info) in self.files.items()}
+        return {'version': INDEX_VERSION, 'folder': self.folder, 'files': files, 'dirs': self.dirs}
+
+    @classmethod
+    def from_json(cls, data):
+        if data.get('version') != INDEX_VERSION:
+            return None
+        files = {name: [size, mtime_ns, ImageInfo(*info) if info else info]
+                 for name, (size, mtime_ns, info) in data['files'].items()}
+        return cls(data['folder'], files, data['dirs'])
+
+
+class Scanner:
+    def __init__(self, directory=None, extensions=SUPPORTED_FORMATS, persist=True, max_bytes=DEFAULT_MAX_BYTES):
+        """
+        :param directory: 索引文件的保存位置，默认为缓存目录下的 scan
+        :param extensions: 收录的扩展名（小写）
+        :param persist: 是否把索引保存到磁盘，否则只在本进程内复用
+        :param max_bytes: 索引文件的总大小上限，超过后删除最久未用的索引
+        """
+        self.directory = directory
+        self.extensions = tuple(extensions)
+        self.persist = persist
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        # 上次检查后新写入的字节数，累积到上限的1/10时检查一次总大小
+        self.written_bytes = 0
+        self.folders = {}  # 绝对路径 -> FolderIndex，本进程内复用，不必每次读取索引文件
+        self.dirs = self.dirs_sorted = self.files_stat = self.files_probed = 0
+
+    @property
+    def stats(self):
+        return ScanStats(self.dirs, self.dirs_sorted, self.files_stat, self.files_probed)
+
+    def index_path(self, folder):
+        # 文件名由文件夹的绝对路径计算，大量文件夹的索引放在同一个目录中
+        if self.directory is None:
+            self.directory = user_cache_dir("scan")
+        digest = hashlib.sha1(folder.encode('utf-8', 'surrogateescape')).hexdigest()
+        return os.path.join(self.directory, digest + '.json')
+
+    def scan(self, folder, recursive=False, probe=False):
+        """
+        扫描文件夹中的图片
+        :param recursive: 是否包含所有子文件夹
+        :param probe: 是否读取文件头，在条目中填入尺寸等信息（大小和修改时间没变的沿用索引，不再读取）
+        :return: 按相对路径自然排序的 ScanEntry 列表
+        """
+        entries = []
+        self._scan(folder, '', recursive, probe, entries)
+        return entries
+
+    def _scan(self, folder, prefix, recursive, probe, entries):
+        """按索引中的顺序产出文件，遇到子文件夹插入的位置就先递归扫描子文件夹"""
+        index = self.load_index(folder, probe)
+        if index is None:
+            return
+        base = os.path.join(folder, '')
+        files = list(index.files.items())
+        done = 0
+        for name, position in (index.dirs if recursive else []) + [(None, len(files))]:
+            for file_name, (size, mtime_ns, info) in files[done:position]:
+                entries.append(ScanEntry(base + file_name, prefix + file_name, size, mtime_ns, info or None,
+                                         len(entries)))
+            done = position
+            if name is not None:
+                self._scan(base + name, prefix + name + os.sep, recursive, probe, entries)
+
+    def load_index(self, folder, probe=False):
+        """
+        重新列出文件夹并与上次的索引比较，返回最新的索引；文件夹不存在或无法读取时返回None
+        """
+        key = os.path.abspath(folder)
+        with self.lock:
+            old = self.folders.get(key)
+        if old is None and self.persist:
+            old = self.read_index(key)
+
+        try:
+            index, changed = self._list(folder, key, old)
+        except OSError:
+            return None
+        if probe and self._probe_missing(folder, index):
+            changed = True
+
+        with self.lock:
+            self.folders[key] = index
+        if changed and self.persist:
+            self.write_index(key, index)
+        return index
+
+    def _list(self, folder, key, old):
+        """
+        用 os.scandir 列出文件夹并取得每个文件的大小和修改时间，
+        两者都没变的文件沿用旧索引中的文件头信息，文件名集合没变时沿用旧索引中的顺序
+        :return: (FolderIndex, 与旧索引相比是否有变化)
+        """
+        old_files = old.files if old is not None else {}
+        files = {}
+        dirs = []
+        changed = old is None
+        with os.scandir(folder) as it:
+            for entry in it:
+                try:
+                    # 不跟随指向文件夹的符号链接，避免循环
+                    if entry.is_dir(follow_symlinks=False):
+                        dirs.append(entry.name)
+                        continue
+                    if not entry.name.lower().endswith(self.extensions) or not entry.is_file():
+                        continue
+                    # Windows下scandir已带有大小和修改时间，不需要额外的系统调用
+                    entry_stat = entry.stat()
+                except OSError:
+                    continue
+                self.files_stat += 1
+                info = None
+                previous = old_files.get(entry.name)
+                if previous and previous[0] == entry_stat.st_size and previous[1] == entry_stat.st_mtime_ns:
+                    info = previous[2]
+                else:
+                    changed = True
+                files[entry.name] = [entry_stat.st_size, entry_stat.st_mtime_ns, info]
+        self.dirs += 1
+
+        if (old is not None and files.keys() == old_files.keys()
+                and sorted(dirs) == sorted(name for name, _ in old.dirs)):
+            # 文件名集合不变，沿用旧的顺序
+            return FolderIndex(key, {name: files[name] for name in old_files}, old.dirs), changed
+
+        # 子文件夹按名称插入文件之间
+        self.dirs_sorted += 1
+        ordered = sorted((natural_sort_key(name), name) for name in files)
+        file_keys = [name_key for name_key, _ in ordered]
+        dirs = [[name, bisect.bisect_right(file_keys, name_key)]
+                for name_key, name in sorted((natural_sort_key(name), name) for name in dirs)]
+        return FolderIndex(key, {name: files[name] for _, name in ordered}, dirs), True
+
+    def _probe_missing(self, folder, index):
+        """读取尚未探测的文件的文件头，返回是否有新的探测结果"""
+        changed = False
+        for name, item in index.files.items():
+            if item[2] is not None:
+                continue
+            try:
+                item[2] = probe_image(os.path.join(folder, name))
+            except Exception:
+                item[2] = False
+            self.files_probed += 1
+            changed = True
+        return changed
+
+    def read_index(self, key):
+        """读取索引文件，不存在、损坏或版本不符时返回None；命中时更新修改时间，淘汰时按它排序"""
+        path = self.index_path(key)
+        try:
+            with open(path, encoding='utf-8') as f:
+                index = FolderIndex.from_json(json.load(f))
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+        # 哈希冲突时路径不同
+        if index is None or index.folder != key:
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return index
+
+    def write_index(self, key, index):
+        """先写临时文件再替换，多个进程同时扫描也不会读到半个文件"""
+        try:
+            path = self.index_path(key)
+            os.makedirs(self.directory, exist_ok=True)
+        except OSError:
+            return
+        temp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(temp, 'w', encoding='utf-8') as f:
+                json.dump(index.to_json(), f, ensure_ascii=False, separators=(',', ':'))
+            os.replace(temp, path)
+            size = os.path.getsize(path)
+        except (OSError, ValueError):
+            # 索引只是加速手段，写入失败（只读目录、磁盘满、无法编码的文件名等）时忽略
+            try:
+                os.remove(temp)
+            except OSError:
+                pass
+            return
+
+        with self.lock:
+            self.written_bytes += size
+            if self.written_bytes < self.max_bytes // 10:
+                return
+            self.written_bytes = 0
+        self.evict()
+
+    def evict(self):
+        """索引文件的总大小超过上限时，按修改时间从旧到新删除，直到降到上限的90%"""
+        entries = []
+        try:
+            with os.scandir(self.directory) as it:
+                for entry in it:
+                    if not entry.name.endswith('.json'):
+                        continue
+                    try:
+                        stat = entry.stat()
+                    except OSError:
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+        except OSError:
+            return
+        evict_oldest(entries, self.max_bytes)
+
+
+_default_scanner = None
+_default_scanner_lock = threading.Lock()
+
+
+def default_scanner():
+    """两个工具共用的扫描器实例"""
+    global _default_scanner
+    with _default_scanner_lock:
+        if _default_scanner is None:
+            _default_scanner = Scanner()
+        return _default_scanner
+
+
+def list_images(folder, extensions=SUPPORTED_FORMATS):
+    """
+    只列出一个文件夹中的图片并按名称自然排序，不stat文件，不读写索引
+    图形界面打开单个文件夹时使用
+    """
+    with os.scandir(folder) as it:
+        names = [entry.name for entry in it if entry.name.lower().endswith(extensions)]
+    names.sort(key=natural_sort_key)
+    return [os.path.join(folder, name) for name in names]
+
+
+def scan_folder(folder, recursive=False, probe=False):
+    """用共用的扫描器扫描文件夹，返回按相对路径自然排序的 ScanEntry 列表"""
+    return default_scanner().scan(folder, recursive, probe)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="扫描图片文件夹并建立索引")
+    parser.add_argument("folder", help="图片文件夹")
+    parser.add_argument("-r", "--recursive", action="store_true", help="包含所有子文件夹")
+    parser.add_argument("--probe", action="store_true", help="读取文件头，在索引中记录图片尺寸")
+    parser.add_argument("--sort", choices=list(SORT_KEYS), default='name', help="排序方式（默认name）")
+    parser.add_argument("--reverse", action="store_true", help="倒序")
+    parser.add_argument("-q", "--quiet", action="store_true", help="只输出统计信息")
+    args = parser.parse_args(argv)
+
+    if not os.path.isdir(args.folder):
+        print(f"{args.folder} 不是文件夹", file=sys.stderr)
+        return 1
+
+    scanner = default_scanner()
+    start = time.perf_counter()
+    entries = scanner.scan(args.folder, args.recursive, args.probe)
+    seconds = time.perf_counter() - start
+
+    if not args.quiet:
+        for entry in sort_entries(entries, args.sort, args.reverse):
+            dims = f"{entry.info.width}x{entry.info.height}" if entry.info else "-"
+            print(f"{entry.size:>12}  {dims:>11}  {entry.relpath}")
+    stats = scanner.stats
+    print(f"{len(entries)} 张图片，用时 {seconds:.3f} 秒；列出 {stats.dirs} 个文件夹，"
+          f"重新排序 {stats.dirs_sorted} 个，stat {stats.files_stat} 个文件，读取文件头 {stats.files_probed} 个")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,37 @@
+"""
+测试共用的设置：模块都在仓库根目录下，缓存目录指向临时目录，不写入用户缓存
+"""
+import os
+import sys
+import pytest
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(autouse=True)
+def cache_dir(tmp_path, monkeypatch):
+    path = tmp_path / "cache"
+    monkeypatch.setenv("PIC_TOOLS_CACHE_DIR", str(path))
+    return path
+
+
+def gradient(size, mode="RGB", seed=0):
+    """生成带渐变和噪声的测试图片，压缩和缩放的结果都不是平凡的"""
+    img = Image.linear_gradient("L").resize(size)
+    noise = Image.effect_noise(size, 40 + seed)
+    bands = {"L": [img], "RGB": [img, noise, img.transpose(Image.Transpose.FLIP_LEFT_RIGHT)]}
+    bands["RGBA"] = bands["RGB"] + [noise.transpose(Image.Transpose.FLIP_TOP_BOTTOM)]
+    return Image.merge(mode, bands[mode])
+
+
+@pytest.fixture
+def image_folder(tmp_path):
+    """不同尺寸、方向和格式的一组图片"""
+    folder = tmp_path / "images"
+    folder.mkdir()
+    specs = [("1.jpg", (800, 600), "RGB"), ("2.png", (300, 900), "RGBA"), ("10.jpg", (1200, 1700), "RGB"),
+             ("3.bmp", (640, 480), "RGB"), ("4.png", (500, 500), "L"), ("5.tif", (2000, 700), "RGB")]
+    for i, (name, size, mode) in enumerate(specs):
+        gradient(size, mode, i).save(folder / name)
+    return folder
@@ -0,0 +1,98 @@
+import pytest
+from PIL import Image, ImageChops
+import collage
+from conftest import gradient
+
+
+def same_pixels(a, b):
+    return a.mode == b.mode and a.size == b.size and ImageChops.difference(a, b).getbbox() is None
+
+
+@pytest.fixture
+def image_paths(image_folder):
+    return collage.get_image_files(sorted(str(path) for path in image_folder.iterdir()))
+
+
+@pytest.mark.parametrize("resize_mode, keep_aspect_ratio", [("scale", True), ("scale", False), ("crop", True)])
+def test_workers_match_serial(image_paths, resize_mode, keep_aspect_ratio):
+    serial = collage.create_puzzle(image_paths, 2, 3, 5, resize_mode, keep_aspect_ratio, workers=1)
+    parallel = collage.create_puzzle(image_paths, 2, 3, 5, resize_mode, keep_aspect_ratio, workers=4)
+    assert same_pixels(serial, parallel)
+
+
+@pytest.mark.parametrize("name", ["out.png", "out.tif"])
+def test_banded_save_matches_create_puzzle(image_paths, tmp_path, name):
+    output = str(tmp_path / name)
+    result = collage.save_puzzle_banded(image_paths, 2, 3, output, white_border=7, workers=2)
+    expected = collage.create_puzzle(image_paths, 2, 3, 7)
+    assert (result.width, result.height) == expected.size
+    with Image.open(output) as saved:
+        assert same_pixels(saved.convert("RGB"), expected)
+
+
+def test_broken_images_reported(image_paths, tmp_path):
+    broken = str(tmp_path / "broken.jpg")
+    with open(broken, "wb") as fh:
+        fh.write(b"not a jpeg")
+    errors = []
+    puzzle = collage.create_puzzle([broken] + image_paths, 2, 4,
+                                   on_error=lambda path, error: errors.append(path))
+    assert errors == [broken]
+    assert puzzle.size == collage.create_puzzle(image_paths, 2, 4).size
+
+
+def test_cache_matches_uncached(image_paths):
+    cache = collage.TileCache()
+    expected = collage.create_puzzle(image_paths, 3, 2, 4)
+    assert same_pixels(collage.create_puzzle(image_paths, 3, 2, 4, cache=cache), expected)
+    assert same_pixels(collage.create_puzzle(image_paths, 3, 2, 4, cache=cache), expected)
+    assert cache.hits == len(image_paths)
+
+
+def test_tile_cache_invalidated_by_edit(tmp_path):
+    path = str(tmp_path / "a.png")
+    gradient((300, 200)).save(path)
+    cache = collage.TileCache()
+    first, _ = cache.load(path, (100, 100))
+    gradient((200, 300), seed=3).save(path)
+    second, _ = cache.load(path, (100, 100))
+    assert cache.misses == 2
+    assert first.size != second.size
+
+
+def test_incremental_follows_edits_and_swaps(image_paths):
+    renderer = collage.IncrementalCollage()
+    paths = list(image_paths)
+    renderer.render(paths, 2, 3, 5)
+
+    # 交换两张图片
+    paths[0], paths[4] = paths[4], paths[0]
+    assert same_pixels(renderer.render(paths, 2, 3, 5).copy(), collage.create_puzzle(paths, 2, 3, 5))
+
+    # 原地修改一张图片（文件名不变，大小变化）
+    gradient((640, 640), seed=9).save(paths[1])
+    assert same_pixels(renderer.render(paths, 2, 3, 5).copy(), collage.create_puzzle(paths, 2, 3, 5))
+
+    renderer.release()
+    assert renderer.tiles.total_bytes == 0
+
+
+def test_incremental_swap_reuses_cells(image_paths):
+    renderer = collage.IncrementalCollage()
+    paths = list(image_paths)
+    renderer.render(paths, 2, 3, 5)
+    misses = renderer.tiles.misses
+    paths[0], paths[4] = paths[4], paths[0]
+    renderer.render(paths, 2, 3, 5)
+    # 交换的两张图片都在缓存中，不需要重新解码
+    assert renderer.tiles.misses == misses and renderer.tiles.hits == 2
+
+
+def test_incremental_within_small_cache_budget(image_paths):
+    # 缓存放不下所有单元格时被淘汰的单元格重新解码，结果不变
+    renderer = collage.IncrementalCollage(cache=collage.TileCache(max_bytes=300 * 1000))
+    paths = list(image_paths)
+    renderer.render(paths, 2, 3, 5)
+    assert renderer.tiles.total_bytes <= 300 * 1000
+    paths[0], paths[4] = paths[4], paths[0]
+    assert same_pixels(renderer.render(paths, 2, 3, 5).copy(), collage.create_puzzle(paths, 2, 3, 5))
@@ -0,0 +1,29 @@
+import os
+from PIL import Image
+import imageprobe
+
+
+def test_probe_reads_header_and_follows_edits(tmp_path):
+    path = str(tmp_path / "a.png")
+    Image.new("RGB", (30, 20)).save(path)
+    assert imageprobe.probe_image(path)[:4] == (30, 20, "RGB", "PNG")
+    before = os.stat(path)
+    Image.new("L", (20, 40)).save(path)
+    os.utime(path, ns=(before.st_atime_ns, before.st_mtime_ns + 10 ** 9))
+    assert imageprobe.probe_image(path)[:3] == (20, 40, "L")
+
+
+def test_cache_is_bounded(tmp_path, monkeypatch):
+    monkeypatch.setattr(imageprobe, "MAX_CACHE_ENTRIES", 3)
+    imageprobe.clear_probe_cache()
+    paths = []
+    for i in range(5):
+        path = str(tmp_path / f"{i}.png")
+        Image.new("RGB", (10 + i, 10)).save(path)
+        paths.append(path)
+        imageprobe.probe_image(path)
+    # 再次使用的文件排到最后，最久未用的先被淘汰
+    imageprobe.probe_image(paths[2])
+    imageprobe.probe_image(paths[0])
+    assert list(imageprobe._cache) == [os.path.abspath(paths[i]) for i in (4, 2, 0)]
+    imageprobe.clear_probe_cache()
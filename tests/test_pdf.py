@@ -0,0 +1,101 @@
+import io
+from PIL import Image
+from pic2pdf_core import (RenderProfile, compute_a4_layout, convert_images_to_pdf, get_image_files,
+                          iter_prepared_pages, main, output_names, prepare_page)
+
+
+def test_workers_match_serial(image_folder, tmp_path):
+    paths = get_image_files(str(image_folder))
+    serial = list(iter_prepared_pages(paths, workers=1))
+    parallel = list(iter_prepared_pages(paths, workers=2))
+    assert [path for path, _, _ in parallel] == paths
+    assert [page for _, page, _ in parallel] == [page for _, page, _ in serial]
+
+    output = tmp_path / "out.pdf"
+    assert convert_images_to_pdf(paths, str(output), workers=2) == []
+    assert output.read_bytes().startswith(b"%PDF")
+
+
+def test_broken_image_keeps_page_order(image_folder, tmp_path):
+    (image_folder / "6.jpg").write_bytes(b"not a jpeg")
+    paths = get_image_files(str(image_folder))
+    errors = []
+    result = convert_images_to_pdf(paths, str(tmp_path / "out.pdf"), workers=2,
+                                   on_error=lambda path, error: errors.append(path))
+    assert [path for path, _ in result] == errors == [str(image_folder / "6.jpg")]
+
+
+def test_jpeg_that_fits_is_embedded_unchanged(tmp_path):
+    path = str(tmp_path / "small.jpg")
+    Image.new("RGB", (400, 300), "white").save(path)
+    page = prepare_page(path)
+    assert page.data is None and page.source == path
+    assert page.rotate and (page.width, page.height) == (300, 400)
+
+    reencoded = prepare_page(path, jpeg_passthrough=False)
+    assert reencoded.source is None and reencoded.data.startswith(b"\xff\xd8")
+
+    # 需要缩小的JPEG和非JPEG文件都重新编码
+    big = str(tmp_path / "big.jpg")
+    Image.new("RGB", (1600, 1200), "white").save(big)
+    assert prepare_page(big).source is None
+    png = str(tmp_path / "small.png")
+    Image.new("RGB", (400, 300), "white").save(png)
+    assert prepare_page(png).source is None
+
+
+def test_streaming_matches_across_workers(image_folder, tmp_path):
+    (image_folder / "6.jpg").write_bytes(b"not a jpeg")
+    paths = get_image_files(str(image_folder))
+    # 流式写入不带时间戳，并行和串行的文件逐字节相同
+    outputs = []
+    for workers in (1, 2):
+        output = tmp_path / f"out{workers}.pdf"
+        errors = convert_images_to_pdf(paths, str(output), workers=workers, streaming=True)
+        assert [path for path, _ in errors] == [str(image_folder / "6.jpg")]
+        outputs.append(output.read_bytes())
+    assert outputs[0] == outputs[1]
+    # 出错的图片保留空白页，页数与图片数相同
+    assert outputs[0].count(b"/Type /Page ") == len(paths)
+    assert f"/Count {len(paths)} ".encode() in outputs[0]
+    assert not list(tmp_path.glob("*.part")) and not list(tmp_path.glob("*.tmp"))
+
+
+def test_layout_dpi_changes_pixels_not_placement():
+    base = compute_a4_layout((2000, 1500))
+    high = compute_a4_layout((2000, 1500), dpi=300)
+    assert base.rotate and high.rotate
+    assert (high.width, high.height) == (base.width, base.height)
+    assert (high.pixel_width, high.pixel_height) == (1500, 2000)
+
+    small = compute_a4_layout((300, 200), dpi=300)
+    assert small.rotate
+    assert (small.width, small.height) == (small.pixel_width, small.pixel_height) == (200, 300)
+
+
+def test_profile_dpi_embeds_more_pixels(tmp_path):
+    path = tmp_path / "a.png"
+    Image.new("RGB", (3000, 4000), "white").save(path)
+    (_, low, _), = iter_prepared_pages([str(path)])
+    (_, high, _), = iter_prepared_pages([str(path)], profile=RenderProfile(dpi=150))
+    assert (low.width, low.height) == (high.width, high.height)
+    with Image.open(io.BytesIO(low.data)) as a, Image.open(io.BytesIO(high.data)) as b:
+        assert b.width > a.width
+
+
+def test_output_names_disambiguate(tmp_path):
+    folders = [str(tmp_path / "a" / "scans"), str(tmp_path / "b" / "scans"), str(tmp_path / "c")]
+    assert output_names(folders) == ["a_scans", "b_scans", "c"]
+    assert output_names([folders[2], folders[2]]) == ["c", "c_2"]
+
+
+def test_cli_output_dir_keeps_same_named_folders_apart(tmp_path):
+    folders = []
+    for parent, size in (("a", (100, 80)), ("b", (80, 100))):
+        folder = tmp_path / parent / "scans"
+        folder.mkdir(parents=True)
+        Image.new("RGB", size, "white").save(folder / "1.png")
+        folders.append(str(folder))
+    output_dir = tmp_path / "out"
+    assert main(folders + ["-o", str(output_dir)]) == 0
+    assert sorted(path.name for path in output_dir.iterdir()) == ["a_scans.pdf", "b_scans.pdf"]
@@ -0,0 +1,71 @@
+import pytest
+from PIL import Image, ImageChops
+import rawimage
+from conftest import gradient
+
+
+@pytest.fixture(autouse=True)
+def small_bands(monkeypatch):
+    # 测试图片很小，降低门槛并缩小条带，保证走映射读取且分成多个条带
+    monkeypatch.setattr(rawimage, "MAP_MIN_BYTES", 1)
+    monkeypatch.setattr(rawimage, "BAND_BYTES", 16 * 1024)
+
+
+def max_difference(a, b):
+    assert a.mode == b.mode and a.size == b.size
+    extrema = ImageChops.difference(a, b).getextrema()
+    if a.mode == "L":
+        extrema = [extrema]
+    return max(high for _, high in extrema)
+
+
+SOURCES = [
+    ("rgb.bmp", "RGB", {}),
+    ("gray.bmp", "L", {}),
+    ("rgb.tif", "RGB", {"rowsperstrip": 17}),
+    ("rgba.tif", "RGBA", {}),
+]
+
+
+@pytest.mark.parametrize("name, mode, options", SOURCES)
+@pytest.mark.parametrize("reducing_gap", [None, 2])
+def test_resize_mapped_matches_resize(tmp_path, name, mode, options, reducing_gap):
+    path = tmp_path / name
+    gradient((611, 397), mode).save(path, **options)
+    with Image.open(path) as img:
+        assert rawimage.can_map(img)
+        mapped = rawimage.resize_mapped(img, (150, 98), reducing_gap=reducing_gap)
+    with Image.open(path) as img:
+        if mode == "RGBA":
+            # Image.resize 对RGBA忽略 reducing_gap，先转为预乘透明度再缩放，才与分条带的粗缩小相当
+            img = img.convert("RGBa")
+        expected = img.resize((150, 98), Image.Resampling.LANCZOS, reducing_gap=reducing_gap).convert(mode)
+    # 条带边界处的浮点舍入不同，预乘透明度的来回转换使误差稍大
+    assert max_difference(mapped, expected) <= (4 if mode == "RGBA" else 1)
+
+
+def test_resize_mapped_box(tmp_path):
+    path = tmp_path / "rgb.bmp"
+    gradient((500, 400)).save(path)
+    box = (50, 30, 450, 330)
+    with Image.open(path) as img:
+        mapped = rawimage.resize_mapped(img, (200, 150), box=box, reducing_gap=None)
+        expected = img.resize((200, 150), Image.Resampling.LANCZOS, box=box)
+    assert max_difference(mapped, expected) <= 1
+
+
+def test_palette_converted_to_rgb(tmp_path):
+    path = tmp_path / "p.bmp"
+    gradient((300, 200)).quantize(64).save(path)
+    with Image.open(path) as img:
+        mapped = rawimage.resize_mapped(img, (100, 66), reducing_gap=None)
+        expected = img.convert("RGB").resize((100, 66), Image.Resampling.LANCZOS)
+    assert mapped.mode == "RGB"
+    assert max_difference(mapped, expected) <= 1
+
+
+def test_compressed_images_are_not_mapped(tmp_path):
+    path = tmp_path / "a.png"
+    gradient((100, 100)).save(path)
+    with Image.open(path) as img:
+        assert not rawimage.can_map(img)
@@ -0,0 +1,110 @@
+import os
+import pytest
+from PIL import Image
+import scanner
+
+
+def make_image(path, size=(20, 10)):
+    Image.new("RGB", size, "white").save(path)
+
+
+@pytest.fixture
+def tree(tmp_path):
+    root = tmp_path / "tree"
+    (root / "sub2").mkdir(parents=True)
+    (root / "sub10").mkdir()
+    for name in ("img10.png", "img2.png", "img1.png"):
+        make_image(root / name)
+    (root / "notes.txt").write_text("x")
+    make_image(root / "sub2" / "a.png")
+    make_image(root / "sub10" / "b.png")
+    return root
+
+
+def relpaths(entries):
+    return [entry.relpath.replace(os.sep, "/") for entry in entries]
+
+
+def rescan(index_dir, folder, probe=True):
+    """用新的扫描器扫描，相当于新进程读取上次保存的索引"""
+    fresh = scanner.Scanner(str(index_dir))
+    return fresh.scan(str(folder), recursive=True, probe=probe), fresh.stats
+
+
+def test_natural_order_with_subfolders(tree, tmp_path):
+    entries, stats = rescan(tmp_path / "index", tree)
+    assert relpaths(entries) == ["img1.png", "img2.png", "img10.png", "sub2/a.png", "sub10/b.png"]
+    assert [entry.sort_key for entry in entries] == list(range(5))
+    assert stats.files_probed == 5
+    assert entries[0].info.width == 20
+
+
+def test_unchanged_rescan_reuses_index(tree, tmp_path):
+    rescan(tmp_path / "index", tree)
+    entries, stats = rescan(tmp_path / "index", tree)
+    assert len(entries) == 5
+    assert stats.dirs == 3 and stats.files_stat == 5
+    assert stats.dirs_sorted == 0 and stats.files_probed == 0
+
+
+def test_rescan_sees_added_and_renamed_files(tree, tmp_path):
+    rescan(tmp_path / "index", tree)
+    make_image(tree / "img3.png")
+    os.rename(tree / "sub10" / "b.png", tree / "sub10" / "c.png")
+    entries, stats = rescan(tmp_path / "index", tree)
+    assert relpaths(entries) == ["img1.png", "img2.png", "img3.png", "img10.png", "sub2/a.png", "sub10/c.png"]
+    assert stats.files_probed == 2
+
+
+def test_rescan_sees_in_place_edits(tree, tmp_path):
+    rescan(tmp_path / "index", tree)
+    target = tree / "img2.png"
+    before = os.stat(target)
+    make_image(target, (40, 30))
+    # 文件系统时间精度较粗时保证修改时间确实变化
+    os.utime(target, ns=(before.st_atime_ns, before.st_mtime_ns + 10 ** 9))
+    entries, stats = rescan(tmp_path / "index", tree)
+    edited = entries[1]
+    assert edited.size == os.path.getsize(target)
+    assert (edited.info.width, edited.info.height) == (40, 30)
+    assert stats.files_probed == 1 and stats.dirs_sorted == 0
+
+
+def test_same_size_edit_detected_by_mtime(tree, tmp_path):
+    index_dir = tmp_path / "index"
+    shared = scanner.Scanner(str(index_dir))
+    # 未压缩的BMP，16x8和8x16的文件大小相同
+    target = tree / "img0.bmp"
+    make_image(target, (16, 8))
+    shared.scan(str(tree), recursive=True, probe=True)
+    before = os.stat(target)
+    make_image(target, (8, 16))
+    os.utime(target, ns=(before.st_atime_ns, before.st_mtime_ns + 10 ** 9))
+    assert os.path.getsize(target) == before.st_size
+    # 同一进程内的扫描器也要重新stat
+    entries = shared.scan(str(tree), recursive=True, probe=True)
+    assert entries[0].relpath == "img0.bmp"
+    assert (entries[0].info.width, entries[0].info.height) == (8, 16)
+
+
+def test_list_images_leaves_no_index(tree, cache_dir):
+    paths = scanner.list_images(str(tree))
+    assert [os.path.basename(path) for path in paths] == ["img1.png", "img2.png", "img10.png"]
+    assert not os.path.exists(cache_dir / "scan")
+
+
+def test_index_files_evicted_over_budget(tmp_path):
+    index_dir = tmp_path / "index"
+    shared = scanner.Scanner(str(index_dir), max_bytes=2000)
+    folders = []
+    for i in range(30):
+        folder = tmp_path / f"folder{i}"
+        folder.mkdir()
+        make_image(folder / "a.png")
+        folders.append(str(folder))
+        shared.scan(str(folder), recursive=True)
+    indexes = list(index_dir.glob("*.json"))
+    assert 0 < len(indexes) < len(folders)
+    assert sum(path.stat().st_size for path in indexes) <= 2000
+    # 最近扫描的文件夹的索引保留
+    assert os.path.exists(shared.index_path(os.path.abspath(folders[-1])))
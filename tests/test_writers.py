@@ -0,0 +1,75 @@
+import pytest
+from PIL import Image, ImageChops
+import png_writer
+import tiff_writer
+from conftest import gradient
+
+
+def same_pixels(a, b):
+    return a.mode == b.mode and a.size == b.size and ImageChops.difference(a, b).getbbox() is None
+
+
+@pytest.mark.parametrize("mode", ["L", "RGB", "RGBA"])
+@pytest.mark.parametrize("png_filter", ["none", "sub", "up"])
+def test_png_round_trip(tmp_path, mode, png_filter):
+    img = gradient((333, 250), mode)
+    path = tmp_path / "out.png"
+    png_writer.save_png(img, str(path), png_filter=png_filter, workers=2, band_height=37)
+    with Image.open(path) as saved:
+        saved.load()
+        assert same_pixels(saved, img)
+
+
+def test_png_bands_written_incrementally(tmp_path):
+    img = gradient((200, 120))
+    path = tmp_path / "out.png"
+    with png_writer.StripedPNGWriter(str(path), img.size, img.mode, workers=2) as writer:
+        for top in range(0, img.height, 50):
+            writer.write_band(img.crop((0, top, img.width, min(top + 50, img.height))))
+    with Image.open(path) as saved:
+        assert same_pixels(saved.convert(img.mode), img)
+
+
+def test_png_abort_leaves_no_file(tmp_path):
+    path = tmp_path / "out.png"
+    with pytest.raises(RuntimeError):
+        with png_writer.StripedPNGWriter(str(path), (10, 10), "RGB") as writer:
+            writer.write_band(Image.new("RGB", (10, 5)))
+            raise RuntimeError("stop")
+    assert list(tmp_path.iterdir()) == []
+
+
+@pytest.mark.parametrize("mode", ["L", "RGB", "RGBA"])
+@pytest.mark.parametrize("compression", ["raw", "tiff_adobe_deflate"])
+def test_tiff_round_trip(tmp_path, mode, compression):
+    img = gradient((300, 200), mode)
+    path = tmp_path / "out.tif"
+    tiff_writer.save_tiff(img, str(path), compression=compression, tile_size=64, workers=2)
+    with Image.open(path) as saved:
+        saved.load()
+        assert same_pixels(saved, img)
+
+
+def test_tiff_pyramid_levels(tmp_path):
+    img = gradient((520, 300))
+    path = tmp_path / "out.tif"
+    tiff_writer.save_tiff(img, str(path), tile_size=128, pyramid=True)
+    with Image.open(path) as saved:
+        assert same_pixels(saved, img)
+        sizes = []
+        for frame in range(saved.n_frames):
+            saved.seek(frame)
+            sizes.append(saved.size)
+            if frame == 1:
+                assert same_pixels(saved.convert("RGB"), img.reduce(2))
+    assert sizes == [(520, 300), (260, 150), (130, 75), (65, 38)]
+
+
+def test_tiff_switches_to_bigtiff(tmp_path, monkeypatch):
+    monkeypatch.setattr(tiff_writer, "CLASSIC_LIMIT", 1024)
+    img = gradient((256, 160))
+    path = tmp_path / "out.tif"
+    tiff_writer.save_tiff(img, str(path), compression="raw", tile_size=64)
+    assert path.read_bytes()[:4] == b"II+\x00"
+    with Image.open(path) as saved:
+        assert same_pixels(saved, img)
@@ -0,0 +1,217 @@
+"""
+虚拟化的缩略图网格控件
+
+所有缩略图画在同一个Canvas上，只为可见区域附近的单元格创建画布项目和PhotoImage，
+缩略图由后台线程解码，界面线程通过 after 轮询取回结果。
+"""
+import os
+import threading
+from collections import OrderedDict, deque
+import tkinter as tk
+from tkinter import ttk
+from PIL import ImageTk
+from thumbnails import load_thumbnail
+
+# 可见区域上下额外预加载的行数
+PRELOAD_ROWS = 2
+# 超出可见区域这么多行的单元格会被释放
+KEEP_ROWS = 6
+# 内存中最多保留的缩略图数量
+MAX_CACHED_THUMBNAILS = 500
+# 轮询后台结果的间隔（毫秒）
+POLL_INTERVAL = 50
+
+
+class ThumbnailGrid(ttk.Frame):
+    def __init__(self, parent, thumb_size=150, columns=5, workers=2, **kwargs):
+        super().__init__(parent, **kwargs)
+        self.thumb_size = thumb_size
+        self.columns = columns
+        self.padding = 5
+        self.label_height = 30
+        self.cell_width = thumb_size + 2 * self.padding
+        self.cell_height = thumb_size + self.label_height + 2 * self.padding
+
+        self.paths = []
+        self.cells = {}  # 索引 -> 画布项目列表
+        self.photos = {}  # 索引 -> PhotoImage（保持引用）
+        self.thumbnails = OrderedDict()  # 路径 -> PIL缩略图或异常，按最近使用排序
+
+        # 后台解码状态，由 self.lock 保护
+        self.lock = threading.Condition()
+        self.pending = deque()
+        self.in_flight = set()
+        self.results = deque()
+        self.closed = False
+        self.poll_scheduled = False
+
+        self.canvas = tk.Canvas(self, highlightthickness=0)
+        self.scrollbar = ttk.Scrollbar(self, orient="vertical", command=self.canvas.yview)
+        self.canvas.configure(yscrollcommand=self.on_scroll)
+        self.canvas.pack(side="left", fill="both", expand=True)
+        self.scrollbar.pack(side="right", fill="y")
+        self.canvas.bind("<Configure>", lambda e: self.update_visible())
+
+        for _ in range(workers):
+            threading.Thread(target=self.decode_worker, daemon=True).start()
+
+    def destroy(self):
+        with self.lock:
+            self.closed = True
+            self.pending.clear()
+            self.lock.notify_all()
+        super().destroy()
+
+    def set_paths(self, paths):
+        """设置要显示的图片，已解码的缩略图会被复用"""
+        self.paths = list(paths)
+        self.canvas.delete("all")
+        self.cells = {}
+        self.photos = {}
+
+        rows = (len(self.paths) + self.columns - 1) // self.columns
+        self.canvas.configure(scrollregion=(0, 0, self.columns * self.cell_width, rows * self.cell_height))
+        self.update_visible()
+
+    def on_scroll(self, first, last):
+        """Canvas视图变化时更新滚动条并刷新可见单元格"""
+        self.scrollbar.set(first, last)
+        self.update_visible()
+
+    def visible_range(self):
+        """返回需要显示的图片索引范围 [start, end)"""
+        top = self.canvas.canvasy(0)
+        bottom = self.canvas.canvasy(self.canvas.winfo_height())
+        first_row = max(0, int(top // self.cell_height) - PRELOAD_ROWS)
+        last_row = int(bottom // self.cell_height) + PRELOAD_ROWS
+        return first_row * self.columns, min(len(self.paths), (last_row + 1) * self.columns)
+
+    def update_visible(self):
+        """为可见区域创建单元格、请求解码，并释放远离可见区域的单元格"""
+        if self.closed:
+            return
+        start, end = self.visible_range()
+
+        keep_start = start - KEEP_ROWS * self.columns
+        keep_end = end + KEEP_ROWS * self.columns
+        for index in list(self.cells):
+            if not keep_start <= index < keep_end:
+                self.remove_cell(index)
+
+        wanted = []
+        for index in range(start, end):
+            if index not in self.cells:
+                self.create_cell(index)
+            if index in self.photos:
+                continue
+            path = self.paths[index]
+            if path in self.thumbnails:
+                self.show_thumbnail(index)
+            else:
+                wanted.append(path)
+
+        with self.lock:
+            # 只解码当前需要的图片，已经滚动过去的请求直接丢弃
+            self.pending = deque(p for p in dict.fromkeys(wanted) if p not in self.in_flight)
+            self.lock.notify_all()
+            busy = bool(self.pending or self.in_flight)
+
+        if busy:
+            self.schedule_poll()
+
+    def cell_origin(self, index):
+        row, col = divmod(index, self.columns)
+        return col * self.cell_width, row * self.cell_height
+
+    def create_cell(self, index):
+        """创建占位框和文件名"""
+        x, y = self.cell_origin(index)
+        pad = self.padding
+        placeholder = self.canvas.create_rectangle(
+            x + pad, y + pad, x + pad + self.thumb_size, y + pad + self.thumb_size,
+            outline="#cccccc", fill="#eeeeee"
+        )
+        name = self.canvas.create_text(
+            x + self.cell_width / 2, y + pad + self.thumb_size + 2,
+            text=os.path.basename(self.paths[index]), width=self.thumb_size,
+            justify="center", anchor="n"
+        )
+        self.cells[index] = [placeholder, name]
+
+    def remove_cell(self, index):
+        for item in self.cells.pop(index):
+            self.canvas.delete(item)
+        self.photos.pop(index, None)
+
+    def show_thumbnail(self, index):
+        """用已解码的缩略图替换占位框"""
+        path = self.paths[index]
+        thumbnail = self.thumbnails[path]
+        self.thumbnails.move_to_end(path)
+        placeholder = self.cells[index][0]
+
+        x, y = self.cell_origin(index)
+        center_x = x + self.cell_width / 2
+        center_y = y + self.padding + self.thumb_size / 2
+
+        if isinstance(thumbnail, Exception):
+            item = self.canvas.create_text(center_x, center_y, text="错误", fill="gray")
+            self.photos[index] = None
+        else:
+            photo = ImageTk.PhotoImage(thumbnail)
+            item = self.canvas.create_image(center_x, center_y, image=photo)
+            self.canvas.itemconfigure(placeholder, fill="", outline="")
+            self.photos[index] = photo
+        self.cells[index].append(item)
+
+    def remember(self, path, thumbnail):
+        self.thumbnails[path] = thumbnail
+        self.thumbnails.move_to_end(path)
+        while len(self.thumbnails) > MAX_CACHED_THUMBNAILS:
+            self.thumbnails.popitem(last=False)
+
+    def decode_worker(self):
+        """后台线程：依次解码请求的缩略图"""
+        while True:
+            with self.lock:
+                while not self.pending and not self.closed:
+                    self.lock.wait()
+                if self.closed:
+                    return
+                path = self.pending.popleft()
+                self.in_flight.add(path)
+
+            try:
+                result = load_thumbnail(path, self.thumb_size)
+            except Exception as e:
+                result = e
+
+            with self.lock:
+                self.in_flight.discard(path)
+                self.results.append((path, result))
+
+    def schedule_poll(self):
+        if not self.poll_scheduled:
+            self.poll_scheduled = True
+            self.after(POLL_INTERVAL, self.poll_results)
+
+    def poll_results(self):
+        """界面线程：取回后台解码结果并显示到可见单元格"""
+        self.poll_scheduled = False
+        if self.closed:
+            return
+
+        with self.lock:
+            results = list(self.results)
+            self.results.clear()
+            busy = bool(self.pending or self.in_flight)
+
+        if results:
+            for path, result in results:
+                self.remember(path, result)
+            for index in self.cells:
+                if index not in self.photos and self.paths[index] in self.thumbnails:
+                    self.show_thumbnail(index)
+
+        if busy:
+            self.schedule_poll()
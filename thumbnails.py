@@ -0,0 +1,172 @@
+"""
+缩略图生成及磁盘缓存，不依赖tkinter，可在后台线程中调用
+
+缓存按内容寻址：键由图片的绝对路径、修改时间、文件大小和缩略图尺寸计算得到，
+原图被修改后自动失效。一次解码会同时生成 THUMBNAIL_SIZES 中的所有尺寸，
+之后两个工具以任何已知尺寸打开同一张图片都不需要再解码原图。
+缓存总大小超过上限时按最近使用时间淘汰（LRU）。
+"""
+import os
+import hashlib
+import threading
+from PIL import Image
+from cachedir import user_cache_dir, evict_oldest
+from rawimage import can_map, resize_mapped
+
+# ImageTk.PhotoImage可以直接显示的模式
+DISPLAY_MODES = ('1', 'L', 'P', 'RGB', 'RGBA')
+
+# 各界面使用的缩略图尺寸：pic2pdf预览、拼图预览、网格布局
+THUMBNAIL_SIZES = (150, 100, 90)
+
+# 默认缓存上限（字节）
+DEFAULT_MAX_BYTES = 200 * 1024 * 1024
+
+# 缓存文件的扩展名，带透明通道或调色板的缩略图存为PNG，其余存为JPEG
+CACHE_EXTENSIONS = ('.jpg', '.png')
+
+
+def make_thumbnail(img, size):
+    """
+    生成不超过 size x size 的缩略图
+    对尚未解码的图片调用时，JPEG会在解码时按DCT缩放，未压缩的大BMP/TIFF按条带映射读取，
+    都不会完整解码原图
+    """
+    if can_map(img) and max(img.size) > size:
+        scale = size / max(img.size)
+        img = resize_mapped(img, (max(1, round(img.width * scale)), max(1, round(img.height * scale))))
+    img.thumbnail((size, size), Image.Resampling.LANCZOS)
+    if img.mode not in DISPLAY_MODES:
+        img = img.convert('RGB')
+    img.load()
+    return img
+
+
+class ThumbnailCache:
+    def __init__(self, directory=None, max_bytes=DEFAULT_MAX_BYTES, sizes=THUMBNAIL_SIZES):
+        self.directory = directory or user_cache_dir("thumbnails")
+        self.max_bytes = max_bytes
+        self.sizes = tuple(sorted(sizes, reverse=True))
+        self.lock = threading.Lock()
+        # 上次检查后新写入的字节数，累积到上限的1/10时检查一次总大小
+        self.written_bytes = 0
+
+    def key(self, path, stat, size):
+        """由路径、修改时间、文件大小和缩略图尺寸计算缓存键"""
+        text = f"{os.path.abspath(path)}|{stat.st_mtime_ns}|{stat.st_size}|{size}"
+        return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+    def entry_path(self, key, ext):
+        # 按键的前两位分子目录，避免单个目录文件过多
+        return os.path.join(self.directory, key[:2], key + ext)
+
+    def get(self, path, size):
+        """返回缩略图，优先读取缓存，未命中时解码原图并写入所有尺寸"""
+        stat = os.stat(path)
+        cached = self.load(self.key(path, stat, size))
+        if cached is not None:
+            return cached
+
+        # 一次解码生成所有尺寸，从大到小依次缩小
+        sizes = sorted(set(self.sizes) | {size}, reverse=True)
+        result = None
+        with Image.open(path) as img:
+            thumbnail = make_thumbnail(img, sizes[0])
+        for thumb_size in sizes:
+            if thumb_size != sizes[0]:
+                thumbnail = make_thumbnail(thumbnail.copy(), thumb_size)
+            self.store(self.key(path, stat, thumb_size), thumbnail)
+            if thumb_size == size:
+                result = thumbnail
+        return result
+
+    def load(self, key):
+        """读取缓存项，命中时更新访问时间"""
+        for ext in CACHE_EXTENSIONS:
+            entry = self.entry_path(key, ext)
+            try:
+                with Image.open(entry) as img:
+                    img.load()
+                os.utime(entry)
+                return img
+            except FileNotFoundError:
+                continue
+            except Exception:
+                # 损坏的缓存文件直接删除
+                self.remove(entry)
+        return None
+
+    def store(self, key, thumbnail):
+        """写入缓存项，先写临时文件再替换，多个进程同时写入也不会读到半个文件"""
+        if thumbnail.mode in ('RGB', 'L'):
+            ext, fmt = '.jpg', 'JPEG'
+        else:
+            ext, fmt = '.png', 'PNG'
+        entry = self.entry_path(key, ext)
+        temp = f"{entry}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(entry), exist_ok=True)
+            thumbnail.save(temp, format=fmt, quality=90)
+            os.replace(temp, entry)
+            size = os.path.getsize(entry)
+        except OSError:
+            # 缓存只是加速手段，写入失败（只读目录、磁盘满等）时忽略
+            self.remove(temp)
+            return
+
+        with self.lock:
+            self.written_bytes += size
+            if self.written_bytes < self.max_bytes // 10:
+                return
+            self.written_bytes = 0
+        self.evict()
+
+    def remove(self, entry):
+        try:
+            os.remove(entry)
+        except OSError:
+            pass
+
+    def evict(self):
+        """总大小超过上限时，按访问时间从旧到新删除，直到降到上限的90%"""
+        entries = []
+        for subdir in os.scandir(self.directory):
+            if not subdir.is_dir():
+                continue
+            for entry in os.scandir(subdir.path):
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        evict_oldest(entries, self.max_bytes)
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def default_cache():
+    """两个工具共用的缓存实例"""
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = ThumbnailCache()
+        return _default_cache
+
+
+def load_thumbnail(path, size, use_cache=True):
+    """
+    读取不超过 size x size 的缩略图
+    :param use_cache: 是否使用磁盘缓存，缓存不可用时自动退回直接解码
+    """
+    if use_cache:
+        try:
+            cache = default_cache()
+        except OSError:
+            cache = None
+        if cache is not None:
+            return cache.get(path, size)
+
+    with Image.open(path) as img:
+        return make_thumbnail(img, size)
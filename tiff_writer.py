@@ -0,0 +1,303 @@
+"""
+分块（tiled）TIFF写入器
+
+图片按从上到下的条带逐条写入，凑满一行块后切成 tile_size x tile_size 的块，
+每个块在线程池中独立压缩（deflate + 水平差分预测），按顺序写入文件，
+块的偏移和长度记录在内存中，最后在文件末尾写入IFD。
+可以同时写入金字塔：每写完一行块就把它缩小一半交给下一层，各层的块交错存放在文件中，
+每层一个IFD，依次链接，查看器打开大图时可以直接读取合适的缩小层。
+内存中只保留一行块和正在压缩的几个块，输出图片的大小不受内存限制；
+未压缩数据超过4 GB时自动使用BigTIFF格式。
+写入过程中输出到临时文件，完成后才替换为目标文件。
+"""
+import os
+import zlib
+import struct
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image, ImageChops
+
+# 支持的模式 -> (Photometric, 每像素通道数, ExtraSamples)
+TIFF_MODES = {'L': (1, 1, None), 'RGB': (2, 3, None), 'RGBA': (2, 4, 2)}
+
+# 压缩方式 -> TIFF的Compression值，名称与Pillow相同
+TIFF_COMPRESSIONS = {'raw': 1, 'tiff_adobe_deflate': 8}
+
+DEFAULT_TILE_SIZE = 512
+
+# 经典TIFF的偏移为32位，未压缩数据超过该大小时使用BigTIFF
+CLASSIC_LIMIT = 4 * 1024 * 1024 * 1024 - 64 * 1024 * 1024
+
+# TIFF标签
+NEW_SUBFILE_TYPE = 254
+IMAGE_WIDTH = 256
+IMAGE_LENGTH = 257
+BITS_PER_SAMPLE = 258
+COMPRESSION = 259
+PHOTOMETRIC = 262
+SAMPLES_PER_PIXEL = 277
+PLANAR_CONFIGURATION = 284
+PREDICTOR = 317
+TILE_WIDTH = 322
+TILE_LENGTH = 323
+TILE_OFFSETS = 324
+TILE_BYTE_COUNTS = 325
+EXTRA_SAMPLES = 338
+
+# 字段类型 -> (类型值, 字节数, struct格式)
+SHORT = (3, 2, 'H')
+LONG = (4, 4, 'I')
+LONG8 = (16, 8, 'Q')
+
+
+def encode_tile(tile, compression, level):
+    """压缩一个块，deflate时先做水平差分（Predictor=2），每行第一个像素保持原值"""
+    if compression == 'raw':
+        return tile.tobytes()
+    width, height = tile.size
+    diff = ImageChops.subtract_modulo(tile, tile.crop((-1, 0, width - 1, height)))
+    return zlib.compress(diff.tobytes(), level)
+
+
+class _Level:
+    """金字塔的一层：尺寸、尚未凑满一行块的条带，以及已写入的块的偏移和长度"""
+
+    __slots__ = ('size', 'buffer', 'offsets', 'byte_counts')
+
+    def __init__(self, size):
+        self.size = size
+        self.buffer = None
+        self.offsets = []
+        self.byte_counts = []
+
+
+class TiledTIFFWriter:
+    def __init__(self, path, size, mode='RGB', compression='tiff_adobe_deflate', compress_level=6,
+                 tile_size=DEFAULT_TILE_SIZE, pyramid=False, workers=1):
+        """
+        :param size: 图片尺寸 (width, height)，写入的条带行数之和必须等于height
+        :param mode: 'L'、'RGB' 或 'RGBA'
+        :param compression: 'raw' 或 'tiff_adobe_deflate'
+        :param compress_level: zlib压缩级别 0-9
+        :param tile_size: 块的边长，必须是16的倍数
+        :param pyramid: 是否同时写入逐级缩小一半的金字塔层（直到不超过一个块），作为后续的IFD
+        :param workers: 并行压缩的线程数，0表示使用全部CPU核心
+        """
+        if mode not in TIFF_MODES:
+            raise ValueError(f"不支持的TIFF模式: {mode}")
+        if compression not in TIFF_COMPRESSIONS:
+            raise ValueError(f"不支持的TIFF压缩方式: {compression}")
+        if tile_size <= 0 or tile_size % 16:
+            raise ValueError("块的边长必须是16的倍数")
+
+        self.path = path
+        self.size = size
+        self.mode = mode
+        self.compression = compression
+        self.compress_level = compress_level
+        self.tile_size = tile_size
+        self.band_height = tile_size  # 按块的高度写入条带最省内存
+        self.temp_path = path + '.part'
+        self.rows_written = 0
+
+        self.levels = [_Level(size)]
+        while pyramid and max(self.levels[-1].size) > tile_size:
+            width, height = self.levels[-1].size
+            self.levels.append(_Level(((width + 1) // 2, (height + 1) // 2)))
+
+        # 金字塔各层合计约为原图的4/3
+        samples = TIFF_MODES[mode][1]
+        data_bytes = sum(width * height for width, height in (level.size for level in self.levels)) * samples
+        self.bigtiff = data_bytes >= CLASSIC_LIMIT
+
+        workers = workers or os.cpu_count() or 1
+        self._pool = ThreadPoolExecutor(max_workers=workers) if workers > 1 else None
+        self._max_pending = workers * 2
+        self._pending = deque()
+        self._fh = open(self.temp_path, 'wb')
+
+        # 文件头，IFD的偏移在关闭时回填
+        if self.bigtiff:
+            self._fh.write(b'II+\x00' + struct.pack('<HHQ', 8, 0, 0))
+        else:
+            self._fh.write(b'II*\x00' + struct.pack('<I', 0))
+        self.bytes_written = self._fh.tell()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    def write_band(self, band):
+        """写入下一个条带（宽度与图片相同，高度任意），条带必须按从上到下的顺序写入"""
+        if band.size[0] != self.size[0]:
+            raise ValueError("条带宽度与图片宽度不一致")
+        if self.rows_written + band.size[1] > self.size[1]:
+            raise ValueError("写入的行数超过了图片高度")
+        if band.mode != self.mode:
+            band = band.convert(self.mode)
+        self.rows_written += band.size[1]
+        self._add_rows(0, band)
+
+    def write_image(self, img):
+        """把整张图片按行块写入"""
+        for top in range(0, img.height, self.tile_size):
+            self.write_band(img.crop((0, top, img.width, min(img.height, top + self.tile_size))))
+
+    def _add_rows(self, index, band):
+        """把条带加入第 index 层，凑满一行块就写出，并把缩小一半的行块交给下一层"""
+        level = self.levels[index]
+        if level.buffer is not None:
+            merged = Image.new(self.mode, (level.size[0], level.buffer.height + band.height))
+            merged.paste(level.buffer, (0, 0))
+            merged.paste(band, (0, level.buffer.height))
+            band = merged
+        while band.height >= self.tile_size:
+            self._write_tile_row(index, band.crop((0, 0, band.width, self.tile_size)))
+            band = band.crop((0, self.tile_size, band.width, band.height))
+        level.buffer = band if band.height else None
+
+    def _write_tile_row(self, index, band):
+        """把一行块切开压缩，最后一行和最右一列的块以0补齐"""
+        if index + 1 < len(self.levels):
+            # 行块的高度是偶数，逐行块缩小与整张图片缩小一半的结果相同
+            self._add_rows(index + 1, band.reduce(2))
+        for left in range(0, band.width, self.tile_size):
+            tile = band.crop((left, 0, left + self.tile_size, self.tile_size))
+            if self._pool is None:
+                self._write_tile(index, encode_tile(tile, self.compression, self.compress_level))
+                continue
+            self._pending.append((index, self._pool.submit(encode_tile, tile, self.compression,
+                                                           self.compress_level)))
+            # 在途的块数有上限，内存占用与图片大小无关
+            while len(self._pending) > self._max_pending:
+                self._write_pending()
+
+    def _write_pending(self):
+        index, future = self._pending.popleft()
+        self._write_tile(index, future.result())
+
+    def _write_tile(self, index, data):
+        level = self.levels[index]
+        level.offsets.append(self._fh.tell())
+        level.byte_counts.append(len(data))
+        self._fh.write(data)
+        self.bytes_written += len(data)
+
+    def _ifd_entries(self, index):
+        """第 index 层的IFD项 [(标签, 字段类型, 值列表), ...]，按标签排序"""
+        level = self.levels[index]
+        photometric, samples, extra = TIFF_MODES[self.mode]
+        offset_type = LONG8 if self.bigtiff else LONG
+        entries = []
+        if index:
+            entries.append((NEW_SUBFILE_TYPE, LONG, [1]))  # 缩小的图层
+        entries += [
+            (IMAGE_WIDTH, LONG, [level.size[0]]),
+            (IMAGE_LENGTH, LONG, [level.size[1]]),
+            (BITS_PER_SAMPLE, SHORT, [8] * samples),
+            (COMPRESSION, SHORT, [TIFF_COMPRESSIONS[self.compression]]),
+            (PHOTOMETRIC, SHORT, [photometric]),
+            (SAMPLES_PER_PIXEL, SHORT, [samples]),
+            (PLANAR_CONFIGURATION, SHORT, [1]),
+        ]
+        if self.compression != 'raw':
+            entries.append((PREDICTOR, SHORT, [2]))
+        entries += [
+            (TILE_WIDTH, LONG, [self.tile_size]),
+            (TILE_LENGTH, LONG, [self.tile_size]),
+            (TILE_OFFSETS, offset_type, level.offsets),
+            (TILE_BYTE_COUNTS, offset_type, level.byte_counts),
+        ]
+        if extra is not None:
+            entries.append((EXTRA_SAMPLES, SHORT, [extra]))
+        return entries
+
+    def _write_ifd(self, entries, next_ifd):
+        """在文件末尾写入一个IFD，返回其偏移"""
+        offset_format = '<Q' if self.bigtiff else '<I'
+        # 放不进IFD项的数组写在IFD前面
+        inline = 8 if self.bigtiff else 4
+        values = {}
+        for tag, (_, width, fmt), data in entries:
+            if len(data) * width > inline:
+                if self._fh.tell() % 2:
+                    self._fh.write(b'\x00')
+                values[tag] = self._fh.tell()
+                self._fh.write(struct.pack(f'<{len(data)}{fmt}', *data))
+        if self._fh.tell() % 2:
+            self._fh.write(b'\x00')
+
+        ifd_offset = self._fh.tell()
+        out = [struct.pack('<Q' if self.bigtiff else '<H', len(entries))]
+        for tag, (type_id, width, fmt), data in entries:
+            if tag in values:
+                value = struct.pack(offset_format, values[tag])
+            else:
+                value = struct.pack(f'<{len(data)}{fmt}', *data).ljust(inline, b'\x00')
+            out.append(struct.pack('<HH', tag, type_id) + struct.pack(offset_format, len(data)) + value)
+        out.append(struct.pack(offset_format, next_ifd))
+        self._fh.write(b''.join(out))
+        return ifd_offset
+
+    def _finish(self):
+        """写入各层剩余的块和IFD，并回填文件头中第一个IFD的偏移"""
+        for index, level in enumerate(self.levels):
+            if level.buffer is not None:
+                # 最后一行块不满，以0补齐
+                buffer, level.buffer = level.buffer, None
+                self._write_tile_row(index, buffer)
+        while self._pending:
+            self._write_pending()
+        if not self.bigtiff and self._fh.tell() >= CLASSIC_LIMIT:
+            raise ValueError("文件超过了经典TIFF的4 GB上限")
+
+        # 从最小的一层倒着写，每个IFD都能直接写入下一个IFD的偏移
+        next_ifd = 0
+        for index in reversed(range(len(self.levels))):
+            next_ifd = self._write_ifd(self._ifd_entries(index), next_ifd)
+        self._fh.seek(8 if self.bigtiff else 4)
+        self._fh.write(struct.pack('<Q' if self.bigtiff else '<I', next_ifd))
+        self._fh.seek(0, os.SEEK_END)
+        self.bytes_written = self._fh.tell()
+
+    def close(self):
+        """写入剩余的块和IFD，并将临时文件替换为目标文件"""
+        try:
+            if self.rows_written != self.size[1]:
+                raise ValueError(f"写入了 {self.rows_written} 行，图片高度为 {self.size[1]}")
+            self._finish()
+        except Exception:
+            self.abort()
+            raise
+
+        self._shutdown()
+        self._fh.close()
+        os.replace(self.temp_path, self.path)
+
+    def abort(self):
+        """放弃写入，删除临时文件"""
+        for _, future in self._pending:
+            future.cancel()
+        self._pending.clear()
+        self._shutdown()
+        self._fh.close()
+        if os.path.exists(self.temp_path):
+            os.remove(self.temp_path)
+
+    def _shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=True)
+            self._pool = None
+
+
+def save_tiff(img, path, compression='tiff_adobe_deflate', compress_level=6, tile_size=DEFAULT_TILE_SIZE,
+              pyramid=False, workers=1):
+    """用分块并行压缩保存整张图片"""
+    with TiledTIFFWriter(path, img.size, img.mode, compression, compress_level, tile_size, pyramid,
+                         workers) as writer:
+        writer.write_image(img)
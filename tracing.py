@@ -0,0 +1,264 @@
+"""
+流水线各阶段的计时和统计
+
+在拼图和图片转PDF的流水线中传入 Tracer，记录每张图片每个阶段（解码、缩放、编码、写入等）的
+耗时、读写字节数和像素数，以及出错的图片。结果可以输出为按阶段汇总的文本，
+或Chrome trace格式的JSON（在 chrome://tracing 或 https://ui.perfetto.dev 中打开）。
+
+默认使用 NULL_TRACER，不记录任何内容，开销可以忽略。
+子进程中的记录通过 Tracer.events 随结果返回，在主进程中用 Tracer.merge 合并。
+
+图形界面中设置环境变量 PIC_TOOLS_TRACE=输出文件 即可在每次生成后写出Chrome trace。
+"""
+import os
+import json
+import time
+import threading
+from collections import namedtuple
+
+# 设置该环境变量时图形界面启用记录，值为Chrome trace的输出文件
+TRACE_ENV = "PIC_TOOLS_TRACE"
+
+# 汇总和Chrome trace中使用的计数字段
+COUNTERS = ('bytes_read', 'bytes_written', 'pixels')
+
+# name: 阶段名，出错记录为 'error'
+# image: 图片路径，与单张图片无关的阶段为None
+# start: 开始时间（time.perf_counter，单位秒，同一台机器上的进程之间可比较）
+# duration: 耗时（秒）
+# pid/tid: 所在进程和线程
+# args: 计数（bytes_read、bytes_written、pixels）或出错信息
+TraceEvent = namedtuple('TraceEvent', ['name', 'image', 'start', 'duration', 'pid', 'tid', 'args'])
+
+
+def image_path(img):
+    """图片的文件路径，不是从文件打开的图片返回None"""
+    return getattr(img, 'filename', None) or None
+
+
+def file_bytes(img):
+    """已打开图片的文件大小，不是从文件打开的图片返回0"""
+    path = image_path(img)
+    try:
+        return os.path.getsize(path) if path else 0
+    except OSError:
+        return 0
+
+
+def trace_decode(tracer, img):
+    """
+    解码图片并记录为 decode 阶段
+    未启用记录时不做任何事，之后的resize或copy会自行解码，只有计时需要单独解码；
+    不是从文件打开的图片已在内存中，同样不记录
+    """
+    if not tracer.enabled or image_path(img) is None:
+        return
+    with tracer.stage('decode', image_path(img)) as span:
+        img.load()
+        span.add(bytes_read=file_bytes(img), pixels=img.width * img.height)
+
+
+class Span:
+    """一个正在计时的阶段，用 add 累加计数"""
+
+    __slots__ = ('args',)
+
+    def __init__(self, args):
+        self.args = args
+
+    def add(self, **counts):
+        for key, value in counts.items():
+            self.args[key] = self.args.get(key, 0) + value
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def add(self, **counts):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class NullTracer:
+    """不记录任何内容的Tracer，作为默认值"""
+
+    enabled = False
+    events = ()
+
+    def stage(self, name, image=None, **counts):
+        return _NULL_SPAN
+
+    def error(self, image, error):
+        pass
+
+    def merge(self, events):
+        pass
+
+
+NULL_TRACER = NullTracer()
+
+
+class _Stage:
+    """Tracer.stage 返回的上下文管理器"""
+
+    __slots__ = ('tracer', 'name', 'image', 'span', 'start')
+
+    def __init__(self, tracer, name, image, counts):
+        self.tracer = tracer
+        self.name = name
+        self.image = image
+        self.span = Span(counts)
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self.span
+
+    def __exit__(self, exc_type, exc, tb):
+        duration = time.perf_counter() - self.start
+        args = self.span.args
+        if exc_type is not None:
+            args['failed'] = True
+        self.tracer.record(TraceEvent(self.name, self.image, self.start, duration,
+                                      os.getpid(), threading.get_ident(), args))
+        return False
+
+
+class Tracer:
+    """
+    记录各阶段的耗时和计数，可在多个线程中同时使用
+
+    用法:
+        with tracer.stage('decode', img_path) as span:
+            img.load()
+            span.add(pixels=img.width * img.height)
+    """
+
+    enabled = True
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.events = []
+
+    def stage(self, name, image=None, **counts):
+        """
+        对一个阶段计时，counts为初始计数，阶段内可用 span.add 继续累加
+        阶段内抛出的异常照常传播，记录中标记 failed
+        """
+        return _Stage(self, name, image, dict(counts))
+
+    def error(self, image, error):
+        """记录一张图片的出错信息"""
+        self.record(TraceEvent('error', image, time.perf_counter(), 0, os.getpid(), threading.get_ident(),
+                               {'error': f"{type(error).__name__}: {error}"}))
+
+    def record(self, event):
+        with self.lock:
+            self.events.append(event)
+
+    def merge(self, events):
+        """合并其他Tracer（通常来自子进程）的记录"""
+        with self.lock:
+            self.events.extend(TraceEvent(*event) for event in events)
+
+    def clear(self):
+        with self.lock:
+            self.events = []
+
+    @property
+    def errors(self):
+        """出错记录 [(图片路径, 出错信息), ...]"""
+        return [(event.image, event.args['error']) for event in self.events if event.name == 'error']
+
+    def summary(self):
+        """
+        按阶段汇总
+        :return: {阶段名: {'count', 'seconds', 'bytes_read', 'bytes_written', 'pixels'}}，按首次出现的顺序
+        """
+        stages = {}
+        for event in self.events:
+            if event.name == 'error':
+                continue
+            item = stages.setdefault(event.name, dict(count=0, seconds=0.0, bytes_read=0, bytes_written=0, pixels=0))
+            item['count'] += 1
+            item['seconds'] += event.duration
+            for key in COUNTERS:
+                item[key] += event.args.get(key, 0)
+        return stages
+
+    def image_seconds(self):
+        """每张图片各阶段耗时之和 {图片路径: 秒}"""
+        totals = {}
+        for event in self.events:
+            if event.image is not None:
+                totals[event.image] = totals.get(event.image, 0) + event.duration
+        return totals
+
+    def format_summary(self, slowest=5):
+        """多行文本的汇总，包括最慢的几张图片和出错的图片"""
+        lines = [f"{'阶段':<12}{'次数':>8}{'总耗时(s)':>12}{'平均(ms)':>10}{'读取(MB)':>10}{'写入(MB)':>10}{'MP/s':>9}"]
+        for name, item in self.summary().items():
+            seconds = item['seconds']
+            mean = seconds / item['count'] * 1000
+            mp_per_sec = item['pixels'] / 1e6 / seconds if seconds and item['pixels'] else 0
+            lines.append(f"{name:<12}{item['count']:>8}{seconds:>12.3f}{mean:>10.1f}"
+                         f"{item['bytes_read'] / 1024 / 1024:>10.1f}{item['bytes_written'] / 1024 / 1024:>10.1f}"
+                         f"{mp_per_sec:>9.1f}")
+
+        images = sorted(self.image_seconds().items(), key=lambda item: item[1], reverse=True)[:slowest]
+        if images:
+            lines.append("最慢的图片:")
+            lines.extend(f"  {seconds:8.3f} s  {image}" for image, seconds in images)
+
+        errors = self.errors
+        if errors:
+            lines.append(f"出错 {len(errors)} 张:")
+            lines.extend(f"  {image}: {message}" for image, message in errors)
+        return "\n".join(lines)
+
+    def chrome_trace(self):
+        """Chrome trace格式（Trace Event Format）的字典"""
+        origin = min((event.start for event in self.events), default=0)
+        trace_events = []
+        for event in self.events:
+            args = dict(event.args)
+            if event.image is not None:
+                args['image'] = event.image
+            item = {
+                'name': event.name,
+                'cat': 'error' if event.name == 'error' else 'stage',
+                'ts': (event.start - origin) * 1e6,
+                'pid': event.pid,
+                'tid': event.tid,
+                'args': args,
+            }
+            if event.name == 'error':
+                item.update(ph='i', s='t')
+            else:
+                item.update(ph='X', dur=event.duration * 1e6)
+            trace_events.append(item)
+        return {'traceEvents': trace_events, 'displayTimeUnit': 'ms'}
+
+    def write_chrome_trace(self, path):
+        """写出Chrome trace格式的JSON文件"""
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.chrome_trace(), f, ensure_ascii=False)
+
+
+def tracer_from_env():
+    """设置了 PIC_TOOLS_TRACE 时返回新的 Tracer，否则返回 NULL_TRACER"""
+    return Tracer() if os.environ.get(TRACE_ENV) else NULL_TRACER
+
+
+def save_env_trace(tracer):
+    """把记录写到 PIC_TOOLS_TRACE 指定的文件，未启用时不做任何事"""
+    path = os.environ.get(TRACE_ENV)
+    if tracer.enabled and path:
+        tracer.write_chrome_trace(path)